@@ -1,17 +1,131 @@
-from flask_admin import Admin, BaseView
+import csv
+import io
+import time
+from flask import Response, request, stream_with_context
+from flask_admin import Admin, BaseView, expose
 from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import func, or_, select, text
+from replicas import replica_reads
 from views import Users
+from models import normalize
+
+EXPORT_COLUMNS = ('id', 'user_id', 'username', 'email', 'email_confirmed', 'date')
+
+
+def prefix_search(search: str):
+    """Case-insensitive prefix match on the indexed normalized columns, or an exact user_id"""
+    term = normalize(search)
+    pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return or_(Users.email_normalized.like(pattern, escape='\\'),
+               Users.username_normalized.like(pattern, escape='\\'),
+               Users.user_id == search.strip())
 
 
 class UserView(ModelView):
-    """hide password"""
+    """
+    hide password. Pages are fetched by keyset on id (?after= / ?before=) instead of
+    OFFSET, without a COUNT(*) per page, and search is a prefix match on indexed columns.
+    """
+    list_template = 'admin/users_list.html'
     column_formatters = {
         'password': lambda v, c, m, p: '*' * 8  # m is the model instance
     }
+    column_exclude_list = ('username_normalized', 'email_normalized')
+    # only the id order can be paginated by keyset
+    column_default_sort = 'id'
+    column_sortable_list = ()
+    column_searchable_list = ('email_normalized', 'username_normalized')
+    simple_list_pager = True
+    can_set_page_size = False
+    page_size = 50
+    # seconds the approximate total is cached
+    total_ttl = 60
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._total = None
+
+    def _get_list_extra_args(self):
+        view_args = super()._get_list_extra_args()
+        # cursors are not carried over into search, sort or filter links
+        view_args.extra_args.pop('after', None)
+        view_args.extra_args.pop('before', None)
+        return view_args
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        query = query.filter(prefix_search(search))
+        if count_query is not None:
+            count_query = count_query.filter(prefix_search(search))
+        return query, count_query, joins, count_joins
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        after = request.args.get('after', type=int)
+        before = request.args.get('before', type=int)
+        if after is None and before is None:
+            return super().get_list(0, None, False, search, filters, execute=execute, page_size=page_size)
+
+        query = self.get_query()
+        if search:
+            query = query.filter(prefix_search(search))
+        if filters and self._filters:
+            query, _, _, _ = self._apply_filters(query, None, {}, {}, filters)
+        page_size = page_size or self.page_size
+        if before is not None:
+            rows = query.filter(Users.id < before).order_by(Users.id.desc()).limit(page_size).all()
+            return None, rows[::-1]
+        return None, query.filter(Users.id > after).order_by(Users.id).limit(page_size).all()
+
+    def approximate_total(self) -> int:
+        """Row estimate from MySQL's table statistics, an exact count elsewhere, cached for total_ttl"""
+        if self._total is not None and time.monotonic() - self._total[1] < self.total_ttl:
+            return self._total[0]
+        engine = self.session.get_bind()
+        with engine.connect() as connection:
+            if engine.dialect.name in ('mysql', 'mariadb'):
+                total = connection.execute(text(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table"), {'table': Users.__tablename__}).scalar()
+            else:
+                total = connection.execute(select(func.count()).select_from(Users.__table__)).scalar()
+        self._total = (int(total or 0), time.monotonic())
+        return self._total[0]
+
+    @expose('/')
+    @replica_reads
+    def index_view(self):
+        return super().index_view()
+
+    @expose('/export.csv')
+    @replica_reads
+    def export_csv(self):
+        """All (or the searched) users as CSV, read in keyset batches while the response streams"""
+        search = request.args.get('search')
+        batch_size = 1000
+
+        def rows():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            cursor = 0
+            while True:
+                query = select(*(getattr(Users, name) for name in EXPORT_COLUMNS)).where(Users.id > cursor)
+                if search:
+                    query = query.where(prefix_search(search))
+                batch = self.session.execute(query.order_by(Users.id).limit(batch_size)).all()
+                writer.writerows(batch)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                if len(batch) < batch_size:
+                    return
+                cursor = batch[-1].id
+
+        return Response(stream_with_context(rows()), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=users.csv'})
 
 
 def init_admin(application, session):
     """Func to initialize admin"""
     admin = Admin(application, name='Web3m', url='/web3m-admin', template_mode='bootstrap4')
     # Add views
-    admin.add_view(UserView(Users, session))
\ No newline at end of file
+    admin.add_view(UserView(Users, session))
@@ -1,49 +1,174 @@
+import threading
 from flask import Flask
 from flask_restful import Api
 from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from sqlalchemy.exc import OperationalError
 
 from admin import init_admin
-from models import db
-from controls import secret_manager_keys
-from sqlalchemy import text
+from models import db, engine_options
+from clients import aws_clients
+from config import settings
 from controllers import initialize_routes
+from outbox import init_outbox
+from hashing import init_hashing
+from tokens import init_tokens
+from denylist import init_denylist
+from cache import init_cache
+from keys import init_keys
+from metrics import init_metrics
+from profiling import init_profiling
+from health import check_database, init_health
+from maintenance import init_maintenance
+from replicas import init_replicas
+from throttle import init_throttle
+from resend import init_resend
+from serializers import init_json_representation
+from static_responses import init_static_responses
+from commands import db_cli, keys_cli, outbox_cli, users_cli
 
-# set up flask server
-application = Flask(__name__)
-api = Api(application)
-jwt = JWTManager(application)
-# set up keys from aws secret manager
-application.config['SECRET_KEY'] = secret_manager_keys.get('secret_key')
-application.config["JWT_SECRET_KEY"] = secret_manager_keys.get('jwt_key')
+# app config keys read from the configuration provider (env, settings.json, Secrets Manager)
+PROVIDED_SETTINGS = {
+    'SECRET_KEY': 'secret_key',
+    'JWT_SECRET_KEY': 'jwt_key',
+    # asymmetric signing keys, HS256 with JWT_SECRET_KEY is used while unset
+    'JWT_SIGNING_KEYS': 'jwt_signing_keys',
+    'JWT_ACTIVE_KID': 'jwt_active_kid',
+    # token for admin-only api endpoints, they are disabled while unset
+    'ADMIN_API_TOKEN': 'admin_api_token',
+    'SQLALCHEMY_DATABASE_URI': 'my_sql_connection',
+    # read replicas for the read-only auth endpoints, comma separated
+    'SQLALCHEMY_REPLICAS': 'my_sql_replicas',
+}
 
-# Database configuration
-application.config['SQLALCHEMY_DATABASE_URI'] = secret_manager_keys.get('my_sql_connection')
-application.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# initialize db
-db.init_app(application)
+def create_app(config: dict = None) -> Flask:
+    """
+    Func to build the flask app.
+    :param config: app config values, keys set here are not looked up in the configuration provider
+    """
+    application = Flask(__name__)
+    # FLASK_* environment variables, e.g. FLASK_PASSWORD_HASH_WORKERS=4
+    application.config.from_prefixed_env()
+    # let flask_jwt_extended answer invalid tokens instead of flask_restful turning them into 500s
+    application.config['PROPAGATE_EXCEPTIONS'] = True
+    application.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    config = config or {}
+    application.config.update(config)
+    for name, key in PROVIDED_SETTINGS.items():
+        if name not in config and application.config.get(name) is None:
+            application.config[name] = settings.get(key)
 
-# initialize admin page
-init_admin(application, db.session)
+    # behind a load balancer, client addresses (used by the login throttle) come from X-Forwarded-For
+    trusted_proxies = int(application.config.get('TRUSTED_PROXIES', 0))
+    if trusted_proxies:
+        application.wsgi_app = ProxyFix(application.wsgi_app, x_for=trusted_proxies)
 
-def check_sql_connection():
+    # connection pool options for every AWS client
+    aws_clients.configure(max_pool_connections=int(settings.local('aws_max_pool_connections', 10)),
+                          tcp_keepalive=bool(settings.local('aws_tcp_keepalive', True)))
+
+    api = Api(application)
+    # orjson response encoding unless JSON_REPRESENTATION is 'json'
+    init_json_representation(api)
+    jwt = JWTManager(application)
+
+    # connection pool sizing, recycling and pre-ping from the DB_* settings
+    application.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(application.config)
+
+    # timed connection pool and SQL statement metrics, before the engines are created
+    init_metrics(application)
+
+    # sampled request profiles and slow request span logging
+    init_profiling(application)
+
+    # initialize db
+    db.init_app(application)
+
+    # read replica engines, same pool options as the primary
+    init_replicas(application)
+
+    # initialize user record cache
+    init_cache(application)
+
+    # initialize jwt signing keys
+    init_keys(application, jwt)
+
+    # reject tokens issued before a user was updated or deleted
+    init_tokens(application, jwt)
+
+    # logged out tokens, shared through the revoked_tokens table
+    init_denylist(application)
+
+    # initialize password hashing pool
+    init_hashing(application)
+
+    # per address and per account sign in throttling
+    init_throttle(application)
+
+    # resend confirmation cooldown and token reuse
+    init_resend(application)
+
+    # documentation, JWKS and liveness bodies encoded once and served from memory
+    init_static_responses(application)
+
+    # initialize admin page
+    init_admin(application, db.session)
+
+    # initialize email outbox dispatcher and cli commands
+    init_outbox(application)
+
+    # optional in-process purge of never confirmed accounts
+    init_maintenance(application)
+
+    # cached readiness checks behind /readyz
+    init_health(application)
+    application.cli.add_command(db_cli)
+    application.cli.add_command(keys_cli)
+    application.cli.add_command(outbox_cli)
+    application.cli.add_command(users_cli)
+
+    # routes initialize
+    initialize_routes(api)
+    return application
+
+
+_application = None
+_application_lock = threading.Lock()
+
+
+def get_application() -> Flask:
+    """Func to get the process-wide app, built on first use"""
+    global _application
+    if _application is None:
+        with _application_lock:
+            if _application is None:
+                _application = create_app()
+    return _application
+
+
+def __getattr__(name):
+    # `from application import application` (flask run, gunicorn) builds the app on first access,
+    # mod_wsgi reads the module dict instead and loads wsgi.py
+    if name == 'application':
+        return get_application()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def check_sql_connection(application: Flask = None):
     """Func to check MySQL database connection"""
+    application = application or get_application()
     try:
         with application.app_context():
-            db.session.execute(text('SELECT 1'))
+            check_database()
         print("Database connection successful.")
 
     except OperationalError as e:
         print(f"Database connection failed: {e}")
 
-# routes initialize
-initialize_routes(api)
-
-
 if __name__ == '__main__':
+    application = get_application()
     # check sql connection
-    with application.app_context():
-        check_sql_connection()
+    check_sql_connection(application)
     # application run
     application.run(debug=False, port=5000)
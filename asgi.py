@@ -0,0 +1,52 @@
+"""
+Async (ASGI) serving mode. The event loop of a uvicorn worker accepts connections,
+reads requests and writes responses, and the flask app answers each request on a
+pool of ASGI_THREADS threads. An idle keep-alive connection holds no thread, one
+is only taken from the pool while a request runs. Every route goes through
+the same views, hooks and services (user cache, replicas, throttle, denylist,
+outbox, metrics) as under the WSGI workers.
+
+    python serve.py --asgi --workers 2 --threads 32
+    uvicorn asgi:application --port 5000 --no-proxy-headers
+"""
+import threading
+
+from a2wsgi import WSGIMiddleware
+from uvicorn_worker import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    """gunicorn worker of serve.py --asgi, forwarded headers are left to the app's ProxyFix (TRUSTED_PROXIES)"""
+
+    CONFIG_KWARGS = dict(BaseUvicornWorker.CONFIG_KWARGS, proxy_headers=False)
+
+
+def create_asgi_app(flask_app=None) -> WSGIMiddleware:
+    """Func to serve a flask app, the process-wide one by default, to ASGI servers"""
+    if flask_app is None:
+        from application import get_application
+
+        flask_app = get_application()
+    # the pool's threads are started on first use, so a preloaded app forks without them
+    return WSGIMiddleware(flask_app, workers=int(flask_app.config.get('ASGI_THREADS', 32)))
+
+
+_application = None
+_application_lock = threading.Lock()
+
+
+def get_asgi_application() -> WSGIMiddleware:
+    """Func to get the process-wide ASGI app, built on first use"""
+    global _application
+    if _application is None:
+        with _application_lock:
+            if _application is None:
+                _application = create_asgi_app()
+    return _application
+
+
+def __getattr__(name):
+    # `uvicorn asgi:application` builds the app on first access
+    if name == 'application':
+        return get_asgi_application()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
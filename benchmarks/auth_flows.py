@@ -0,0 +1,242 @@
+"""
+Load test of the auth flows: register -> confirm, sign in, protected read and
+token refresh in a weighted mix at a given concurrency. Runs against an
+in-process app on a temporary SQLite file with the in-memory mail transport,
+against another database (--database-url, tables are dropped), or against a
+running server (--url, needs its SECRET_KEY to confirm the synthetic users).
+
+    python -m benchmarks.auth_flows --users 1000 --requests 4000 --concurrency 8 --output results/auth.json
+    python -m benchmarks.auth_flows --mix signin=1,protected=20,refresh=2 --hash-method scrypt
+    python -m benchmarks.auth_flows --url http://127.0.0.1:8000 --secret-key ... --users 50
+
+Compare two stored runs with `python -m benchmarks.compare old.json new.json`.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import event
+
+from benchmarks.common import report, summarize
+
+PASSWORD = 'aSecurePassword'
+FLOWS = ('register', 'signin', 'protected', 'refresh')
+
+
+class InProcessClient:
+    """Flask test client that also counts the SQL statements each request runs"""
+
+    def __init__(self, app, queries: threading.local):
+        self.client = app.test_client()
+        self.queries = queries
+
+    def request(self, method: str, path: str, json: dict = None, token: str = None) -> tuple:
+        self.queries.count = 0
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        response = self.client.open(path, method=method, json=json, headers=headers)
+        return response.status_code, response.get_json(silent=True), self.queries.count
+
+
+class HttpClient:
+    """HTTP client for a running server, query counts are not available"""
+
+    def __init__(self, base_url: str):
+        import requests
+
+        self.session = requests.Session()
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method: str, path: str, json: dict = None, token: str = None) -> tuple:
+        headers = {'Authorization': f'Bearer {token}'} if token else None
+        response = self.session.request(method, self.base_url + path, json=json, headers=headers)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body, None
+
+
+class Recorder:
+    """Latency, status and query samples per request name, shared by all workers"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, client, name: str, method: str, path: str, **kwargs) -> dict:
+        start = time.perf_counter()
+        status, body, queries = client.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[name].append(elapsed)
+            if queries is not None:
+                self.queries[name].append(queries)
+            if status >= 400:
+                self.errors[name] += 1
+        return body if status < 400 else None
+
+    def results(self, elapsed: float) -> dict:
+        results = {}
+        for name in sorted(self.samples):
+            row = summarize(self.samples[name], elapsed)
+            row['errors'] = self.errors[name]
+            if self.queries[name]:
+                row['queries_per_request'] = round(sum(self.queries[name]) / len(self.queries[name]), 2)
+            results[name] = row
+        everything = [sample for samples in self.samples.values() for sample in samples]
+        results['all'] = dict(summarize(everything, elapsed), errors=sum(self.errors.values()))
+        return results
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {name}, use {', '.join(FLOWS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def build_app(database_url: str, hash_method: str, hash_workers: int):
+    from application import create_app
+    from models import db
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SECRET_KEY': 'bench-secret-key',
+        'JWT_SECRET_KEY': 'bench-jwt-secret-key-of-32-bytes',
+        'JWT_SIGNING_KEYS': None,
+        'JWT_ACTIVE_KID': None,
+        'ADMIN_API_TOKEN': None,
+        'MAIL_TRANSPORT': 'memory',
+        'OUTBOX_DISPATCHER_ENABLED': False,
+        'PASSWORD_HASH_METHOD': hash_method,
+        'PASSWORD_HASH_WORKERS': hash_workers,
+    })
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+def populate(app, users: int, prefix: str) -> list:
+    """Insert confirmed synthetic users through the bulk importer"""
+    from importer import UserImport
+
+    rows = [{'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com', 'password': PASSWORD}
+            for i in range(users)]
+    with app.app_context():
+        report_ = UserImport(confirmed=True).run(rows)
+    if report_['failed']:
+        raise RuntimeError(f"Population failed: {report_['failures'][:3]}")
+    return [row['email'] for row in rows]
+
+
+def register_flow(client, recorder: Recorder, serializer: URLSafeTimedSerializer, name: str) -> str:
+    email = f'{name}@example.com'
+    if recorder.call(client, 'register', 'POST', '/api/v1/register',
+                     json={'username': name, 'email': email, 'password': PASSWORD}) is None:
+        return None
+    if serializer is not None:
+        token = serializer.dumps(email, salt='confirm_email')
+        recorder.call(client, 'confirm', 'GET', f'/confirm-email/{token}')
+    return email
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000, help='synthetic users created before the run')
+    parser.add_argument('--requests', type=int, default=4000, help='flows run in total')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('register=1,signin=2,protected=10,refresh=2'))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help='cheap by default to measure the service, use scrypt for production cost')
+    parser.add_argument('--hash-workers', type=int, default=0)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--url', help='benchmark a running server instead of an in-process app')
+    parser.add_argument('--secret-key', help="the server's SECRET_KEY, to confirm users created with --url")
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    queries = threading.local()
+
+    if args.url:
+        if not args.secret_key:
+            parser.error('--url needs --secret-key to confirm the synthetic users')
+        serializer = URLSafeTimedSerializer(args.secret_key)
+        make_client = lambda: HttpClient(args.url)
+        setup = Recorder()
+        emails = [register_flow(make_client(), setup, serializer, f'bench{run_id}u{i}') for i in range(args.users)]
+        emails = [email for email in emails if email]
+        target = args.url
+    else:
+        from hashing import password_hasher
+        from models import db
+
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'auth.db')}"
+        app = build_app(database_url, args.hash_method, args.hash_workers)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda *_: setattr(queries, 'count', getattr(queries, 'count', 0) + 1))
+        serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+        make_client = lambda: InProcessClient(app, queries)
+        emails = populate(app, args.users, f'bench{run_id}u')
+        target = database_url.split('://', 1)[0]
+
+    recorder = Recorder()
+    flows, weights = zip(*args.mix.items())
+    per_worker = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                  for i in range(args.concurrency)]
+    seeds = [rng.randrange(2 ** 32) for _ in range(args.concurrency)]
+
+    def worker(index: int):
+        worker_rng = random.Random(seeds[index])
+        client = make_client()
+        session = Recorder().call(client, 'signin', 'POST', '/api/v1/signin',
+                                  json={'email': worker_rng.choice(emails), 'password': PASSWORD})
+        for n in range(per_worker[index]):
+            flow = worker_rng.choices(flows, weights)[0]
+            if session is None and flow in ('protected', 'refresh'):
+                # the sign in was refused (e.g. 503 from hashing backpressure), sign in again first
+                flow = 'signin'
+            if flow == 'register':
+                register_flow(client, recorder, serializer, f'bench{run_id}w{index}n{n}')
+            elif flow == 'signin':
+                session = recorder.call(client, 'signin', 'POST', '/api/v1/signin',
+                                        json={'email': worker_rng.choice(emails), 'password': PASSWORD}) or session
+            elif flow == 'protected':
+                recorder.call(client, 'protected', 'GET', '/api/v1/protected', token=session['access_token'])
+            else:
+                refreshed = recorder.call(client, 'refresh', 'POST', '/api/v1/refresh_token',
+                                          token=session['refresh_token'])
+                if refreshed:
+                    session = dict(session, access_token=refreshed['access_token'])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    if not args.url:
+        password_hasher.shutdown()
+    report(f'Auth flows against {target}, {args.concurrency} concurrent clients, {args.users} users',
+           recorder.results(elapsed), args.output,
+           target=target, users=args.users, requests=args.requests, concurrency=args.concurrency,
+           mix=args.mix, seed=args.seed, hash_method=args.hash_method)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Per-call vs pooled SES client throughput against a local stubbed endpoint.
+
+    python -m benchmarks.aws_clients --iterations 200
+"""
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+
+from benchmarks.common import measure, report
+from clients import ClientRegistry
+
+SES_RESPONSE = (b'<SendEmailResponse xmlns="http://ses.amazonaws.com/doc/2010-12-01/">'
+                b'<SendEmailResult><MessageId>bench</MessageId></SendEmailResult>'
+                b'<ResponseMetadata><RequestId>bench</RequestId></ResponseMetadata></SendEmailResponse>')
+
+
+class StubSesHandler(BaseHTTPRequestHandler):
+    """Answers every request with a successful SendEmail response"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(SES_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(SES_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+def send(client):
+    client.send_email(
+        Destination={'ToAddresses': ['bench@example.com']},
+        Message={'Body': {'Text': {'Data': 'bench'}}, 'Subject': {'Data': 'bench'}},
+        Source='bench@example.com',
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    credentials = dict(region_name='us-east-1', aws_access_key_id='bench', aws_secret_access_key='bench',
+                       endpoint_url=endpoint)
+
+    registry = ClientRegistry()
+
+    def per_call():
+        # what send_email_smtp used to do: build a client for every email
+        send(boto3.client('ses', **credentials))
+
+    def pooled():
+        send(registry.get('ses', 'us-east-1', 'bench', 'bench', endpoint))
+
+    pooled()  # warm up the registry
+    results = {
+        'per_call_client': measure(per_call, args.iterations),
+        'pooled_client': measure(pooled, args.iterations),
+    }
+    server.shutdown()
+    report('SES send_email against a local stub', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
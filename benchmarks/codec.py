@@ -0,0 +1,47 @@
+"""
+Request decoding and response encoding on their own: registration payloads loaded
+through a new schema per request (the old views), the shared schema and the
+fast path, and a sign in response encoded by the stdlib and the orjson
+representation inside a request context.
+
+    python -m benchmarks.codec --iterations 20000
+"""
+import argparse
+
+from flask import Flask
+
+from benchmarks.common import measure, report
+from serializers import JSON_REPRESENTATIONS, UserRegistrationSchema, load_registration, registration_schema
+
+PAYLOAD = {'username': 'benchuser', 'email': 'benchuser@example.com', 'password': 'aSecurePassword'}
+# shape of a sign in response: ids, claims and two JWTs
+TOKEN = 'eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.' + 'x' * 300 + '.' + 'y' * 43
+SIGNIN_RESPONSE = {'user_id': '0b6f3c1e-4a55-4b7e-9a0e-2f6d3c1e4a55', 'email': 'benchuser@example.com',
+                   'username': 'benchuser', 'access_token': TOKEN, 'refresh_token': TOKEN}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    results = {
+        'decode_new_schema': measure(lambda: UserRegistrationSchema().load(PAYLOAD), args.iterations),
+        'decode_shared_schema': measure(lambda: registration_schema.load(PAYLOAD), args.iterations),
+        'decode_fast_path': measure(lambda: load_registration(PAYLOAD), args.iterations),
+    }
+
+    app = Flask(__name__)
+    with app.test_request_context():
+        for name, output in JSON_REPRESENTATIONS.items():
+            # warm-up, then the measured run
+            measure(lambda: output(SIGNIN_RESPONSE, 200), args.iterations // 10)
+            results[f'encode_{name}'] = measure(lambda: output(SIGNIN_RESPONSE, 200), args.iterations)
+
+    report('Registration payload decoding and sign in response encoding', results, args.output,
+           iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Cold start of a fresh process: importing the app module and building the app
+with the configuration in environment variables, fetched from Secrets Manager
+(a local stub with added latency) or read from the encrypted snapshot.
+
+    python -m benchmarks.cold_start --iterations 10 --latency-ms 50
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.fernet import Fernet
+
+from benchmarks.common import report, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = {'secret_key': 'bench', 'jwt_key': 'bench-jwt-secret-key-of-32-bytes', 'my_sql_connection': 'sqlite://'}
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import application
+imported = time.perf_counter()
+if {build}:
+    application.application
+print(json.dumps({{'import': imported - start, 'total': time.perf_counter() - start}}))
+"""
+
+
+class StubSecretsHandler(BaseHTTPRequestHandler):
+    """Answers GetSecretValue after a fixed delay"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+        body = json.dumps({'Name': 'bench', 'SecretString': json.dumps(SECRET)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_process(env: dict, build: bool = True) -> dict:
+    output = subprocess.run([sys.executable, '-c', CHILD.format(build=build)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_starts(env: dict, iterations: int, build: bool = True) -> dict:
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        samples.append(start_process(env, build)['total'])
+    return summarize(samples, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=50, help='added Secrets Manager round trip')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    StubSecretsHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSecretsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings_file = os.path.join(tmp, 'settings.json')
+        with open(settings_file, 'w') as f:
+            json.dump({'aws_access_key': 'bench', 'aws_secret_key': 'bench', 'aws_region_name': 'us-east-1',
+                       'aws_endpoint_url': f"http://127.0.0.1:{server.server_port}"}, f)
+        base = {key: value for key, value in os.environ.items()
+                if not key.startswith(('CONFIG_', 'AWS_', 'FLASK_'))}
+        base.update(PYTHONPATH=ROOT, CONFIG_FILE=settings_file)
+        from_env = dict(base, CONFIG_FILE=os.path.join(tmp, 'missing.json'),
+                        **{key.upper(): value for key, value in SECRET.items()})
+        with_snapshot = dict(base, CONFIG_SNAPSHOT_PATH=os.path.join(tmp, 'secrets.snapshot'),
+                             CONFIG_SNAPSHOT_KEY=Fernet.generate_key().decode())
+        start_process(with_snapshot)  # writes the snapshot
+
+        results = {
+            'import_only': measure_starts(from_env, args.iterations, build=False),
+            'config_from_env': measure_starts(from_env, args.iterations),
+            'secrets_manager': measure_starts(base, args.iterations),
+            'encrypted_snapshot': measure_starts(with_snapshot, args.iterations),
+        }
+    server.shutdown()
+    report(f'Cold start, import + create_app ({args.latency_ms:g} ms Secrets Manager latency)', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
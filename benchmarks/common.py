@@ -0,0 +1,71 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(func, iterations: int) -> dict:
+    """
+    Call func `iterations` times and summarise the latencies.
+    :return: dict with ops/sec and p50/p95/p99 latency in milliseconds
+    """
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed)
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Throughput and latency percentiles for latency samples given in seconds"""
+    return {
+        'count': len(samples),
+        'ops_per_sec': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def run_metadata(**extra) -> dict:
+    """Commit, interpreter and time of a run, stored next to the results so runs can be compared"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        **extra,
+    }
+
+
+def report(title: str, results: dict, output: str = None, **meta):
+    """Print results as a table and optionally store them as JSON with the run metadata"""
+    print(title)
+    for name, row in results.items():
+        print(f"  {name:<28} " + '  '.join(f"{key}={value}" for key, value in row.items()))
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump({'title': title, 'meta': run_metadata(**meta), 'results': results}, f, indent=2)
@@ -0,0 +1,61 @@
+"""
+Compare two stored benchmark runs, e.g. from two commits.
+
+    python -m benchmarks.compare results/before.json results/after.json --threshold 10
+
+Exits with status 1 when throughput dropped or p95 latency grew by more than
+the threshold (percent) for any row present in both runs.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True when higher is better
+METRICS = {'ops_per_sec': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'queries_per_request': False}
+GATED = ('ops_per_sec', 'p95_ms')
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        data = json.load(f)
+    # runs stored before run metadata was added hold the results only
+    return data if 'results' in data else {'meta': {}, 'results': data}
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"{baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')}")
+
+    regressions = []
+    for name, new in candidate['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for metric, higher_is_better in METRICS.items():
+            if metric not in old or metric not in new:
+                continue
+            delta = change(old[metric], new[metric])
+            cells.append(f"{metric}={old[metric]}->{new[metric]} ({delta:+.1f}%)")
+            worse = -delta if higher_is_better else delta
+            if metric in GATED and worse > args.threshold:
+                regressions.append(f"{name} {metric} {delta:+.1f}%")
+        print(f"  {name:<28} " + '  '.join(cells))
+
+    if regressions:
+        print('Regressions: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
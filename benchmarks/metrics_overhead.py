@@ -0,0 +1,64 @@
+"""
+Cost of the request/SQL/hash instrumentation: the same requests against an app
+with METRICS_ENABLED off and on, through the Flask test client.
+
+    python -m benchmarks.metrics_overhead --iterations 2000
+"""
+import argparse
+
+from flask import Flask
+from flask_jwt_extended import JWTManager
+from flask_restful import Api
+
+from benchmarks.common import measure, report
+from controllers import initialize_routes
+from hashing import password_hasher
+from metrics import init_metrics
+from models import db, Users
+
+
+def build_app(enabled: bool) -> Flask:
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', JWT_SECRET_KEY='bench-jwt-secret-key-of-32-bytes',
+                      TESTING=True, METRICS_ENABLED=enabled, USER_CACHE_TTL=0.000001)
+    JWTManager(app)
+    init_metrics(app)
+    db.init_app(app)
+    initialize_routes(Api(app))
+    with app.app_context():
+        db.create_all()
+        user = Users(username='bench', email='bench@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def scenarios(app: Flask, iterations: int, suffix: str) -> dict:
+    client = app.test_client()
+    token = client.post('/api/v1/signin', json={'email': 'bench@example.com', 'password': 'aSecurePassword'}).json
+    headers = {'Authorization': f"Bearer {token['access_token']}"}
+    return {
+        # the tiny cache TTL makes every protected read run its SELECT
+        f'protected_read_{suffix}': measure(lambda: client.get('/api/v1/protected', headers=headers), iterations),
+        f'jwks_{suffix}': measure(lambda: client.get('/.well-known/jwks.json'), iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    password_hasher.configure(method='pbkdf2:sha256:1000')
+    # the disabled app runs first, the SQL listeners are process-wide once registered
+    disabled = build_app(False)
+    scenarios(disabled, args.iterations, 'warmup')
+    results = scenarios(disabled, args.iterations, 'off')
+    results.update(scenarios(build_app(True), args.iterations, 'on'))
+    report('Request latency with metrics off and on', dict(sorted(results.items())), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Password verifications (the CPU cost of a sign-in) per second vs hashing pool size.
+
+    python -m benchmarks.password_hashing --method scrypt --verifications 200
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import summarize, report
+from hashing import PasswordHasher
+
+
+def run(hasher: PasswordHasher, stored: str, verifications: int, concurrency: int) -> dict:
+    """Drive verifications from `concurrency` request threads"""
+    def verify(_):
+        start = time.perf_counter()
+        hasher.verify(stored, 'aSecurePassword')
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as threads:
+        started = time.perf_counter()
+        samples = list(threads.map(verify, range(verifications)))
+        return summarize(samples, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--verifications', type=int, default=200)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='pool sizes to compare, defaults to 0 (inline) and 1..cpu count')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    pool_sizes = args.workers or [0] + sorted({1, max(1, cores // 2), cores})
+    stored = PasswordHasher(args.method).hash('aSecurePassword')
+
+    results = {}
+    for workers in pool_sizes:
+        concurrency = max(workers, 1) * 2
+        hasher = PasswordHasher(args.method, workers=workers, max_pending=concurrency)
+        hasher.verify(stored, 'aSecurePassword')  # start the pool outside the measurement
+        results[f'workers={workers}'] = run(hasher, stored, args.verifications, concurrency)
+        hasher.shutdown()
+
+    report(f'Sign-in password checks ({args.method}, {cores} cores)', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Cost of request profiling: sign ins and protected reads with PROFILING_ENABLED
+off, on with nothing sampled (the default), with every request traced for slow
+request logging, and with every request sampled by the profiler.
+
+    python -m benchmarks.profiling_overhead --iterations 2000
+"""
+import argparse
+
+from flask import Flask
+from flask_jwt_extended import JWTManager
+from flask_restful import Api
+
+from benchmarks.common import measure, report
+from controllers import initialize_routes
+from hashing import password_hasher
+from models import db, Users
+from profiling import init_profiling
+
+MODES = {
+    'off': {'PROFILING_ENABLED': False},
+    'idle': {},
+    'traced': {'SLOW_REQUEST_THRESHOLD': 60},
+    'sampled': {'PROFILE_SAMPLE_RATE': 1},
+}
+
+
+def build_app(config: dict) -> Flask:
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', JWT_SECRET_KEY='bench-jwt-secret-key-of-32-bytes',
+                      SECRET_KEY='bench-secret-key', TESTING=True, METRICS_ENABLED=False, **config)
+    JWTManager(app)
+    db.init_app(app)
+    init_profiling(app)
+    initialize_routes(Api(app))
+    with app.app_context():
+        db.create_all()
+        user = Users(username='bench', email='bench@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    password_hasher.configure(method='pbkdf2:sha256:1000')
+    for mode, config in MODES.items():
+        client = build_app(config).test_client()
+        sign_in = lambda: client.post('/api/v1/signin', json={'email': 'bench@example.com',
+                                                              'password': 'aSecurePassword'})
+        token = sign_in().json['access_token']
+        protected = lambda: client.get('/api/v1/protected', headers={'Authorization': f'Bearer {token}'})
+        # warm-up, then the measured runs
+        measure(sign_in, args.iterations // 10)
+        results[f'signin_{mode}'] = measure(sign_in, args.iterations)
+        results[f'protected_{mode}'] = measure(protected, args.iterations)
+    password_hasher.configure()
+
+    report('Requests with profiling off, idle, traced and sampled', results, args.output,
+           iterations=args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+The Werkzeug dev server (`flask run`, the old Dockerfile CMD) against `serve.py`
+with sync, threaded and async (--asgi) workers, under the same auth-flow load. Each
+server gets a fresh SQLite file (or --database-url) and the memory mail
+transport, then benchmarks.auth_flows drives it over HTTP. `per_worker_ops`
+compares the requests a single worker process serves in each mode, the threaded
+and async runs get the same number of request threads per worker.
+
+    python -m benchmarks.serving --users 50 --requests 2000 --concurrency 16 --hash-method scrypt
+    python -m benchmarks.serving --workers 1 --threads 32 --concurrency 64 --mix signin=1,protected=20,refresh=2
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import report
+from serve import default_workers
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET_KEY = 'bench-secret-key'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def server_env(tmp: str, name: str, hash_method: str, database_url: str = None) -> dict:
+    env = {key: value for key, value in os.environ.items() if not key.startswith(('CONFIG_', 'FLASK_'))}
+    env.update({
+        'PYTHONPATH': ROOT,
+        'CONFIG_FILE': os.path.join(tmp, 'missing.json'),
+        'SECRET_KEY': SECRET_KEY,
+        'JWT_KEY': 'bench-jwt-secret-key-of-32-bytes',
+        'MY_SQL_CONNECTION': database_url or f"sqlite:///{os.path.join(tmp, name + '.db')}",
+        'FLASK_APP': 'application.py',
+        'FLASK_MAIL_TRANSPORT': 'memory',
+        'FLASK_PASSWORD_HASH_METHOD': hash_method,
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(tmp, name + '-metrics'),
+    })
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    return env
+
+
+def run_mode(name: str, command: list, env: dict, port: int, args, tmp: str) -> dict:
+    subprocess.run([sys.executable, '-m', 'flask', 'db', 'upgrade'], cwd=ROOT, env=env, check=True,
+                   capture_output=True)
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        output = os.path.join(tmp, name + '.json')
+        subprocess.run([sys.executable, '-m', 'benchmarks.auth_flows', '--url', f'http://127.0.0.1:{port}',
+                        '--secret-key', SECRET_KEY, '--users', str(args.users), '--requests', str(args.requests),
+                        '--concurrency', str(args.concurrency), '--mix', args.mix, '--output', output],
+                       cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)['results']['all']
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--workers', type=int, help='serve.py workers, its default when unset')
+    parser.add_argument('--threads', type=int, default=32,
+                        help='threads per worker of the threaded and async runs, 1 skips them')
+    parser.add_argument('--database-url', help='database shared by the runs instead of a SQLite file per run')
+    parser.add_argument('--hash-method', default='scrypt')
+    parser.add_argument('--mix', default='register=1,signin=2,protected=10,refresh=2',
+                        help='flow weights passed to benchmarks.auth_flows')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    workers = args.workers or default_workers()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        results['flask_run'] = run_mode(
+            'flask_run', [sys.executable, '-m', 'flask', 'run', '--port', str(port)],
+            server_env(tmp, 'flask_run', args.hash_method, args.database_url), port, args, tmp)
+
+        modes = [('serve', ['--threads', '1'])]
+        if args.threads > 1:
+            modes += [('serve_threaded', ['--threads', str(args.threads)]),
+                      ('serve_asgi', ['--asgi', '--threads', str(args.threads)])]
+        for name, options in modes:
+            port = free_port()
+            command = [sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}', '--access-log', '',
+                       '--workers', str(workers), *options]
+            results[name] = run_mode(name, command, server_env(tmp, name, args.hash_method, args.database_url),
+                                     port, args, tmp)
+            results[name]['per_worker_ops'] = round(results[name]['ops_per_sec'] / workers, 1)
+
+    report(f'Auth flows over HTTP, {args.concurrency} concurrent clients ({args.hash_method})', results, args.output,
+           users=args.users, requests=args.requests, concurrency=args.concurrency, hash_method=args.hash_method,
+           workers=workers, threads=args.threads, mix=args.mix)
+
+
+if __name__ == '__main__':
+    main()
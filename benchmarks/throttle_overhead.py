@@ -0,0 +1,78 @@
+"""
+Cost of the sign in throttle: successful sign ins with LOGIN_THROTTLE_ENABLED off
+and on, the throttle calls on their own, and a password guessing run against one
+account, which hashes every attempt without the throttle and answers 429s with it.
+
+    python -m benchmarks.throttle_overhead --iterations 2000 --hash-method scrypt
+"""
+import argparse
+
+from flask import Flask
+from flask_jwt_extended import JWTManager
+from flask_restful import Api
+
+from benchmarks.common import measure, report
+from controllers import initialize_routes
+from hashing import password_hasher
+from models import db, Users
+from throttle import LoginThrottle, init_throttle
+
+
+def build_app(enabled: bool) -> Flask:
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', JWT_SECRET_KEY='bench-jwt-secret-key-of-32-bytes',
+                      TESTING=True, METRICS_ENABLED=False, LOGIN_THROTTLE_ENABLED=enabled,
+                      TRUSTED_PROXIES=1)
+    JWTManager(app)
+    db.init_app(app)
+    init_throttle(app)
+    initialize_routes(Api(app))
+    with app.app_context():
+        db.create_all()
+        user = Users(username='bench', email='bench@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def sign_in(client, password: str):
+    return lambda: client.post('/api/v1/signin', json={'email': 'bench@example.com', 'password': password})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--hash-method', default='scrypt', help='hash cost of the guessing run')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    password_hasher.configure(method='pbkdf2:sha256:1000')
+    for enabled in (False, True):
+        client = build_app(enabled).test_client()
+        # warm-up, then the measured run
+        measure(sign_in(client, 'aSecurePassword'), args.iterations // 10)
+        results[f"signin_{'on' if enabled else 'off'}"] = measure(sign_in(client, 'aSecurePassword'),
+                                                                 args.iterations)
+
+    throttle = LoginThrottle()
+    results['retry_after_call'] = measure(lambda: throttle.retry_after('10.0.0.1', 'bench@example.com'),
+                                          args.iterations)
+    # no limit reached, every call counts both subjects
+    throttle = LoginThrottle(ip_limit=args.iterations + 1, account_limit=args.iterations + 1)
+    results['failure_call'] = measure(lambda: throttle.failure('10.0.0.1', 'bench@example.com'), args.iterations)
+
+    guesses = max(20, args.iterations // 20)
+    password_hasher.configure(method=args.hash_method)
+    for enabled in (False, True):
+        results[f"guessing_{'on' if enabled else 'off'}"] = measure(sign_in(build_app(enabled).test_client(), 'wrong'),
+                                                                   guesses)
+    password_hasher.configure()
+
+    report('Sign in with the login throttle off and on', results, args.output,
+           iterations=args.iterations, hash_method=args.hash_method)
+
+
+if __name__ == '__main__':
+    main()
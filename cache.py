@@ -0,0 +1,208 @@
+import threading
+import time
+from dataclasses import dataclass, asdict
+from cachetools import TTLCache
+from flask import current_app
+
+from models import Users, normalize
+from replicas import replica_reads_active, use_primary
+
+
+@dataclass(frozen=True)
+class UserRecord:
+    """Read-only snapshot of a Users row, safe to share between requests. The password hash is left out."""
+    id: int
+    user_id: str
+    username: str
+    email: str
+    email_confirmed: bool
+    token_version: int
+
+    @classmethod
+    def from_model(cls, user: Users) -> 'UserRecord':
+        return cls(user.id, user.user_id, user.username, user.email, bool(user.email_confirmed),
+                   user.token_version or 0)
+
+
+class SharedCache:
+    """
+    Interface of the optional shared tier (e.g. Redis or memcached) behind the
+    in-process cache. Values are plain dicts so they can be serialized.
+    """
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value: dict, ttl: float):
+        raise NotImplementedError
+
+    def incr(self, key: str, ttl: float) -> int:
+        """
+        Atomically add one to the 'count' of a key (e.g. Redis HINCRBY/EXPIRE).
+        A missing key starts at 0 and expires after ttl, incrementing keeps its expiry.
+        """
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+
+class MemorySharedCache(SharedCache):
+    """Local stand-in for a shared cache, the least recently used keys go first once maxsize is reached"""
+
+    def __init__(self, maxsize: int = 100000):
+        # items carry their own expiry, the cache TTL is only an upper bound
+        self._data = TTLCache(maxsize=maxsize, ttl=7 * 24 * 3600)
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float):
+        item = self._data.get(key)
+        if item is not None and item[1] < now:
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._live(key, time.monotonic())
+            return None if item is None else dict(item[0])
+
+    def set(self, key: str, value: dict, ttl: float):
+        with self._lock:
+            self._data[key] = (dict(value), time.monotonic() + ttl)
+
+    def incr(self, key: str, ttl: float) -> int:
+        now = time.monotonic()
+        with self._lock:
+            item = self._live(key, now)
+            value, expires = item if item is not None else ({}, now + ttl)
+            count = value.get('count', 0) + 1
+            self._data[key] = (dict(value, count=count), expires)
+            return count
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache that counts capacity evictions"""
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+
+    def popitem(self):
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+
+class UserCache:
+    """
+    Read-through cache of user records keyed by user_id and by normalized email.
+    The in-process tier is an LRU with a TTL, which also bounds how long another
+    process can serve a record after it was invalidated elsewhere. The optional
+    shared tier is consulted on local misses.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 10, shared: SharedCache = None, shared_ttl: float = 300):
+        self._lock = threading.Lock()
+        self.configure(maxsize, ttl, shared, shared_ttl)
+
+    def configure(self, maxsize: int = 10000, ttl: float = 10, shared: SharedCache = None, shared_ttl: float = 300):
+        with self._lock:
+            self._local = _CountingTTLCache(maxsize, ttl)
+            self.shared = shared
+            self.shared_ttl = shared_ttl
+            self.hits = self.misses = self.shared_hits = 0
+
+    @staticmethod
+    def _keys(record: UserRecord) -> tuple:
+        return f'user:id:{record.user_id}', f'user:email:{normalize(record.email)}'
+
+    def _lookup(self, key: str, load) -> UserRecord:
+        with self._lock:
+            record = self._local.get(key)
+            if record is not None:
+                self.hits += 1
+                return record
+            self.misses += 1
+
+        record = None
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                record = UserRecord(**value)
+                with self._lock:
+                    self.shared_hits += 1
+        if record is None:
+            from_replica = replica_reads_active()
+            user = load()
+            if user is None and from_replica:
+                # the replica may not have the row yet
+                from_replica = False
+                with use_primary():
+                    user = load()
+            if user is None:
+                # misses are not cached, a user may register right after
+                return None
+            record = UserRecord.from_model(user)
+            # a lagging replica's row could outlive an invalidation in the shared tier, it is kept local only
+            if self.shared is not None and not from_replica:
+                for shared_key in self._keys(record):
+                    self.shared.set(shared_key, asdict(record), self.shared_ttl)
+
+        with self._lock:
+            for local_key in self._keys(record):
+                self._local[local_key] = record
+        return record
+
+    def get_by_user_id(self, user_id: str) -> UserRecord:
+        return self._lookup(f'user:id:{user_id}', lambda: Users.query.filter_by(user_id=user_id).first())
+
+    def get_by_email(self, email: str) -> UserRecord:
+        return self._lookup(f'user:email:{normalize(email)}', lambda: Users.find_by_email(email))
+
+    def invalidate(self, user_id: str, *emails: str):
+        """Drop a user from both tiers, call after the write is committed with the old and new emails"""
+        keys = {f'user:id:{user_id}'} | {f'user:email:{normalize(email)}' for email in emails if email}
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared_hits': self.shared_hits,
+                'evictions': self._local.evictions,
+                'size': len(self._local),
+            }
+
+
+def get_user_cache() -> UserCache:
+    """User cache of the current app, created with defaults if init_cache was not called"""
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('user_cache', UserCache())
+    return cache
+
+
+def init_cache(application, shared: SharedCache = None) -> UserCache:
+    """Func to initialize the user cache from the app config"""
+    config = application.config
+    if shared is None and config.get('USER_CACHE_SHARED') == 'memory':
+        shared = MemorySharedCache()
+    cache = UserCache(
+        maxsize=int(config.get('USER_CACHE_SIZE', 10000)),
+        ttl=float(config.get('USER_CACHE_TTL', 10)),
+        shared=shared,
+        shared_ttl=float(config.get('USER_CACHE_SHARED_TTL', 300)),
+    )
+    application.extensions['user_cache'] = cache
+    return cache
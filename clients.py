@@ -0,0 +1,88 @@
+import os
+import threading
+
+
+class ClientRegistry:
+    """
+    Process-wide registry of long-lived boto3 clients.
+    Clients are created lazily on first use and reused afterwards, so the botocore
+    service model and the HTTPS connection pool are set up once per process.
+    boto3 itself is imported on first use too, it is a large share of the app's import time.
+    """
+
+    def __init__(self, max_pool_connections: int = 10, tcp_keepalive: bool = True, connect_timeout: float = 5,
+                 read_timeout: float = 30, max_attempts: int = 3):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.configure(max_pool_connections, tcp_keepalive, connect_timeout, read_timeout, max_attempts)
+
+    def configure(self, max_pool_connections: int = 10, tcp_keepalive: bool = True, connect_timeout: float = 5,
+                  read_timeout: float = 30, max_attempts: int = 3):
+        """
+        Set the connection pool options. Only clients created afterwards use them.
+        :param max_pool_connections: HTTPS connections kept per client
+        :param tcp_keepalive: enable TCP keep-alive on pooled connections
+        """
+        self.options = dict(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=tcp_keepalive,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries={'max_attempts': max_attempts, 'mode': 'standard'},
+        )
+
+    def get(self, service_name: str, region_name: str = None, access_key: str = None, secret_key: str = None,
+            endpoint_url: str = None):
+        """
+        Return the shared client for these parameters, creating it on first use.
+        """
+        self._check_fork()
+        key = (service_name, region_name, access_key, secret_key, endpoint_url)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    # boto3 sessions are not thread-safe, so clients are built under the lock
+                    client = boto3.session.Session().client(
+                        service_name=service_name,
+                        region_name=region_name,
+                        aws_access_key_id=access_key,
+                        aws_secret_access_key=secret_key,
+                        endpoint_url=endpoint_url,
+                        config=Config(**self.options),
+                    )
+                    self._clients[key] = client
+        return client
+
+    def reset(self):
+        """Close and drop every client, the next get() builds fresh ones"""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.close()
+
+    def _check_fork(self):
+        """Drop clients inherited from the parent process, their sockets belong to the parent"""
+        if self._pid != os.getpid():
+            self._after_fork()
+
+    def _after_fork(self):
+        # the parent still uses these connections, so they are discarded without closing
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+
+aws_clients = ClientRegistry()
+os.register_at_fork(after_in_child=aws_clients._after_fork)
+
+
+def get_client(service_name: str, region_name: str = None, access_key: str = None, secret_key: str = None,
+               endpoint_url: str = None):
+    """Func to get a pooled boto3 client from the process-wide registry"""
+    return aws_clients.get(service_name, region_name, access_key, secret_key, endpoint_url)
@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+import uuid
+from datetime import timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import migrations
+from hashing import PasswordHasher
+from importer import UserImport, read_rows
+from keys import generate_key
+from maintenance import purge_from_config
+from models import db, EmailOutbox
+
+db_cli = AppGroup('db', help='Database schema management.')
+keys_cli = AppGroup('keys', help='JWT signing keys.')
+outbox_cli = AppGroup('outbox', help='Email outbox maintenance.')
+users_cli = AppGroup('users', help='User maintenance.')
+
+
+@db_cli.command('upgrade')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per backfill transaction.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between backfill batches.')
+def upgrade_db(batch_size, pause):
+    """Create missing tables and apply pending migrations"""
+    if not migrations.has_table(db.engine, 'users'):
+        # empty database: the models already describe the latest schema
+        db.create_all()
+        migrations.stamp(db.engine)
+        click.echo("Created schema")
+        return
+
+    applied = migrations.upgrade(db.engine, batch_size=batch_size, pause=pause, echo=click.echo)
+    db.create_all()
+    click.echo(f"Applied {len(applied)} migrations")
+
+
+@keys_cli.command('generate')
+@click.option('--alg', type=click.Choice(['RS256', 'EdDSA']), default='RS256', show_default=True)
+@click.option('--kid', help='Key id, a random one by default.')
+def generate_signing_key(alg, kid):
+    """Print a new signing key entry for JWT_SIGNING_KEYS"""
+    click.echo(json.dumps({'kid': kid or uuid.uuid4().hex[:16], 'alg': alg, 'private_key': generate_key(alg)}))
+
+
+@outbox_cli.command('dispatch')
+@click.option('--once', is_flag=True, help='Deliver a single batch and exit.')
+def dispatch_outbox(once):
+    """Run the outbox dispatcher in the foreground"""
+    dispatcher = current_app.extensions['outbox']
+    if once:
+        click.echo(f"Processed {dispatcher.dispatch_once()} messages")
+    else:
+        dispatcher.run()
+
+
+@outbox_cli.command('requeue-dead')
+def requeue_dead():
+    """Move dead-lettered messages back to pending"""
+    count = EmailOutbox.query.filter_by(status='dead').update(
+        {'status': 'pending', 'attempts': 0, 'last_error': None}, synchronize_session=False)
+    db.session.commit()
+    click.echo(f"Requeued {count} messages")
+
+
+@users_cli.command('import')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per INSERT batch.')
+@click.option('--workers', type=int, help='Hashing processes, defaults to the CPU count.')
+@click.option('--confirmed', is_flag=True, help='Mark imported emails as already confirmed.')
+@click.option('--failures', type=click.File('w'), help='Write per-row failures to this JSONL file.')
+def import_users(file, fmt, batch_size, workers, confirmed, failures):
+    """Bulk import users from a JSONL or CSV file"""
+    fmt = fmt or ('csv' if file.name.endswith('.csv') else 'jsonl')
+    hasher = PasswordHasher(current_app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+                            workers=workers if workers is not None else os.cpu_count() or 1)
+    job = UserImport(batch_size=batch_size, confirmed=confirmed, hasher=hasher,
+                     max_reported_failures=sys.maxsize if failures else 1000)
+    try:
+        report = job.run(read_rows(file, fmt))
+    finally:
+        hasher.shutdown()
+
+    if failures:
+        for failure in report['failures']:
+            failures.write(json.dumps(failure) + '\n')
+    click.echo(f"Imported {report['imported']} of {report['total']} rows, {report['failed']} failed")
+
+
+@users_cli.command('purge-unconfirmed')
+@click.option('--days', type=float, help='Age in days, defaults to PURGE_UNCONFIRMED_AFTER (7 days).')
+@click.option('--batch-size', type=int, help='Accounts per transaction.')
+@click.option('--pause', type=float, help='Seconds to sleep between batches.')
+@click.option('--archive', is_flag=True, help='Copy the accounts to archived_users first.')
+@click.option('--dry-run', is_flag=True, help='Only count the accounts.')
+def purge_unconfirmed(days, batch_size, pause, archive, dry_run):
+    """Remove accounts that never confirmed their email"""
+    purge = purge_from_config(current_app.config, echo=click.echo)
+    if days is not None:
+        purge.max_age = timedelta(days=days)
+    if batch_size is not None:
+        purge.batch_size = batch_size
+    if pause is not None:
+        purge.pause = pause
+    if archive:
+        purge.archive = True
+    report = purge.run(dry_run=dry_run)
+    click.echo(f"{'Found' if dry_run else 'Purged'} {report['purged']} unconfirmed accounts "
+               f"in {report['batches']} batches ({report['seconds']}s)")
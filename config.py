@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import time
+
+SETTINGS_FILE = os.path.join(os.path.dirname(__file__), 'settings.json')
+# seconds between retries after a failed background refresh
+RETRY_DELAY = 30
+
+_MISSING = object()
+
+
+class ConfigProvider:
+    """
+    Layered configuration. A key is looked up in the environment (upper-cased),
+    then in settings.json, then in the AWS Secrets Manager secret. Each layer is
+    loaded on first use, so importing the app does no file or network IO.
+
+    The secret is cached for `ttl` seconds and refreshed in a background thread
+    once stale, lookups keep getting the cached values meanwhile. With a snapshot
+    path and Fernet key it is also kept in an encrypted file, which a restarted
+    process reads instead of waiting for Secrets Manager.
+    """
+
+    def __init__(self, config_file: str = SETTINGS_FILE, environ=None, ttl: float = 300,
+                 snapshot_path: str = None, snapshot_key: str = None, snapshot_max_age: float = 86400):
+        self.config_file = config_file
+        self.environ = os.environ if environ is None else environ
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.snapshot_key = snapshot_key
+        self.snapshot_max_age = snapshot_max_age
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.reset()
+
+    @classmethod
+    def from_env(cls, environ=None) -> 'ConfigProvider':
+        """Provider set up from CONFIG_* environment variables"""
+        environ = os.environ if environ is None else environ
+        return cls(config_file=environ.get('CONFIG_FILE', SETTINGS_FILE),
+                   environ=environ,
+                   ttl=float(environ.get('CONFIG_SECRETS_TTL', 300)),
+                   snapshot_path=environ.get('CONFIG_SNAPSHOT_PATH'),
+                   snapshot_key=environ.get('CONFIG_SNAPSHOT_KEY'),
+                   snapshot_max_age=float(environ.get('CONFIG_SNAPSHOT_MAX_AGE', 86400)))
+
+    def reset(self):
+        """Forget the loaded layers, the next lookup loads them again"""
+        with self._lock:
+            self._file = None
+            self._secrets = None
+            self._next_refresh = 0.0
+            self._refreshing = False
+            self.fetches = 0
+
+    def get(self, key: str, default=None):
+        """Value of a key from the first layer that has it"""
+        value = self.local(key, _MISSING)
+        if value is _MISSING:
+            value = self.secrets().get(key, default)
+        return value
+
+    def local(self, key: str, default=None):
+        """Look a key up in the environment and settings.json only, never over the network"""
+        value = self.environ.get(key.upper())
+        if value is not None:
+            return value
+        return self._load_file().get(key, default)
+
+    def _load_file(self) -> dict:
+        if self._file is None:
+            try:
+                with open(self.config_file) as f:
+                    self._file = json.load(f)
+            except FileNotFoundError:
+                self._file = {}
+        return self._file
+
+    def secrets(self) -> dict:
+        """The Secrets Manager secret, {} when no AWS region is configured"""
+        if self._secrets is None:
+            with self._load_lock:
+                if self._secrets is None:
+                    snapshot = self._read_snapshot()
+                    if snapshot is None:
+                        self.refresh()
+                    else:
+                        secrets, fetched_at = snapshot
+                        with self._lock:
+                            self._secrets, self._next_refresh = secrets, fetched_at + self.ttl
+
+        with self._lock:
+            secrets, stale = self._secrets, time.time() >= self._next_refresh
+        if stale:
+            self._refresh_in_background()
+        return secrets
+
+    def refresh(self) -> dict:
+        """Fetch the secret now, update the cache and the snapshot"""
+        secrets = self._fetch()
+        with self._lock:
+            self._secrets, self._next_refresh = secrets, time.time() + self.ttl
+            self.fetches += 1
+        self._write_snapshot(secrets)
+        return secrets
+
+    def _fetch(self) -> dict:
+        region = self.local('aws_region_name')
+        if not region:
+            return {}
+        # imported here, boto3 is only needed once a secret is looked up
+        from controls import SecretsManager
+
+        manager = SecretsManager(self.local('aws_access_key'), self.local('aws_secret_key'), region,
+                                 self.local('aws_endpoint_url'))
+        return manager.get_secret(self.local('aws_secret_name', 'web3m-test-secrets'))
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name='config-refresh', daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # keep serving the cached secret and retry later
+            print(f"Secrets refresh failed: {e}")
+            with self._lock:
+                self._next_refresh = time.time() + min(self.ttl, RETRY_DELAY)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _fernet(self):
+        if not (self.snapshot_path and self.snapshot_key):
+            return None
+        from cryptography.fernet import Fernet
+
+        return Fernet(self.snapshot_key)
+
+    def _read_snapshot(self):
+        """(secrets, fetched_at) from the encrypted snapshot, None if it is missing, expired or unreadable"""
+        fernet = self._fernet()
+        if fernet is None:
+            return None
+        from cryptography.fernet import InvalidToken
+
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                token = f.read()
+            secrets = json.loads(fernet.decrypt(token, ttl=int(self.snapshot_max_age)))
+            return secrets, fernet.extract_timestamp(token)
+        except (OSError, InvalidToken, ValueError):
+            return None
+
+    def _write_snapshot(self, secrets: dict):
+        fernet = self._fernet()
+        if fernet is None or not secrets:
+            return
+        # write a private temp file and swap it in, readers never see a partial snapshot
+        path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(fernet.encrypt(json.dumps(secrets).encode()))
+            os.replace(path, self.snapshot_path)
+        except OSError as e:
+            print(f"Could not write the secrets snapshot: {e}")
+
+    def _after_fork(self):
+        # a refresh thread of the parent does not exist in the child
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+
+
+settings = ConfigProvider.from_env()
+os.register_at_fork(after_in_child=settings._after_fork)
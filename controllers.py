@@ -1,9 +1,15 @@
 from flask_restful import Api
+from metrics import metrics_enabled, timed_request
 from views import RegisterResource, ResendConfirmationResource, ConfirmEmail, SignIn, ProtectedResource,\
-    TokenRefresh, UserResource, ApiDocumentationResource
+    TokenRefresh, LogoutResource, LogoutAllResource, IntrospectResource, UserResource, UserImportResource, \
+    JwksResource, MetricsResource, ProfileResource, HealthResource, ReadinessResource, ApiDocumentationResource
 
 
 def initialize_routes(api: Api):
+    if api.app is None or metrics_enabled(api.app):
+        # latency histogram for every resource added below
+        api.decorators.append(timed_request)
+
     """User Routes"""
     api.add_resource(RegisterResource, '/api/v1/register')  # register user confirmation token, send confirm url (POST)
     api.add_resource(ResendConfirmationResource, '/api/v1/resend-confirmation') # resend email confirmation (POST)
@@ -11,7 +17,16 @@ def initialize_routes(api: Api):
     api.add_resource(SignIn, '/api/v1/signin')  # sign in  return access and refresh token (POST)
     api.add_resource(ProtectedResource, '/api/v1/protected')  # jwt protected resource (GET)
     api.add_resource(TokenRefresh, '/api/v1/refresh_token')  # refresh access token (POST)
+    api.add_resource(LogoutResource, '/api/v1/logout')  # revoke the presented token and a refresh token (POST)
+    api.add_resource(LogoutAllResource, '/api/v1/logout/all')  # revoke every token of the user (POST)
+    api.add_resource(IntrospectResource, '/api/v1/introspect')  # verify a batch of tokens (POST)
     api.add_resource(UserResource, '/api/v1/users/')  # update user data, delete user (PUT, DELETE)
+    api.add_resource(UserImportResource, '/api/v1/admin/users/import')  # bulk import users, admin only (POST)
+    api.add_resource(JwksResource, '/.well-known/jwks.json')  # public token verification keys (GET)
+    api.add_resource(MetricsResource, '/metrics')  # prometheus metrics (GET)
+    api.add_resource(ProfileResource, '/api/v1/admin/profile')  # sampled stacks, header token, reset (GET/POST/DELETE)
+    api.add_resource(HealthResource, '/healthz')  # liveness probe (GET)
+    api.add_resource(ReadinessResource, '/readyz')  # readiness probe, db and optional mail/secrets (GET)
 
     """Index Page"""
     api.add_resource(ApiDocumentationResource, '/') # test documentation
@@ -1,20 +1,8 @@
 import json
-import os
-import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
 
-
-def upload_configuration(config_file: str = 'settings.json') -> dict:
-    """
-    Loads configuration settings from a specified JSON file.
-    :param config_file: The name of the configuration file
-    :return: A dictionary containing the configuration settings.
-    """
-    path = os.path.join(os.path.dirname(__file__), config_file)
-    with open(path) as f:
-        data = json.load(f)
-
-    return data
+from clients import get_client
+from config import settings
 
 
 class SecretsManager:
@@ -22,17 +10,12 @@ class SecretsManager:
     A class for interacting with AWS Secrets Manager.
     """
 
-    def __init__(self, access_key, secret_key, region_name):
+    def __init__(self, access_key, secret_key, region_name, endpoint_url=None):
         """
         Initialize the SecretsManager with AWS credentials and region.
         """
 
-        self.client = boto3.session.Session().client(
-            service_name='secretsmanager',
-            region_name=region_name,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key
-        )
+        self.client = get_client('secretsmanager', region_name, access_key, secret_key, endpoint_url)
 
     def get_secret(self, secret_name):
         """
@@ -46,6 +29,11 @@ class SecretsManager:
             raise e
 
 
+def check_ses(region: str = 'us-east-1'):
+    """Func to verify the SES credentials with a cheap API call, raises on failure"""
+    get_client('ses', region, settings.get('mail_access'), settings.get('mail_secret')).get_send_quota()
+
+
 def send_email_smtp(recipient: str, subject: str, message: str, charset='UTF-8', sender: str = "web3m_test@coart.space",
                     region: str = 'us-east-1'):
     """
@@ -60,12 +48,8 @@ def send_email_smtp(recipient: str, subject: str, message: str, charset='UTF-8',
         region: str region
 
     """
-    # Create a new SES client
-    client = boto3.client('ses',
-                          region_name=region,
-                          aws_access_key_id=configuration.get('mail_access'),
-                          aws_secret_access_key=configuration.get('mail_secret')
-                          )
+    # Reuse the pooled SES client
+    client = get_client('ses', region, settings.get('mail_access'), settings.get('mail_secret'))
 
     try:
         # Provide the contents of the email.
@@ -90,11 +74,3 @@ def send_email_smtp(recipient: str, subject: str, message: str, charset='UTF-8',
     except NoCredentialsError:
         print("Credentials not available")
 
-
-# load configuration
-configuration = upload_configuration()
-
-# initialize secret manager
-aws_secrets = SecretsManager(configuration.get('aws_access_key'), configuration.get('aws_secret_key'),
-                             configuration.get('aws_region_name'))
-secret_manager_keys = aws_secrets.get_secret('web3m-test-secrets')
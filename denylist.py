@@ -0,0 +1,122 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, select
+
+from models import RevokedToken, db, insert_ignoring_conflicts
+
+
+def _key(jti: str) -> int:
+    """64-bit digest of a jti, a small int instead of a 36 character string per entry"""
+    return int.from_bytes(hashlib.blake2b(jti.encode(), digest_size=8).digest(), 'big')
+
+
+class TokenDenylist:
+    """
+    Ids (jti) of logged out tokens, checked on every jwt_required request.
+    The revoked_tokens table is the shared record. Every process keeps a copy in
+    sets bucketed by token expiry: a check is one set lookup in the bucket of the
+    token's `exp`, and a bucket is dropped whole once all of its tokens have
+    expired. The copy picks up rows revoked elsewhere every `sync_interval` seconds.
+    """
+
+    # rows revoked this long before the last sync are read again, covers commit delays and clock skew
+    SYNC_MARGIN = timedelta(seconds=30)
+
+    def __init__(self, bucket_seconds: float = 3600, sync_interval: float = 1):
+        self.bucket_seconds = bucket_seconds
+        self.sync_interval = sync_interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        self._synced_monotonic = float('-inf')
+        self._purged_bucket = None
+
+    def _bucket(self, exp: float) -> int:
+        return int(exp // self.bucket_seconds)
+
+    def add(self, jti: str, exp: float):
+        """Add to this process's copy only, revoke() records the token for every process"""
+        if exp <= time.time():
+            return
+        with self._lock:
+            self._buckets.setdefault(self._bucket(exp), set()).add(_key(jti))
+
+    def contains(self, jti: str, exp: float) -> bool:
+        self.maybe_sync()
+        bucket = self._buckets.get(self._bucket(exp))
+        return bucket is not None and _key(jti) in bucket
+
+    def revoke(self, payloads: list):
+        """Record decoded tokens as logged out, in their own transaction"""
+        rows = [{'jti': payload['jti'], 'expires_at': datetime.utcfromtimestamp(payload['exp']),
+                 'revoked_at': datetime.utcnow()} for payload in payloads]
+        if rows:
+            with db.engine.begin() as connection:
+                # logging out twice is not an error
+                connection.execute(insert_ignoring_conflicts(RevokedToken), rows)
+        for payload in payloads:
+            self.add(payload['jti'], payload['exp'])
+
+    def maybe_sync(self):
+        if time.monotonic() - self._synced_monotonic < self.sync_interval:
+            return
+        # one thread syncs, the others check against the current copy
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            # keep serving from the copy, the next check retries
+            print(f"Token denylist sync failed: {e}")
+            self._synced_monotonic = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def sync(self):
+        """Copy rows revoked since the last sync (all unexpired rows the first time) and drop expired buckets"""
+        started = datetime.utcnow()
+        query = select(RevokedToken.jti, RevokedToken.expires_at).where(RevokedToken.expires_at > started)
+        if self._synced_at is not None:
+            query = query.where(RevokedToken.revoked_at >= self._synced_at - self.SYNC_MARGIN)
+        with db.engine.connect() as connection:
+            rows = connection.execute(query).all()
+
+        current = self._bucket(time.time())
+        with self._lock:
+            for jti, expires_at in rows:
+                exp = (expires_at - datetime(1970, 1, 1)).total_seconds()
+                self._buckets.setdefault(self._bucket(exp), set()).add(_key(jti))
+            for bucket in [bucket for bucket in self._buckets if bucket < current]:
+                del self._buckets[bucket]
+        self._synced_at = started
+        self._synced_monotonic = time.monotonic()
+
+        if self._purged_bucket != current:
+            # once per bucket period, every process may do it, the delete is idempotent
+            self._purged_bucket = current
+            with db.engine.begin() as connection:
+                connection.execute(delete(RevokedToken).where(RevokedToken.expires_at <= started))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(bucket) for bucket in self._buckets.values())
+
+
+def get_denylist() -> TokenDenylist:
+    """Token denylist of the current app, created with defaults if init_denylist was not called"""
+    denylist = current_app.extensions.get('token_denylist')
+    if denylist is None:
+        denylist = current_app.extensions.setdefault('token_denylist', TokenDenylist())
+    return denylist
+
+
+def init_denylist(application) -> TokenDenylist:
+    """Func to configure the logged out token denylist from the app config"""
+    denylist = TokenDenylist(bucket_seconds=float(application.config.get('TOKEN_DENYLIST_BUCKET', 3600)),
+                             sync_interval=float(application.config.get('TOKEN_DENYLIST_SYNC_INTERVAL', 1)))
+    application.extensions['token_denylist'] = denylist
+    return denylist
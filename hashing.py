@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from itertools import repeat
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from metrics import PASSWORD_HASH_LATENCY
+from profiling import record_span
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full and the request should be retried later"""
+
+
+class PasswordHasher:
+    """
+    Password hashing service.
+    With workers > 0 hashes run in a bounded process pool so they do not hold the
+    request thread's interpreter; with workers = 0 they run inline.
+    """
+
+    def __init__(self, method: str = 'scrypt', workers: int = 0, max_pending: int = None, timeout: float = 10):
+        self._executor = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.configure(method, workers, max_pending, timeout)
+
+    def configure(self, method: str = 'scrypt', workers: int = 0, max_pending: int = None, timeout: float = 10):
+        """
+        :param method: werkzeug hash method and cost, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+        :param workers: size of the process pool, 0 hashes inline
+        :param max_pending: hashes allowed in flight before HashingBusy is raised
+        :param timeout: seconds to wait for a queued hash
+        """
+        self.shutdown()
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending or max(workers, 1) * 8
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._current_prefix = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Lazily start the pool, a forked child starts its own"""
+        if self._pid != os.getpid():
+            self._executor, self._pid, self._lock = None, os.getpid(), threading.Lock()
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(self.workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        # backpressure: never queue more work than the pool can drain in time
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password hashes in progress')
+        slots = self._slots
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # the slot is held until the pool is done with the hash, not only while this request waits for it
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # a hash that has not started is dropped, a running one keeps its slot until it finishes
+            future.cancel()
+            raise HashingBusy('Timed out waiting for the password hashing pool')
+
+    def _timed(self, operation: str, func, *args):
+        start = time.perf_counter()
+        try:
+            return self._run(func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            PASSWORD_HASH_LATENCY.labels(operation).observe(elapsed)
+            record_span('hash', elapsed)
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured method and cost"""
+        return self._timed('hash', generate_password_hash, password, self.method)
+
+    def hash_many(self, passwords: list) -> list:
+        """
+        Hash a batch of passwords in parallel across the pool, used by bulk imports.
+        Bulk work bypasses the request backpressure limit and waits as long as needed.
+        """
+        if not self.workers:
+            return [generate_password_hash(password, self.method) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._get_executor().map(generate_password_hash, passwords, repeat(self.method),
+                                             chunksize=chunksize))
+
+    def verify(self, stored_hash: str, password: str) -> bool:
+        """Check a password against a stored hash"""
+        return self._timed('verify', check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """True if the stored hash was made with another method or cost than the configured one"""
+        if self._current_prefix is None:
+            # werkzeug fills in default costs, so read them back from a real hash once
+            self._current_prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return stored_hash.split('$', 1)[0] != self._current_prefix
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+def init_hashing(application):
+    """Func to configure the process-wide password hasher from the app config"""
+    config = application.config
+    password_hasher.configure(
+        method=config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        workers=int(config.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)),
+        max_pending=int(config.get('PASSWORD_HASH_MAX_PENDING', 0)) or None,
+        timeout=float(config.get('PASSWORD_HASH_TIMEOUT', 10)),
+    )
+    return password_hasher
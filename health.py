@@ -0,0 +1,90 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from config import settings
+from models import db
+
+
+def check_database():
+    """SELECT 1 on a pooled connection, pre-ping replaces it first if it went stale"""
+    with db.engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def check_mail(application):
+    application.extensions['outbox'].transport.check()
+
+
+def check_secrets():
+    # served from the provider cache, a stale secret is refreshed in the background
+    settings.secrets()
+
+
+class ReadinessProbe:
+    """
+    Readiness checks with cached results. Each check runs at most once per `ttl`
+    seconds per process, so frequent load balancer probes do not add load on the
+    database or the AWS APIs.
+    """
+
+    def __init__(self, application, checks: list, ttl: float = 5):
+        self.application = application
+        self.ttl = ttl
+        available = {
+            'db': check_database,
+            'mail': lambda: check_mail(application),
+            'secrets': check_secrets,
+        }
+        unknown = set(checks) - set(available)
+        if unknown:
+            raise ValueError(f"Unknown readiness checks {sorted(unknown)}, use {sorted(available)}")
+        self.checks = {name: available[name] for name in checks}
+        self._results = {}
+        self._locks = {name: threading.Lock() for name in self.checks}
+
+    def _run(self, name: str) -> dict:
+        cached = self._results.get(name)
+        if cached is not None and time.monotonic() - cached['_at'] < self.ttl:
+            return cached
+        with self._locks[name]:
+            # another request may have refreshed it while we waited
+            cached = self._results.get(name)
+            if cached is not None and time.monotonic() - cached['_at'] < self.ttl:
+                return cached
+            start = time.perf_counter()
+            result = {'ok': True}
+            try:
+                self.checks[name]()
+            except Exception as e:
+                result = {'ok': False, 'error': str(e) or type(e).__name__}
+            result.update(latency_ms=round((time.perf_counter() - start) * 1000, 2),
+                          checked_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                          _at=time.monotonic())
+            self._results[name] = result
+            return result
+
+    def status(self) -> tuple:
+        """:return: (ready, {check name: result})"""
+        results = {name: {key: value for key, value in self._run(name).items() if key != '_at'}
+                   for name in self.checks}
+        return all(result['ok'] for result in results.values()), results
+
+
+def get_readiness_probe(application) -> ReadinessProbe:
+    probe = application.extensions.get('readiness')
+    if probe is None:
+        probe = application.extensions.setdefault('readiness', ReadinessProbe(application, ['db']))
+    return probe
+
+
+def init_health(application) -> ReadinessProbe:
+    """Func to configure the readiness checks, READINESS_CHECKS is a comma separated subset of db,mail,secrets"""
+    checks = application.config.get('READINESS_CHECKS', 'db')
+    if isinstance(checks, str):
+        checks = [name.strip() for name in checks.split(',') if name.strip()]
+    probe = ReadinessProbe(application, checks, ttl=float(application.config.get('READINESS_CACHE_TTL', 5)))
+    application.extensions['readiness'] = probe
+    return probe
@@ -0,0 +1,142 @@
+import csv
+import json
+from itertools import islice
+from marshmallow import EXCLUDE, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from hashing import password_hasher
+from models import db, Users, normalize
+from serializers import UserRegistrationSchema
+
+
+def read_rows(stream, fmt: str):
+    """
+    Stream user rows from a JSONL or CSV text stream without loading it into memory.
+    Malformed JSON lines are yielded as the exception so they are reported per row.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as err:
+                    yield err
+    else:
+        raise ValueError(f"Unsupported import format {fmt}, use jsonl or csv")
+
+
+class UserImport:
+    """
+    Bulk user import. Rows are validated with UserRegistrationSchema(many=True),
+    deduplicated against the input and the database with set-based queries,
+    hashed in parallel and inserted one batch per executemany. Bad rows are
+    reported and skipped without aborting the job.
+    """
+
+    def __init__(self, batch_size: int = 1000, confirmed: bool = False, hasher=password_hasher,
+                 max_reported_failures: int = 1000, bulk: bool = True):
+        """
+        :param bulk: hash a batch across the whole pool without waiting for a free slot (CLI),
+            otherwise one hash at a time through the pool's backpressure, which may raise HashingBusy
+        """
+        self.batch_size = batch_size
+        self.confirmed = confirmed
+        self.hasher = hasher
+        self.bulk = bulk
+        self.max_reported_failures = max_reported_failures
+        self.schema = UserRegistrationSchema(many=True, unknown=EXCLUDE)
+        self.seen_emails, self.seen_usernames = set(), set()
+        self.total = self.imported = self.failed = 0
+        self.failures = []
+
+    def fail(self, row: int, errors):
+        self.failed += 1
+        if len(self.failures) < self.max_reported_failures:
+            self.failures.append({'row': row, 'errors': errors})
+
+    def run(self, rows) -> dict:
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return self.report()
+            self.import_batch(batch, first_row=self.total + 1)
+            self.total += len(batch)
+
+    def report(self) -> dict:
+        return {'total': self.total, 'imported': self.imported, 'failed': self.failed, 'failures': self.failures}
+
+    def validate(self, batch: list, first_row: int) -> list:
+        """:return: (row number, data) for every valid row"""
+        parsed = [(n, row) for n, row in enumerate(batch, first_row) if isinstance(row, dict)]
+        for n, row in enumerate(batch, first_row):
+            if not isinstance(row, dict):
+                self.fail(n, {'_row': [str(row) if isinstance(row, Exception) else 'Expected an object']})
+
+        try:
+            loaded, errors = self.schema.load([row for _, row in parsed]), {}
+        except ValidationError as err:
+            loaded, errors = err.valid_data, err.messages
+        for index, messages in errors.items():
+            self.fail(parsed[index][0], messages)
+        return [(parsed[i][0], data) for i, data in enumerate(loaded) if i not in errors]
+
+    def deduplicate(self, valid: list) -> list:
+        """Drop rows whose email or username repeats earlier input or exists in the database"""
+        emails = {normalize(data['email']) for _, data in valid}
+        usernames = {normalize(data['username']) for _, data in valid}
+        existing_emails = set(db.session.scalars(
+            select(Users.email_normalized).where(Users.email_normalized.in_(emails))))
+        existing_usernames = set(db.session.scalars(
+            select(Users.username_normalized).where(Users.username_normalized.in_(usernames))))
+
+        unique = []
+        for n, data in valid:
+            email, username = normalize(data['email']), normalize(data['username'])
+            errors = {}
+            if email in existing_emails or email in self.seen_emails:
+                errors['email'] = ['Email already exists']
+            if username in existing_usernames or username in self.seen_usernames:
+                errors['username'] = ['Username already exists']
+            if errors:
+                self.fail(n, errors)
+                continue
+            self.seen_emails.add(email)
+            self.seen_usernames.add(username)
+            unique.append((n, data))
+        return unique
+
+    def import_batch(self, batch: list, first_row: int):
+        unique = self.deduplicate(self.validate(batch, first_row))
+        if not unique:
+            return
+
+        passwords = [data['password'] for _, data in unique]
+        hashes = self.hasher.hash_many(passwords) if self.bulk else [self.hasher.hash(p) for p in passwords]
+        values = [{
+            'username': data['username'],
+            'username_normalized': normalize(data['username']),
+            'email': data['email'],
+            'email_normalized': normalize(data['email']),
+            'password': password_hash,
+            'email_confirmed': self.confirmed,
+        } for (_, data), password_hash in zip(unique, hashes)]
+
+        try:
+            db.session.execute(insert(Users), values)
+            db.session.commit()
+            self.imported += len(values)
+        except IntegrityError:
+            # a concurrent signup took one of the names, insert row by row to find it
+            db.session.rollback()
+            for (n, _), row in zip(unique, values):
+                try:
+                    db.session.execute(insert(Users), [row])
+                    db.session.commit()
+                    self.imported += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    self.fail(n, {'_row': ['Email or Username already exists']})
@@ -0,0 +1,127 @@
+import json
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+from jwt.exceptions import InvalidTokenError
+
+ALGORITHMS = {
+    'RS256': RSAAlgorithm,
+    'EdDSA': OKPAlgorithm,
+}
+
+
+class SigningKey:
+    """One asymmetric JWT key identified by its kid"""
+
+    def __init__(self, kid: str, algorithm: str, private_key: str = None, public_key: str = None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unsupported JWT algorithm {algorithm}, use one of {list(ALGORITHMS)}")
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        if public_key is None:
+            # derive the public half so the config only needs the private key
+            public_key = serialization.load_pem_private_key(private_key.encode(), password=None).public_key() \
+                .public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+        self.public_key = public_key
+
+    def jwk(self) -> dict:
+        """Public key in JWK format"""
+        key = ALGORITHMS[self.algorithm].to_jwk(serialization.load_pem_public_key(self.public_key.encode()),
+                                                as_dict=True)
+        key.update({'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'})
+        return key
+
+
+class KeyRing:
+    """
+    Set of JWT keys. The active key signs new tokens, every key in the ring
+    verifies, so retiring keys stay valid until the tokens they signed expire.
+    """
+
+    def __init__(self, keys: list, active_kid: str = None):
+        self.keys = {key.kid: key for key in keys}
+        if active_kid is None:
+            signing = [key.kid for key in keys if key.private_key]
+            active_kid = signing[-1] if signing else None
+        if active_kid is not None and not self.keys[active_kid].private_key:
+            raise ValueError(f"Active JWT key {active_kid} has no private key")
+        self.active_kid = active_kid
+        self._jwks = None
+
+    @classmethod
+    def from_config(cls, keys, active_kid: str = None) -> 'KeyRing':
+        """
+        :param keys: list (or JSON string) of {"kid", "alg", "private_key", "public_key"} with PEM values
+        """
+        if isinstance(keys, str):
+            keys = json.loads(keys)
+        return cls([SigningKey(key['kid'], key.get('alg', 'RS256'), key.get('private_key'), key.get('public_key'))
+                    for key in keys or []], active_kid)
+
+    @property
+    def active(self) -> SigningKey:
+        return self.keys[self.active_kid]
+
+    @property
+    def algorithms(self) -> list:
+        return sorted({key.algorithm for key in self.keys.values()})
+
+    def get(self, kid: str) -> SigningKey:
+        return self.keys.get(kid)
+
+    def jwks(self) -> dict:
+        """JSON Web Key Set of all verification keys, built once"""
+        if self._jwks is None:
+            self._jwks = {'keys': [key.jwk() for key in self.keys.values()]}
+        return self._jwks
+
+
+def generate_key(algorithm: str = 'RS256') -> str:
+    """Create a new private key as PEM"""
+    if algorithm == 'RS256':
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == 'EdDSA':
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"Unsupported JWT algorithm {algorithm}, use one of {list(ALGORITHMS)}")
+    return private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                     serialization.NoEncryption()).decode()
+
+
+def init_keys(application, jwt) -> KeyRing:
+    """
+    Func to switch token signing to the asymmetric keys in JWT_SIGNING_KEYS.
+    Without keys the app keeps signing with HS256 and JWT_SECRET_KEY.
+    """
+    config = application.config
+    ring = KeyRing.from_config(config.get('JWT_SIGNING_KEYS'), config.get('JWT_ACTIVE_KID'))
+    application.extensions['jwt_keys'] = ring
+    if not ring.keys:
+        return ring
+    if ring.active_kid is None:
+        raise ValueError('JWT_SIGNING_KEYS needs at least one key with a private key')
+
+    # HS256 tokens issued before the switch stay valid until they expire if allowed
+    accept_legacy = bool(config.get('JWT_ACCEPT_LEGACY_HS256', False))
+    config['JWT_ALGORITHM'] = ring.active.algorithm
+    config['JWT_DECODE_ALGORITHMS'] = ring.algorithms + (['HS256'] if accept_legacy else [])
+
+    @jwt.additional_headers_loader
+    def add_kid_header(identity):
+        return {'kid': ring.active_kid}
+
+    @jwt.encode_key_loader
+    def encode_key(identity):
+        return ring.active.private_key
+
+    @jwt.decode_key_loader
+    def decode_key(jwt_header, jwt_payload):
+        key = ring.get(jwt_header.get('kid'))
+        if key is not None and key.algorithm == jwt_header.get('alg'):
+            return key.public_key
+        if accept_legacy and jwt_header.get('alg') == 'HS256' and 'kid' not in jwt_header:
+            return config['JWT_SECRET_KEY']
+        raise InvalidTokenError('Token was not signed by a known key')
+
+    return ring
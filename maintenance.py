@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, or_, select
+
+from cache import get_user_cache
+from metrics import UNCONFIRMED_PURGED, PURGE_BATCH_LATENCY
+from models import ArchivedUser, EmailOutbox, Users, db
+
+
+class UnconfirmedPurge:
+    """
+    Removes accounts whose email was not confirmed within `max_age`, optionally
+    copying them to archived_users first. Works in keyset batches on id: candidates
+    are read without locks, then one short transaction per batch locks them by
+    primary key and removes those still stale, with a pause in between, so other
+    rows of the users table are never locked. A user confirming while the job runs
+    is either kept or was already gone.
+    """
+
+    def __init__(self, max_age: timedelta, batch_size: int = 500, pause: float = 0.1, archive: bool = False,
+                 echo=print):
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.pause = pause
+        self.archive = archive
+        self.echo = echo
+
+    def _stale(self, cutoff: datetime):
+        return (or_(Users.email_confirmed.is_(False), Users.email_confirmed.is_(None)), Users.date < cutoff)
+
+    def run(self, dry_run: bool = False) -> dict:
+        """
+        Purge until no stale account is left.
+        :param dry_run: count the accounts without removing them
+        :return: dict with the number of purged (or found) accounts, batches and seconds taken
+        """
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - self.max_age
+        users = Users.__table__
+        cursor, purged, batches = 0, 0, 0
+        action = 'archived' if self.archive else 'deleted'
+        while True:
+            batch_started = time.perf_counter()
+            # a plain read takes no locks, unlike a locking range scan over the unindexed stale condition
+            with db.engine.connect() as connection:
+                ids = connection.execute(select(users.c.id).where(users.c.id > cursor, *self._stale(cutoff))
+                                         .order_by(users.c.id).limit(self.batch_size)).scalars().all()
+            if not ids:
+                break
+            cursor = ids[-1]
+            batches += 1
+            if dry_run:
+                purged += len(ids)
+            else:
+                with db.engine.begin() as connection:
+                    # locks the candidates by primary key only, an account confirmed since the read is kept
+                    rows = connection.execute(
+                        select(users.c.id, users.c.user_id, users.c.username, users.c.email, users.c.date)
+                        .where(users.c.id.in_(ids), *self._stale(cutoff)).with_for_update()).all()
+                    if rows:
+                        if self.archive:
+                            connection.execute(insert(ArchivedUser.__table__), [
+                                {'id': row.id, 'user_id': row.user_id, 'username': row.username,
+                                 'email': row.email, 'date': row.date, 'archived_at': datetime.utcnow()}
+                                for row in rows])
+                        connection.execute(delete(users).where(users.c.id.in_([row.id for row in rows])))
+                        # confirmation emails still waiting in the outbox for the removed accounts
+                        connection.execute(delete(EmailOutbox.__table__).where(
+                            EmailOutbox.recipient.in_([row.email for row in rows]),
+                            EmailOutbox.status.in_(('pending', 'sending'))))
+                purged += len(rows)
+                cache = get_user_cache()
+                for row in rows:
+                    cache.invalidate(row.user_id, row.email)
+                UNCONFIRMED_PURGED.labels(action).inc(len(rows))
+                PURGE_BATCH_LATENCY.observe(time.perf_counter() - batch_started)
+            self.echo(f"  {'found' if dry_run else action} {purged} unconfirmed accounts (id <= {cursor})")
+            if self.pause:
+                time.sleep(self.pause)
+        return {'purged': purged, 'batches': batches, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+class PurgeScheduler:
+    """Runs the purge every `interval` seconds in a background thread, started once per process"""
+
+    def __init__(self, app, purge: UnconfirmedPurge, interval: float):
+        self.app = app
+        self.purge = purge
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def run_once(self) -> dict:
+        with self.app.app_context():
+            return self.purge.run()
+
+    def run(self):
+        # spread the workers of a pre-forked server over the interval
+        while not self._stopped.wait(self.interval * random.uniform(0.5, 1.0)):
+            try:
+                report = self.run_once()
+                print(f"Purged {report['purged']} unconfirmed accounts in {report['seconds']}s")
+            except Exception as e:
+                print(f"Unconfirmed account purge failed: {e}")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self.run, name='unconfirmed-purge', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def purge_from_config(config, echo=print) -> UnconfirmedPurge:
+    return UnconfirmedPurge(
+        max_age=timedelta(seconds=float(config.get('PURGE_UNCONFIRMED_AFTER', 7 * 24 * 3600))),
+        batch_size=int(config.get('PURGE_UNCONFIRMED_BATCH_SIZE', 500)),
+        pause=float(config.get('PURGE_UNCONFIRMED_PAUSE', 0.1)),
+        archive=bool(config.get('PURGE_UNCONFIRMED_ARCHIVE', False)),
+        echo=echo,
+    )
+
+
+def init_maintenance(application) -> PurgeScheduler:
+    """
+    Func to schedule the unconfirmed account purge every PURGE_UNCONFIRMED_INTERVAL
+    seconds in each process, off while unset. Like the outbox dispatcher it starts on
+    the first request and not in testing; `flask users purge-unconfirmed` runs it from cron instead.
+    """
+    interval = float(application.config.get('PURGE_UNCONFIRMED_INTERVAL') or 0)
+    if not interval:
+        application.extensions.pop('purge_scheduler', None)
+        return None
+    scheduler = PurgeScheduler(application, purge_from_config(application.config, echo=lambda message: None),
+                               interval)
+    application.extensions['purge_scheduler'] = scheduler
+
+    @application.before_request
+    def start_purge_scheduler():
+        if not application.testing:
+            scheduler.start()
+
+    return scheduler
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, \
+    multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from profiling import record_span
+
+# Metrics live in the process-wide prometheus registry. With PROMETHEUS_MULTIPROC_DIR
+# set before the app is imported, every pre-forked worker writes its values to files
+# in that directory and /metrics aggregates all of them.
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency per resource',
+                            ['endpoint', 'method', 'status'])
+DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'SQL statement execution time', ['operation'],
+                             buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+DB_POOL_WAIT = Histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+                         buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+PASSWORD_HASH_LATENCY = Histogram('password_hash_duration_seconds', 'Password hash and verify time, queueing included',
+                                  ['operation'])
+EMAIL_SEND_LATENCY = Histogram('email_send_duration_seconds', 'Outbox email delivery time', ['outcome'])
+UNCONFIRMED_PURGED = Counter('unconfirmed_users_purged_total', 'Unconfirmed accounts removed by the purge job',
+                             ['action'])
+PURGE_BATCH_LATENCY = Histogram('unconfirmed_purge_batch_duration_seconds', 'Time per unconfirmed account purge batch')
+RESEND_SUPPRESSED = Counter('confirmation_resends_suppressed_total',
+                            'Resend confirmation requests answered without a new email', ['reason'])
+LOGIN_THROTTLED = Counter('login_throttled_total', 'Sign in attempts rejected by the login throttle', ['scope'])
+
+# statement kinds used as label values, anything else is counted as OTHER
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE'}
+
+_listeners_lock = threading.Lock()
+_listening = False
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    DB_QUERY_LATENCY.labels(operation if operation in SQL_OPERATIONS else 'OTHER').observe(elapsed)
+    record_span('db', elapsed)
+
+
+def _handle_error(context):
+    # failed statements never reach after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+
+def listen_to_engines():
+    """Time every SQL statement of every engine, and of a traced request, registered once per process"""
+    global _listening
+    with _listeners_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+            _listening = True
+
+
+def timed_request(view):
+    """Resource decorator observing latency per endpoint, method and status"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        status = 500
+        try:
+            try:
+                response = view(*args, **kwargs)
+            except Exception as e:
+                # run the app's error handlers here, as flask would, to record the status they answer with
+                response = current_app.make_response(current_app.handle_user_exception(e))
+            status = response.status_code
+            return response
+        finally:
+            REQUEST_LATENCY.labels(request.endpoint or 'unknown', request.method, str(status)).observe(
+                time.perf_counter() - start)
+    return wrapper
+
+
+def metrics_enabled(application) -> bool:
+    return bool(application.config.get('METRICS_ENABLED', True))
+
+
+def exposition() -> tuple:
+    """Current metrics in the Prometheus text format, merged across workers in multiprocess mode"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Func for the server's worker exit hook, drops the live values of a dead worker"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def init_metrics(application):
+    """
+    Func to instrument the database layer. Called before db.init_app, so that
+    server engines are created with the timed pool.
+    """
+    if not metrics_enabled(application):
+        return
+    uri = application.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if not uri.startswith('sqlite'):
+        # sqlite keeps the pool flask_sqlalchemy picks for it
+        application.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault('poolclass', TimedQueuePool)
+    listen_to_engines()
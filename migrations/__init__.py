@@ -0,0 +1,66 @@
+"""
+Versioned schema migrations.
+
+Each migration module exposes `upgrade(engine, batch_size, pause, echo)`; applied
+versions are recorded in the schema_migrations table. Run them with `flask db upgrade`.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select
+
+from migrations import m0001_normalized_lookup_columns, m0002_users_token_version
+
+MIGRATIONS = [
+    ('0001_normalized_lookup_columns', m0001_normalized_lookup_columns),
+    ('0002_users_token_version', m0002_users_token_version),
+]
+
+metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', String(64), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+class MigrationError(Exception):
+    """Raised when a migration cannot be applied safely"""
+
+
+def applied_versions(engine) -> set:
+    """Versions already recorded in schema_migrations"""
+    metadata.create_all(engine, tables=[schema_migrations])
+    with engine.connect() as conn:
+        return {row.version for row in conn.execute(select(schema_migrations.c.version))}
+
+
+def stamp(engine, versions: list = None):
+    """Record migrations as applied without running them, e.g. after create_all on an empty database"""
+    done = applied_versions(engine)
+    with engine.begin() as conn:
+        for version, _ in MIGRATIONS:
+            if (versions is None or version in versions) and version not in done:
+                conn.execute(schema_migrations.insert().values(version=version, applied_at=datetime.utcnow()))
+
+
+def upgrade(engine, batch_size: int = 1000, pause: float = 0.0, echo=print) -> list:
+    """
+    Apply pending migrations in order.
+    :param batch_size: rows touched per transaction by data backfills
+    :param pause: seconds to sleep between backfill batches, to limit load on a live database
+    :return: list of applied versions
+    """
+    applied = []
+    done = applied_versions(engine)
+    for version, module in MIGRATIONS:
+        if version in done:
+            continue
+        echo(f"Applying {version}")
+        module.upgrade(engine, batch_size=batch_size, pause=pause, echo=echo)
+        stamp(engine, [version])
+        applied.append(version)
+    return applied
+
+
+def has_table(engine, name: str) -> bool:
+    return inspect(engine).has_table(name)
@@ -0,0 +1,17 @@
+from sqlalchemy import inspect, text
+
+
+def online(engine, separator: str = ',') -> str:
+    """MySQL clause that keeps the table readable and writable during DDL"""
+    if engine.dialect.name != 'mysql':
+        return ''
+    return f"{separator} ALGORITHM=INPLACE{separator} LOCK=NONE"
+
+
+def add_column(engine, table: str, column: str, definition: str, echo=print):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    existing = {col['name'] for col in inspect(engine).get_columns(table)}
+    if column not in existing:
+        echo(f"  adding {table}.{column}")
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}{online(engine)}"))
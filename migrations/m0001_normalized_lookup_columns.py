@@ -0,0 +1,101 @@
+"""
+Add lower-cased email/username lookup columns to users, backfill them online in
+keyset batches and put unique indexes on them.
+"""
+import time
+
+from sqlalchemy import inspect, text
+
+from migrations.ddl import add_column, online
+from models import normalize
+
+TABLE = 'users'
+COLUMNS = {
+    'email_normalized': 'email',
+    'username_normalized': 'username',
+}
+INDEXES = {
+    'uq_users_email_normalized': 'email_normalized',
+    'uq_users_username_normalized': 'username_normalized',
+}
+
+
+def add_columns(engine, echo):
+    for column in COLUMNS:
+        # nullable until the backfill is done
+        add_column(engine, TABLE, column, 'VARCHAR(255) NULL', echo)
+
+
+def backfill(engine, batch_size: int, pause: float, echo) -> int:
+    """
+    Fill the normalized columns in small keyset-paginated batches, one short
+    transaction per batch. The values come from models.normalize, the function the
+    app looks users up with; SQL's LOWER/TRIM differ from it on non-ASCII letters and
+    whitespace other than spaces. A row whose email or username changed since it was
+    read is not updated, and like rows written by old code while the backfill runs
+    it is picked up by the next pass. Loops until no row is left.
+    """
+    missing = ' OR '.join(f"{column} IS NULL" for column in COLUMNS)
+    assignments = ', '.join(f"{column} = :{column}" for column in COLUMNS)
+    unchanged = ' AND '.join(f"{source} = :{source}" for source in COLUMNS.values())
+    sources = ', '.join(COLUMNS.values())
+    total = 0
+    while True:
+        cursor, updated = 0, 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(text(f"SELECT id, {sources} FROM {TABLE} WHERE id > :cursor AND ({missing}) "
+                                         f"ORDER BY id LIMIT :limit"),
+                                    {'cursor': cursor, 'limit': batch_size}).mappings().all()
+                if not rows:
+                    break
+                conn.execute(text(f"UPDATE {TABLE} SET {assignments} WHERE id = :id AND {unchanged}"), [
+                    dict(row, **{column: normalize(row[source]) for column, source in COLUMNS.items()})
+                    for row in rows])
+            cursor = rows[-1]['id']
+            updated += len(rows)
+            echo(f"  backfilled {total + updated} rows (id <= {cursor})")
+            if pause:
+                time.sleep(pause)
+        total += updated
+        if not updated:
+            return total
+
+
+def check_duplicates(engine):
+    """Refuse to build unique indexes while case-insensitive duplicates exist"""
+    from migrations import MigrationError
+
+    with engine.connect() as conn:
+        for column in COLUMNS:
+            duplicates = conn.execute(text(f"SELECT {column} FROM {TABLE} GROUP BY {column} "
+                                           f"HAVING COUNT(*) > 1 LIMIT 10")).scalars().all()
+            if duplicates:
+                raise MigrationError(f"Duplicate values in {TABLE}.{column}, resolve them first: {duplicates}")
+
+
+def create_indexes(engine, echo):
+    existing = {index['name'] for index in inspect(engine).get_indexes(TABLE)}
+    for name, column in INDEXES.items():
+        if name not in existing:
+            echo(f"  creating unique index {name}")
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {TABLE} ({column}){online(engine, '')}"))
+
+
+def set_not_null(engine, echo):
+    # SQLite cannot alter a column in place, the ORM always writes the values there anyway
+    if engine.dialect.name != 'mysql':
+        return
+    for column in COLUMNS:
+        echo(f"  setting {TABLE}.{column} NOT NULL")
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE} MODIFY {column} VARCHAR(255) NOT NULL{online(engine)}"))
+
+
+def upgrade(engine, batch_size: int = 1000, pause: float = 0.0, echo=print):
+    add_columns(engine, echo)
+    backfill(engine, batch_size, pause, echo)
+    check_duplicates(engine)
+    create_indexes(engine, echo)
+    set_not_null(engine, echo)
@@ -0,0 +1,9 @@
+"""
+Add the per-user token version that access and refresh tokens are checked against.
+"""
+from migrations.ddl import add_column
+
+
+def upgrade(engine, batch_size: int = 1000, pause: float = 0.0, echo=print):
+    # constant default, so no backfill is needed
+    add_column(engine, 'users', 'token_version', 'INTEGER NOT NULL DEFAULT 0', echo)
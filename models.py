@@ -1,37 +1,197 @@
 import uuid
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import validates
 from datetime import datetime
-from werkzeug.security import generate_password_hash
-from werkzeug.security import check_password_hash
 
-db = SQLAlchemy()
+from hashing import password_hasher
+from replicas import RoutingSession
+
+# reads of replica_reads endpoints may go to a read replica, see replicas.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def normalize(value: str) -> str:
+    """Lookup form of an email or username: trimmed and lower-cased, None for anything but a string"""
+    return value.strip().lower() if isinstance(value, str) else None
+
+
+def engine_options(config) -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS from the DB_* config keys. Every worker process has its
+    own pool, so the server sees up to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('sqlite'):
+        # flask_sqlalchemy picks the pool for sqlite
+        return options
+    options.setdefault('pool_size', int(config.get('DB_POOL_SIZE', 5)))
+    options.setdefault('max_overflow', int(config.get('DB_MAX_OVERFLOW', 5)))
+    options.setdefault('pool_timeout', float(config.get('DB_POOL_TIMEOUT', 10)))
+    # below MySQL's wait_timeout, so the server never closes a connection the pool still holds
+    options.setdefault('pool_recycle', int(config.get('DB_POOL_RECYCLE', 1800)))
+    # a cheap ping on checkout replaces connections dropped by the server or a failover
+    options.setdefault('pool_pre_ping', bool(config.get('DB_POOL_PRE_PING', True)))
+    if uri.startswith('mysql'):
+        timeout = int(config.get('DB_CONNECT_TIMEOUT', 5))
+        connect_args = options.setdefault('connect_args', {})
+        connect_args.setdefault('connect_timeout', timeout)
+        if config.get('DB_READ_TIMEOUT'):
+            connect_args.setdefault('read_timeout', int(config['DB_READ_TIMEOUT']))
+            connect_args.setdefault('write_timeout', int(config['DB_READ_TIMEOUT']))
+    return options
+
+
+def insert_ignoring_conflicts(model):
+    """
+    INSERT statement that skips a row violating a unique constraint instead of failing,
+    so the caller learns about the conflict from rowcount without an extra query.
+    Dialects without such a clause get a plain INSERT and raise IntegrityError.
+    """
+    # core insert on the table, an ORM insert returns no rowcount
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        # values are validated beforehand (lengths included), IGNORE would otherwise truncate or hide bad data
+        return insert(table).prefix_with('IGNORE')
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return insert(table)
 
 
 class Users(db.Model):
     """User model representing a user """
+    __table_args__ = (
+        # case-insensitive uniqueness, also the indexes behind every email/username lookup
+        db.Index('uq_users_email_normalized', 'email_normalized', unique=True),
+        db.Index('uq_users_username_normalized', 'username_normalized', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    # generate unique_id
+    # generate unique_id, unique index is a secondary index next to the sequential primary key
     user_id = db.Column(db.String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
     username = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(255), nullable=False)
+    # kept in sync by the validators below
+    username_normalized = db.Column(db.String(255), nullable=False)
+    email_normalized = db.Column(db.String(255), nullable=False)
     password = db.Column(db.String(255), nullable=False)
     date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     email_confirmed = db.Column(db.Boolean, default=False)
+    # bumped on every change that must invalidate issued tokens
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @validates('username')
+    def _normalize_username(self, key, value):
+        self.username_normalized = normalize(value)
+        return value
+
+    @validates('email')
+    def _normalize_email(self, key, value):
+        self.email_normalized = normalize(value)
+        return value
+
+    @classmethod
+    def find_by_email(cls, email: str):
+        """Case-insensitive lookup by email, served by the unique index"""
+        return cls.query.filter_by(email_normalized=normalize(email)).first()
+
+    @classmethod
+    def insert_unique(cls, username: str, email: str, password_hash: str):
+        """
+        Insert a user in a single statement, relying on the unique indexes instead of a prior SELECT.
+        :return: user_id of the new user, None if the email or username is already taken
+        """
+        user_id = str(uuid.uuid4())
+        result = db.session.execute(insert_ignoring_conflicts(cls), {
+            'user_id': user_id,
+            'username': username,
+            'username_normalized': normalize(username),
+            'email': email,
+            'email_normalized': normalize(email),
+            'password': password_hash,
+        })
+        return user_id if result.rowcount == 1 else None
+
+    @classmethod
+    def taken_fields(cls, username: str, email: str) -> dict:
+        """Per-field errors for an email and username that are already registered"""
+        errors = {}
+        for user in cls.query.filter((cls.email_normalized == normalize(email)) |
+                                     (cls.username_normalized == normalize(username))):
+            if user.email_normalized == normalize(email):
+                errors['email'] = ['Email already exists']
+            if user.username_normalized == normalize(username):
+                errors['username'] = ['Username already exists']
+        return errors
 
     def set_password(self, password):
         """
         Create and set the hashed password.
         """
-        self.password = generate_password_hash(password) # hash password
+        self.password = password_hasher.hash(password) # hash password
 
 
     def check_password(self, password):
         """
         Verify if the provided password matches the hashed password.
         """
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
 
     def __init__(self, username, email, password):
         self.username = username
         self.email = email
         self.set_password(password)
+
+
+class EmailOutbox(db.Model):
+    """Outgoing email written in the same transaction as the change that triggers it"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # dispatcher polls by status and due time
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent | dead
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # dispatcher run that currently holds the row
+    claimed_by = db.Column(db.String(36))
+    last_error = db.Column(db.String(512))
+    date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+class RevokedToken(db.Model):
+    """Logged out token, kept until the token would have expired anyway"""
+    __tablename__ = 'revoked_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    # purge once passed
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    # processes copy the rows revoked since their last sync
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class ArchivedUser(db.Model):
+    """Account removed by the unconfirmed account purge, kept without its password hash"""
+    __tablename__ = 'archived_users'
+
+    # id of the removed users row
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.String(36), nullable=False)
+    username = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(255), nullable=False)
+    # registration time
+    date = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,252 @@
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from flask import current_app
+from sqlalchemy import or_, and_
+
+from controls import check_ses, send_email_smtp
+from metrics import EMAIL_SEND_LATENCY
+from models import db, EmailOutbox
+
+
+class DeliveryError(Exception):
+    """Raised by a transport when a message could not be delivered"""
+
+
+class SesTransport:
+    """Deliver messages through AWS SES"""
+
+    def send(self, recipient: str, subject: str, body: str):
+        if send_email_smtp(recipient, subject, body) != 200:
+            raise DeliveryError('SES did not accept the message')
+
+    def check(self):
+        check_ses()
+
+
+class SmtpTransport:
+    """Deliver messages to an SMTP server, e.g. a local fake sink (python -m aiosmtpd -n)"""
+
+    def __init__(self, host: str = 'localhost', port: int = 1025, sender: str = "web3m_test@coart.space",
+                 timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, recipient: str, subject: str, body: str):
+        message = MIMEMultipart('alternative')
+        message['Subject'] = subject
+        message['From'] = self.sender
+        message['To'] = recipient
+        message.attach(MIMEText(body, 'html', 'utf-8'))
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as server:
+                server.sendmail(self.sender, [recipient], message.as_string())
+        except (smtplib.SMTPException, OSError) as e:
+            raise DeliveryError(str(e))
+
+    def check(self):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as server:
+            server.noop()
+
+
+class MemoryTransport:
+    """Keep messages in memory, used as a local sink in tests and benchmarks"""
+
+    def __init__(self, fail_with: Exception = None):
+        self.sent = []
+        self.fail_with = fail_with
+        self._lock = threading.Lock()
+
+    def send(self, recipient: str, subject: str, body: str):
+        if self.fail_with is not None:
+            raise self.fail_with
+        with self._lock:
+            self.sent.append({'recipient': recipient, 'subject': subject, 'body': body})
+
+    def check(self):
+        if self.fail_with is not None:
+            raise self.fail_with
+
+
+TRANSPORTS = {
+    'ses': lambda config: SesTransport(),
+    'smtp': lambda config: SmtpTransport(config.get('MAIL_SMTP_HOST', 'localhost'),
+                                         int(config.get('MAIL_SMTP_PORT', 1025))),
+    'memory': lambda config: MemoryTransport(),
+}
+
+
+def enqueue_email(recipient: str, subject: str, body: str) -> EmailOutbox:
+    """
+    Add an email to the outbox. The row is only added to the session, so it is
+    committed (or rolled back) together with the caller's transaction.
+    """
+    message = EmailOutbox(recipient=recipient, subject=subject, body=body)
+    db.session.add(message)
+    return message
+
+
+def wake_dispatcher():
+    """Ask the background dispatcher to poll now instead of waiting for its interval"""
+    dispatcher = current_app.extensions.get('outbox')
+    if dispatcher is not None:
+        dispatcher.wake()
+
+
+class OutboxDispatcher:
+    """
+    Drains the email outbox in batches. Failed deliveries are retried with
+    exponential backoff and moved to the 'dead' status after max_attempts.
+    """
+
+    def __init__(self, app, transport, batch_size: int = 50, max_attempts: int = 5, base_delay: float = 30,
+                 max_delay: float = 3600, poll_interval: float = 5, lease: float = 120):
+        self.app = app
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        # claimed rows become visible to other dispatchers again after the lease
+        self.lease = lease
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def backoff(self, attempts: int) -> timedelta:
+        """Delay before the next attempt, doubled per failure with a little jitter"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.8, 1.0))
+
+    def _claim_batch(self) -> list:
+        """Claim due rows for this run so concurrent dispatchers never send the same message"""
+        now = datetime.utcnow()
+        due = or_(
+            and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+            # rows left behind by a dispatcher that died mid-send
+            and_(EmailOutbox.status == 'sending', EmailOutbox.next_attempt_at <= now),
+        )
+        ids = [row.id for row in db.session.query(EmailOutbox.id).filter(due)
+               .order_by(EmailOutbox.next_attempt_at).limit(self.batch_size)]
+        if not ids:
+            return []
+
+        claim = str(uuid.uuid4())
+        db.session.query(EmailOutbox).filter(EmailOutbox.id.in_(ids), due).update(
+            {'status': 'sending', 'claimed_by': claim,
+             'next_attempt_at': now + timedelta(seconds=self.lease)},
+            synchronize_session=False)
+        db.session.commit()
+        return EmailOutbox.query.filter_by(claimed_by=claim, status='sending').all()
+
+    def _deliver(self, message: EmailOutbox):
+        """Send one message and record the outcome on its row"""
+        message.attempts += 1
+        message.claimed_by = None
+        start = time.perf_counter()
+        try:
+            self.transport.send(message.recipient, message.subject, message.body)
+        except Exception as e:
+            message.last_error = str(e)[:512]
+            if message.attempts >= self.max_attempts:
+                message.status = 'dead'
+                print(f"Outbox message {message.id} dead after {message.attempts} attempts: {e}")
+            else:
+                message.status = 'pending'
+                message.next_attempt_at = datetime.utcnow() + self.backoff(message.attempts)
+        else:
+            message.status = 'sent'
+            message.sent_at = datetime.utcnow()
+            message.last_error = None
+        # outcome is sent, pending (retried later) or dead
+        EMAIL_SEND_LATENCY.labels(message.status).observe(time.perf_counter() - start)
+
+    def dispatch_once(self) -> int:
+        """
+        Deliver one batch of due messages.
+        :return: number of messages processed
+        """
+        with self._lock, self.app.app_context():
+            try:
+                batch = self._claim_batch()
+                for message in batch:
+                    self._deliver(message)
+                    # record each outcome right away so a crash never re-sends delivered mail
+                    db.session.commit()
+                return len(batch)
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def run(self):
+        """Dispatch until stopped, draining full batches back to back"""
+        while not self._stopped.is_set():
+            try:
+                processed = self.dispatch_once()
+            except Exception as e:
+                print(f"Outbox dispatch failed: {e}")
+                processed = 0
+
+            if processed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start(self):
+        """Start the dispatcher thread once per process"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self.run, name='outbox-dispatcher', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+
+def init_outbox(application, transport=None) -> OutboxDispatcher:
+    """
+    Func to initialize the outbox dispatcher. The dispatcher thread is started on the
+    first request of each process (so it survives forking) unless the app is testing
+    or OUTBOX_DISPATCHER_ENABLED is false.
+    """
+    config = application.config
+    if transport is None:
+        transport = TRANSPORTS[config.get('MAIL_TRANSPORT', 'ses')](config)
+
+    dispatcher = OutboxDispatcher(
+        application, transport,
+        batch_size=int(config.get('OUTBOX_BATCH_SIZE', 50)),
+        max_attempts=int(config.get('OUTBOX_MAX_ATTEMPTS', 5)),
+        base_delay=float(config.get('OUTBOX_RETRY_DELAY', 30)),
+        max_delay=float(config.get('OUTBOX_MAX_RETRY_DELAY', 3600)),
+        poll_interval=float(config.get('OUTBOX_POLL_INTERVAL', 5)),
+    )
+    application.extensions['outbox'] = dispatcher
+
+    @application.before_request
+    def start_outbox_dispatcher():
+        if not application.testing and application.config.get('OUTBOX_DISPATCHER_ENABLED', True):
+            dispatcher.start()
+
+    return dispatcher
@@ -0,0 +1,18 @@
+import hmac
+from functools import wraps
+from flask import current_app, request
+
+
+def admin_required(func):
+    """
+    Allow the call only with the admin API token in the X-Admin-Token header.
+    Admin endpoints are disabled while ADMIN_API_TOKEN is not configured.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_API_TOKEN')
+        supplied = request.headers.get('X-Admin-Token', '')
+        if not expected or not hmac.compare_digest(supplied.encode(), expected.encode()):
+            return {'message': 'Admin access required'}, 403
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,219 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, request
+from itsdangerous import BadData, URLSafeTimedSerializer
+
+PROFILE_HEADER = 'X-Profile'
+SPAN_KINDS = ('db', 'hash', 'token', 'email')
+
+# spans and start of the request served by the current thread, spans is None while no request is traced
+_trace = threading.local()
+
+
+def record_span(kind: str, seconds: float):
+    """Add time spent in `kind` to the current request's trace, a no-op when it is not traced"""
+    spans = getattr(_trace, 'spans', None)
+    if spans is not None:
+        total = spans.get(kind)
+        spans[kind] = (seconds, 1) if total is None else (total[0] + seconds, total[1] + 1)
+
+
+@contextmanager
+def span(kind: str):
+    """Time the block as a `kind` span of the current request's trace"""
+    if getattr(_trace, 'spans', None) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(kind, time.perf_counter() - start)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler for selected requests. While at least one request is
+    profiled, a background thread samples the stacks of the threads serving them
+    every `interval` seconds and counts them as collapsed stacks
+    ('request;file:function;... count', the input of flamegraph.pl and speedscope).
+    Up to `max_stacks` distinct stacks are kept, samples of further ones are dropped.
+    """
+
+    def __init__(self, interval: float = 0.005, max_stacks: int = 10000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self, label: str):
+        """Sample the current thread, under `label`, until end() is called"""
+        with self._lock:
+            self._threads[threading.get_ident()] = label
+            # the sampler of a forked parent does not run in the child
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def end(self):
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                threads = dict(self._threads)
+                if not threads:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for ident, label in threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._record(label, frame)
+            del frames
+            time.sleep(self.interval)
+
+    def _record(self, label: str, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        names.append(label)
+        stack = ';'.join(reversed(names))
+        with self._lock:
+            self.samples += 1
+            if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                self.stacks[stack] += 1
+            else:
+                self.dropped += 1
+
+    def collapsed(self) -> str:
+        """Samples so far in the collapsed stack format, most frequent first"""
+        with self._lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def reset(self) -> int:
+        with self._lock:
+            samples, self.samples, self.dropped = self.samples, 0, 0
+            self.stacks.clear()
+        return samples
+
+
+class RequestProfiling:
+    """
+    Per-app profiling settings: requests are profiled at `sample_rate` or when they
+    carry a header token signed with the app's SECRET_KEY, and a span breakdown
+    is logged for requests slower than `slow_threshold` seconds. A rate or threshold of 0 turns that part off.
+    """
+
+    def __init__(self, profiler: SamplingProfiler, sample_rate: float = 0, slow_threshold: float = 0,
+                 header_max_age: int = 600):
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.header_max_age = header_max_age
+
+    def _serializer(self) -> URLSafeTimedSerializer:
+        return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='profile')
+
+    def header_token(self) -> str:
+        """Value of the X-Profile header that profiles a request for the next header_max_age seconds"""
+        return self._serializer().dumps('profile')
+
+    def _header_valid(self, token: str) -> bool:
+        try:
+            return self._serializer().loads(token, max_age=self.header_max_age) == 'profile'
+        except BadData:
+            return False
+
+    def start(self):
+        by_header = False
+        token = request.headers.get(PROFILE_HEADER)
+        if token:
+            by_header = self._header_valid(token)
+        sampled = by_header or (self.sample_rate and random.random() < self.sample_rate)
+        if not sampled and not self.slow_threshold:
+            return
+        _trace.spans = {}
+        _trace.started = time.perf_counter()
+        _trace.by_header = by_header
+        _trace.sampled = bool(sampled)
+        if sampled:
+            self.profiler.begin(f'{request.method} {request.url_rule or request.path}')
+
+    def finish(self, response):
+        spans = getattr(_trace, 'spans', None)
+        if spans is None:
+            return response
+        total = time.perf_counter() - _trace.started
+        if _trace.by_header:
+            # the caller asked for it, the breakdown goes back in the Server-Timing header
+            response.headers['Server-Timing'] = ', '.join(
+                [f'{kind};dur={spans[kind][0] * 1000:.1f}' for kind in SPAN_KINDS if kind in spans] +
+                [f'total;dur={total * 1000:.1f}'])
+        if self.slow_threshold and total >= self.slow_threshold:
+            print(f"Slow request {request.method} {request.path} {response.status_code} {total * 1000:.1f}ms: "
+                  + breakdown(spans, total))
+        return response
+
+    def teardown(self, exc=None):
+        if getattr(_trace, 'sampled', False):
+            self.profiler.end()
+        _trace.spans = None
+        _trace.sampled = False
+
+
+def breakdown(spans: dict, total: float) -> str:
+    """'db=3.1ms/4 hash=790.2ms/1 ... other=17.8ms', time and count per span kind"""
+    parts = [f'{kind}={spans[kind][0] * 1000:.1f}ms/{spans[kind][1]}' if kind in spans else f'{kind}=0.0ms/0'
+             for kind in SPAN_KINDS]
+    other = total - sum(seconds for seconds, _ in spans.values())
+    return ' '.join(parts + [f'other={max(other, 0) * 1000:.1f}ms'])
+
+
+def get_profiling() -> RequestProfiling:
+    """Profiling of the current app, created with sampling and slow request logging off if needed"""
+    profiling = current_app.extensions.get('profiling')
+    if profiling is None:
+        profiling = current_app.extensions.setdefault('profiling', RequestProfiling(SamplingProfiler()))
+    return profiling
+
+
+def init_profiling(application) -> RequestProfiling:
+    """
+    Func to set up request profiling from the PROFILE_* and SLOW_REQUEST_THRESHOLD config
+    keys. With PROFILING_ENABLED off no hook is installed.
+    """
+    config = application.config
+    profiling = RequestProfiling(
+        SamplingProfiler(interval=float(config.get('PROFILE_INTERVAL', 0.005))),
+        sample_rate=float(config.get('PROFILE_SAMPLE_RATE', 0)),
+        slow_threshold=float(config.get('SLOW_REQUEST_THRESHOLD', 0)),
+        header_max_age=int(config.get('PROFILE_HEADER_MAX_AGE', 600)),
+    )
+    application.extensions['profiling'] = profiling
+    if not config.get('PROFILING_ENABLED', True):
+        return profiling
+
+    # the statement timing of the metrics module records the db spans
+    from metrics import listen_to_engines
+    listen_to_engines()
+    application.before_request(profiling.start)
+    application.after_request(profiling.finish)
+    application.teardown_request(profiling.teardown)
+    return profiling
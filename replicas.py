@@ -0,0 +1,162 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+# db.session.info keys
+READS_KEY = 'replica_reads'
+PINNED_KEY = 'pinned_to_primary'
+STRATEGIES = ('round_robin', 'least_loaded')
+
+
+class ReplicaSet:
+    """
+    Read replica engines with round-robin or least-loaded (fewest checked out
+    connections) selection. A replica whose connection or query fails with an
+    operational error is ejected for `eject_seconds`, reads go to the other
+    replicas, or to the primary when none is left, until it is tried again.
+    """
+
+    def __init__(self, engines: list, strategy: str = 'round_robin', eject_seconds: float = 30):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica strategy {strategy}, use one of {', '.join(STRATEGIES)}")
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._in_use = {engine: 0 for engine in self.engines}
+        # engine -> monotonic time it may be used again
+        self._ejected = {}
+        for engine in self.engines:
+            event.listen(engine, 'checkout', lambda *args, engine=engine: self._count(engine, 1))
+            event.listen(engine, 'checkin', lambda *args, engine=engine: self._count(engine, -1))
+            event.listen(engine, 'handle_error', lambda context, engine=engine: self._on_error(engine, context))
+
+    def _count(self, engine, delta: int):
+        with self._lock:
+            self._in_use[engine] = max(0, self._in_use[engine] + delta)
+
+    def _on_error(self, engine, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.eject(engine)
+
+    def eject(self, engine):
+        with self._lock:
+            ejected = self._ejected.get(engine, 0) > time.monotonic()
+            self._ejected[engine] = time.monotonic() + self.eject_seconds
+        if not ejected:
+            print(f"Replica {engine.url!r} ejected for {self.eject_seconds}s")
+
+    def choose(self):
+        """A healthy replica engine, None when every replica is ejected"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [engine for engine in self.engines if self._ejected.get(engine, 0) <= now]
+            if not healthy:
+                return None
+            start = next(self._turn) % len(healthy)
+            healthy = healthy[start:] + healthy[:start]
+            if self.strategy == 'least_loaded':
+                # rotated first, so ties are spread evenly
+                return min(healthy, key=self._in_use.__getitem__)
+            return healthy[0]
+
+    def status(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [{'url': repr(engine.url), 'in_use': self._in_use[engine],
+                     'ejected_for': round(max(0.0, self._ejected.get(engine, 0) - now), 1)}
+                    for engine in self.engines]
+
+    def dispose(self, close: bool = True):
+        for engine in self.engines:
+            engine.dispose(close=close)
+        with self._lock:
+            self._in_use = {engine: 0 for engine in self.engines}
+
+
+class RoutingSession(Session):
+    """
+    db.session that sends the SELECTs of opted-in requests (see replica_reads) to a
+    replica. Once the session flushed or executed anything else it is pinned to the
+    primary, so the rest of the request reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(READS_KEY) and not self.info.get(PINNED_KEY):
+            read = (not self._flushing and getattr(clause, 'is_select', False)
+                    and getattr(clause, '_for_update_arg', None) is None)
+            if not read:
+                self.info[PINNED_KEY] = True
+            else:
+                replicas = current_app.extensions.get('replicas')
+                engine = replicas.choose() if replicas is not None else None
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _session():
+    return current_app.extensions['sqlalchemy'].session()
+
+
+def replica_reads(func):
+    """Decorator for read-only endpoints, lets their queries go to a replica"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if current_app.extensions.get('replicas') is not None:
+            _session().info[READS_KEY] = True
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def replica_reads_active() -> bool:
+    """True when the next SELECT of this app context may be served by a replica"""
+    if not has_app_context() or current_app.extensions.get('replicas') is None:
+        return False
+    info = _session().info
+    return bool(info.get(READS_KEY) and not info.get(PINNED_KEY))
+
+
+@contextmanager
+def use_primary():
+    """Send the reads in this block to the primary, for rows another request may have just written"""
+    if current_app.extensions.get('replicas') is None:
+        yield
+        return
+    info = _session().info
+    previous = info.get(READS_KEY, False)
+    info[READS_KEY] = False
+    try:
+        yield
+    finally:
+        info[READS_KEY] = previous
+
+
+def init_replicas(application) -> ReplicaSet:
+    """
+    Func to create the read replica engines. SQLALCHEMY_REPLICAS is a list or a comma
+    separated string of database urls, REPLICA_STRATEGY round_robin or least_loaded.
+    Call after the primary's SQLALCHEMY_ENGINE_OPTIONS are set, replicas use the same pool options.
+    """
+    from models import engine_options
+
+    uris = application.config.get('SQLALCHEMY_REPLICAS')
+    if isinstance(uris, str):
+        uris = [uri.strip() for uri in uris.split(',') if uri.strip()]
+    if not uris:
+        application.extensions.pop('replicas', None)
+        return None
+    engines = [create_engine(uri, **engine_options(dict(application.config, SQLALCHEMY_DATABASE_URI=uri)))
+               for uri in uris]
+    replicas = ReplicaSet(engines, strategy=application.config.get('REPLICA_STRATEGY', 'round_robin'),
+                          eject_seconds=float(application.config.get('REPLICA_EJECT_SECONDS', 30)))
+    application.extensions['replicas'] = replicas
+    return replicas
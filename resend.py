@@ -0,0 +1,94 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app
+
+from cache import MemorySharedCache, SharedCache
+from metrics import RESEND_SUPPRESSED
+from models import normalize
+
+
+class ResendCoalescer:
+    """
+    Per-address deduplication of confirmation email resends.
+    Concurrent requests for one address run one at a time, so retries wait for the
+    first request instead of racing it. A resend within `cooldown` seconds of the
+    last send is answered like that send without a lookup or a new email, and an
+    unknown address is remembered for `window` seconds. A token minted less than
+    `token_reuse` seconds ago goes into the next email again, so every link the
+    user received stays valid for at least the rest of the confirmation max_age.
+    Entries live in a SharedCache, so with a shared backend the cooldown spans processes.
+    """
+
+    def __init__(self, store: SharedCache = None, cooldown: float = 60, window: float = 10,
+                 token_reuse: float = 300, stripes: int = 64):
+        self.store = store or MemorySharedCache()
+        self.cooldown = cooldown
+        self.window = window
+        self.token_reuse = token_reuse
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stats_lock = threading.Lock()
+        self.sent = 0
+        self.suppressed = 0
+
+    @contextmanager
+    def single_flight(self, email: str):
+        with self._locks[hash(normalize(email)) % len(self._locks)]:
+            yield
+
+    def recent(self, email: str):
+        """
+        Answer of a recent request for the address, with Retry-After for a suppressed send.
+        :return: (body, status, headers), or None when a new send is due
+        """
+        entry = self.store.get(f'resend:last:{normalize(email)}')
+        if entry is None:
+            return None
+        reason = 'cooldown' if entry['status'] == 200 else 'not_found'
+        with self._stats_lock:
+            self.suppressed += 1
+        RESEND_SUPPRESSED.labels(reason).inc()
+        if entry['status'] == 200:
+            retry_after = max(1, round(entry['at'] + self.cooldown - time.time()))
+            return {'message': 'Email confirmation sent'}, 200, {'Retry-After': str(retry_after)}
+        return {'message': 'User not found'}, 404, {}
+
+    def reusable_token(self, email: str):
+        entry = self.store.get(f'resend:token:{normalize(email)}')
+        return entry['token'] if entry is not None else None
+
+    def remember_sent(self, email: str, token: str, reused: bool):
+        key = normalize(email)
+        self.store.set(f'resend:last:{key}', {'status': 200, 'at': time.time()}, self.cooldown)
+        if not reused:
+            self.store.set(f'resend:token:{key}', {'token': token}, self.token_reuse)
+        with self._stats_lock:
+            self.sent += 1
+
+    def remember_missing(self, email: str):
+        self.store.set(f'resend:last:{normalize(email)}', {'status': 404, 'at': time.time()}, self.window)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {'sent': self.sent, 'suppressed': self.suppressed}
+
+
+def get_resend_coalescer() -> ResendCoalescer:
+    """Resend coalescer of the current app, created with defaults if init_resend was not called"""
+    coalescer = current_app.extensions.get('resend_coalescer')
+    if coalescer is None:
+        coalescer = current_app.extensions.setdefault('resend_coalescer', ResendCoalescer())
+    return coalescer
+
+
+def init_resend(application, store: SharedCache = None) -> ResendCoalescer:
+    """Func to configure the resend confirmation cooldown and coalescing from the RESEND_* config keys"""
+    config = application.config
+    coalescer = ResendCoalescer(
+        store=store,
+        cooldown=float(config.get('RESEND_COOLDOWN', 60)),
+        window=float(config.get('RESEND_NOT_FOUND_TTL', 10)),
+        token_reuse=float(config.get('RESEND_TOKEN_REUSE', 300)),
+    )
+    application.extensions['resend_coalescer'] = coalescer
+    return coalescer
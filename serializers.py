@@ -1,6 +1,92 @@
-from marshmallow import Schema, fields, validate
+from flask import current_app, make_response
+from flask_restful.representations.json import output_json as stdlib_output_json
+from marshmallow import Schema, fields, validate, ValidationError
+
+try:
+    import orjson
+except ImportError:  # the stdlib representation is used instead
+    orjson = None
+
+USERNAME_LENGTH = validate.Length(min=3, max=30)
+PASSWORD_LENGTH = validate.Length(min=8)
+# the users.email column, MySQL's INSERT IGNORE would truncate a longer value instead of failing
+EMAIL_LENGTH = validate.Length(max=255)
+
 
 class UserRegistrationSchema(Schema):
-    username = fields.Str(required=True, validate=validate.Length(min=3, max=30))
-    email = fields.Email(required=True)
-    password = fields.Str(required=True, validate=validate.Length(min=8))
\ No newline at end of file
+    username = fields.Str(required=True, validate=USERNAME_LENGTH)
+    email = fields.Email(required=True, validate=EMAIL_LENGTH)
+    password = fields.Str(required=True, validate=PASSWORD_LENGTH)
+
+
+# schemas hold no per-request state, they are built once and shared by all requests
+registration_schema = UserRegistrationSchema()
+update_schema = UserRegistrationSchema(partial=True)
+
+_FIELDS = frozenset(('username', 'email', 'password'))
+_email = validate.Email()
+
+
+def _valid_fast(payload, partial: bool) -> bool:
+    """Plain check of the common well formed payload, anything unusual is left to the schema"""
+    if type(payload) is not dict or not payload.keys() <= _FIELDS:
+        return False
+    if not partial and len(payload) != len(_FIELDS):
+        return False
+    if not all(type(value) is str for value in payload.values()):
+        return False
+    try:
+        if 'username' in payload:
+            USERNAME_LENGTH(payload['username'])
+        if 'password' in payload:
+            PASSWORD_LENGTH(payload['password'])
+        if 'email' in payload:
+            EMAIL_LENGTH(payload['email'])
+            _email(payload['email'])
+    except ValidationError:
+        return False
+    return True
+
+
+def load_registration(payload, partial: bool = False) -> dict:
+    """
+    Validate a registration (or with partial=True, a user update) payload.
+    A valid payload skips the schema, any other goes through it for the usual error messages.
+    :raise ValidationError: as UserRegistrationSchema.load
+    """
+    if _valid_fast(payload, partial):
+        return dict(payload)
+    return (update_schema if partial else registration_schema).load(payload)
+
+
+def output_orjson(data, code, headers=None):
+    """Makes a Flask response with a JSON body encoded by orjson"""
+    # RESTFUL_JSON options, debug indentation and types orjson does not know are left to the stdlib
+    if current_app.config.get('RESTFUL_JSON') or current_app.debug:
+        return stdlib_output_json(data, code, headers)
+    try:
+        dumped = orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return stdlib_output_json(data, code, headers)
+    response = make_response(dumped, code)
+    response.headers.extend(headers or {})
+    return response
+
+
+JSON_REPRESENTATIONS = {'json': stdlib_output_json}
+if orjson is not None:
+    JSON_REPRESENTATIONS['orjson'] = output_orjson
+
+
+def init_json_representation(api, name: str = None):
+    """
+    Func to register the JSON encoder of the api's responses: JSON_REPRESENTATION ('orjson'
+    or 'json'), orjson by default when it is installed.
+    """
+    if name is None:
+        name = api.app.config.get('JSON_REPRESENTATION') if api.app is not None else None
+    name = name or ('orjson' if orjson is not None else 'json')
+    if name not in JSON_REPRESENTATIONS:
+        raise ValueError(f"Unknown JSON representation {name}, use {', '.join(JSON_REPRESENTATIONS)}")
+    api.representations['application/json'] = JSON_REPRESENTATIONS[name]
+    return JSON_REPRESENTATIONS[name]
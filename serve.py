@@ -0,0 +1,157 @@
+"""
+Production entry point: the app under gunicorn with pre-forked workers.
+
+    python serve.py --bind 0.0.0.0:5000 --workers 4
+
+The app is built once in the master (config and secrets are loaded once) and
+forked into the workers, each worker then drops the database connections and
+AWS clients it inherited. `kill -HUP <master>` replaces the workers gracefully;
+with the preloaded app new code needs a restart or `--no-preload`.
+
+    python serve.py --workers 2 --threads 32
+
+serves up to 32 requests per worker at once: database and AWS calls release the
+GIL, password hashes run in the worker's process pool and emails are sent by the
+outbox dispatcher, so a request thread mostly waits on I/O.
+
+    python serve.py --asgi --workers 2 --threads 32
+
+serves asgi.application with uvicorn workers instead: connections are handled by
+the worker's event loop and only a running request takes one of its threads.
+"""
+import argparse
+import glob
+import os
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+
+def available_cores() -> int:
+    """Cores this process may run on, which can be fewer than the machine has"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    return int(os.environ.get('WEB_CONCURRENCY', 2 * available_cores() + 1))
+
+
+def threaded_pool_defaults(threads: int) -> dict:
+    """Connection pool sizes for a worker serving `threads` requests at a time, unless set explicitly"""
+    return {
+        'FLASK_DB_POOL_SIZE': threads,
+        'AWS_MAX_POOL_CONNECTIONS': max(10, threads),
+    }
+
+
+def post_fork(server, worker):
+    """Re-initialise connections inherited from the master in the new worker"""
+    from application import get_application
+    from models import db
+
+    application = get_application()
+    with application.app_context():
+        for engine in db.engines.values():
+            # the master's pooled connections must not be shared, close=False leaves them to the master
+            engine.dispose(close=False)
+        replicas = application.extensions.get('replicas')
+        if replicas is not None:
+            replicas.dispose(close=False)
+    # boto3 clients, the hashing pool and the config refresher reset themselves through os.register_at_fork
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+class Server(BaseApplication):
+    """gunicorn application serving the flask app"""
+
+    def __init__(self, options: dict, asgi: bool = False):
+        self.options = options
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+        self.cfg.set('post_fork', post_fork)
+        self.cfg.set('child_exit', child_exit)
+
+    def load(self):
+        if self.asgi:
+            from asgi import get_asgi_application
+
+            return get_asgi_application()
+        from application import get_application
+
+        return get_application()
+
+
+def prepare_metrics_dir():
+    """Workers write metrics to PROMETHEUS_MULTIPROC_DIR, values of a previous run are dropped at startup"""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        path = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='metrics-')
+    os.makedirs(path, exist_ok=True)
+    for name in glob.glob(os.path.join(path, '*.db')):
+        os.remove(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', 5000)}"))
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='defaults to WEB_CONCURRENCY or 2 * available cores + 1')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('GUNICORN_THREADS', 0)) or None,
+                        help='threads per worker, more than 1 uses the gthread worker (1 by default, 32 with --asgi)')
+    parser.add_argument('--asgi', action='store_true', help='serve asgi.application with uvicorn workers')
+    parser.add_argument('--timeout', type=int, default=30, help='seconds before a stuck worker is restarted')
+    parser.add_argument('--graceful-timeout', type=int, default=30)
+    parser.add_argument('--keep-alive', type=int, default=5)
+    parser.add_argument('--max-requests', type=int, default=10000, help='recycle a worker after this many requests')
+    parser.add_argument('--max-requests-jitter', type=int, default=1000)
+    parser.add_argument('--access-log', default='-', help="file for the access log, '-' is stdout")
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help='build the app in every worker, lets HUP load new code')
+    args = parser.parse_args()
+
+    # set before the app (and prometheus_client) is imported
+    prepare_metrics_dir()
+    threads = args.threads or (32 if args.asgi else 1)
+    # sync workers serve one request at a time and hash inline, threaded workers split the cores between pools
+    hash_workers = 0 if threads == 1 else max(1, available_cores() // args.workers)
+    os.environ.setdefault('FLASK_PASSWORD_HASH_WORKERS', str(hash_workers))
+    if threads > 1:
+        # every request thread can wait on the database or AWS at once instead of queueing for a connection
+        for name, default in threaded_pool_defaults(threads).items():
+            os.environ.setdefault(name, str(default))
+    if args.asgi:
+        os.environ.setdefault('FLASK_ASGI_THREADS', str(threads))
+        worker_class = 'asgi.UvicornWorker'
+    else:
+        worker_class = 'gthread' if threads > 1 else 'sync'
+
+    Server({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': threads,
+        'worker_class': worker_class,
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': args.keep_alive,
+        'max_requests': args.max_requests,
+        'max_requests_jitter': args.max_requests_jitter,
+        'preload_app': args.preload,
+        'accesslog': args.access_log or None,
+    }, asgi=args.asgi).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import threading
+from flask import Response, current_app, request
+from werkzeug.http import quote_etag
+
+try:
+    import brotli
+except ImportError:  # only gzip variants are built
+    brotli = None
+
+# preferred first when the client accepts several with the same quality
+COMPRESSORS = {}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=11)
+COMPRESSORS['gzip'] = lambda body: gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class PrecompiledResponse:
+    """
+    A response body encoded once: its compressed variants and their headers are
+    built up front and every variant has a strong ETag, so a request costs a dict
+    lookup and a 304 costs nothing. Variants that do not come out smaller are not kept.
+    """
+
+    def __init__(self, body, content_type: str, max_age: int = 3600, version=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.content_type = content_type
+        self.max_age = max_age
+        self.version = version
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        encoded = {'identity': body}
+        for encoding, compress in COMPRESSORS.items():
+            compressed = compress(body)
+            if len(compressed) < len(body):
+                encoded[encoding] = compressed
+        # no-cache: may be stored, but is revalidated every time
+        cache_control = f'public, max-age={max_age}' if max_age else 'no-cache'
+        self.variants = {}
+        for encoding, variant in encoded.items():
+            etag = tag if encoding == 'identity' else f'{tag}-{encoding}'
+            # headers of a 304, the full response adds the content headers
+            headers = [('ETag', quote_etag(etag)), ('Cache-Control', cache_control)]
+            if len(encoded) > 1:
+                headers.append(('Vary', 'Accept-Encoding'))
+            content_headers = [('Content-Type', content_type)]
+            if encoding != 'identity':
+                content_headers.append(('Content-Encoding', encoding))
+            self.variants[encoding] = (variant, etag, headers, headers + content_headers)
+
+    def encoding_for(self, accept_encodings) -> str:
+        """Compressed variant with the highest quality the client accepts, identity if none"""
+        best, best_quality = 'identity', 0
+        for encoding in self.variants:
+            if encoding != 'identity' and accept_encodings[encoding] > best_quality:
+                best, best_quality = encoding, accept_encodings[encoding]
+        return best
+
+    def respond(self, request) -> Response:
+        encoding = 'identity'
+        if len(self.variants) > 1 and 'Accept-Encoding' in request.headers:
+            encoding = self.encoding_for(request.accept_encodings)
+        body, etag, not_modified_headers, headers = self.variants[encoding]
+        if 'If-None-Match' in request.headers and request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=not_modified_headers)
+        return Response(body, 200, headers=headers)
+
+
+class StaticResponses:
+    """
+    Precompiled responses of an app by name. A response is built on its first
+    request and again whenever the `version` passed with a request differs from
+    the one it was built for (e.g. a reloaded template or a new key ring).
+    """
+
+    def __init__(self, max_age: int = 3600):
+        self.max_age = max_age
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, build, version=None, content_type: str = 'text/html; charset=utf-8',
+            max_age: int = None) -> PrecompiledResponse:
+        compiled = self._responses.get(name)
+        if compiled is None or compiled.version != version:
+            with self._lock:
+                compiled = self._responses.get(name)
+                if compiled is None or compiled.version != version:
+                    compiled = PrecompiledResponse(build(), content_type,
+                                                   self.max_age if max_age is None else max_age, version)
+                    self._responses[name] = compiled
+        return compiled
+
+    def respond(self, name: str, build, **kwargs) -> Response:
+        """
+        Serve `name` from memory, built by `build()` (str or bytes) when needed.
+        :param kwargs: version, content_type and max_age (0 sends no-cache) as for get()
+        """
+        return self.get(name, build, **kwargs).respond(request)
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+
+
+def get_static_responses() -> StaticResponses:
+    """Precompiled responses of the current app, created with defaults if init_static_responses was not called"""
+    responses = current_app.extensions.get('static_responses')
+    if responses is None:
+        responses = current_app.extensions.setdefault('static_responses', StaticResponses())
+    return responses
+
+
+def init_static_responses(application) -> StaticResponses:
+    """Func to set up precompiled responses, cached for STATIC_RESPONSE_MAX_AGE seconds by clients"""
+    responses = StaticResponses(max_age=int(application.config.get('STATIC_RESPONSE_MAX_AGE', 3600)))
+    application.extensions['static_responses'] = responses
+    return responses
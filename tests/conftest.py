@@ -0,0 +1,49 @@
+import os
+import pytest
+
+# the suite runs offline: the app reads these instead of settings.json and Secrets Manager
+os.environ.setdefault('CONFIG_FILE', os.path.join(os.path.dirname(__file__), 'settings.test.json'))
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+os.environ.setdefault('JWT_KEY', 'test-jwt-secret-key-of-32-bytes!')
+os.environ.setdefault('MY_SQL_CONNECTION', 'sqlite:///:memory:')
+
+from application import create_app
+from hashing import password_hasher
+from models import db
+from tokens import token_versions
+
+# every test app starts from these, a module adds or changes keys by overriding the test_config fixture
+TEST_CONFIG = {
+    'TESTING': True,
+    'SECRET_KEY': 'test-secret',
+    'JWT_SECRET_KEY': 'test-jwt-secret-key-of-32-bytes!',
+    'MAIL_TRANSPORT': 'memory',
+    # cheap hashes on the request thread
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'PASSWORD_HASH_WORKERS': 0,
+}
+
+
+@pytest.fixture
+def test_config() -> dict:
+    """Config keys of the module's app on top of TEST_CONFIG"""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, test_config):
+    """App built by create_app with the tables created, a module seeds it by overriding this fixture"""
+    # a database file, which the threads of a test share
+    database = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'users.db'}"}
+    app = create_app({**database, **TEST_CONFIG, **test_config})
+    with app.app_context():
+        db.create_all()
+    yield app
+    # the hasher and token versions are process-wide, create_app configured them for this app
+    password_hasher.configure()
+    token_versions.configure()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
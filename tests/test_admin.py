@@ -0,0 +1,71 @@
+import csv
+import io
+import re
+import pytest
+from sqlalchemy import event, insert
+from models import db, Users
+
+
+@pytest.fixture
+def app(app):
+    """App with 120 users."""
+    with app.app_context():
+        db.session.execute(insert(Users.__table__), [
+            {'user_id': f'id-{i}', 'username': f'User{i:03}', 'email': f'user{i:03}@example.com',
+             'username_normalized': f'user{i:03}', 'email_normalized': f'user{i:03}@example.com',
+             'password': 'secret-hash', 'email_confirmed': True} for i in range(120)])
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def statements(app):
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append((args[2], args[3])))
+    return statements
+
+
+def usernames(response):
+    return re.findall(r'User\d{3}', response.get_data(as_text=True))
+
+
+def test_pages_follow_the_id_cursor_without_offset(client, statements):
+    first = client.get('/web3m-admin/users/')
+    assert first.status_code == 200
+    assert usernames(first)[0] == 'User000' and usernames(first)[-1] == 'User049'
+    assert 'About 120 users' in first.get_data(as_text=True)
+    assert 'after=50' in first.get_data(as_text=True)
+
+    statements.clear()
+    second = client.get('/web3m-admin/users/?after=50')
+
+    assert usernames(second)[0] == 'User050' and usernames(second)[-1] == 'User099'
+    # sqlite always renders an OFFSET, it stays 0
+    assert [parameters[-1] for statement, parameters in statements if 'OFFSET' in statement] == [0]
+    assert not any('count(' in statement.lower() for statement, _ in statements)
+    assert usernames(client.get('/web3m-admin/users/?before=51'))[-1] == 'User049'
+    # the total is cached
+    assert 'About 120 users' in second.get_data(as_text=True)
+
+
+def test_search_is_a_prefix_match_on_normalized_columns(client, statements):
+    response = client.get('/web3m-admin/users/?search=USER11')
+
+    assert sorted(set(usernames(response))) == [f'User11{i}' for i in range(10)]
+    searches = [statement for statement, _ in statements if 'LIKE' in statement]
+    assert searches and all('lower(' not in statement.lower() for statement in searches)
+    assert usernames(client.get('/web3m-admin/users/?search=id-7')) == ['User007']
+
+
+def test_csv_export_streams_every_user_without_passwords(client, app):
+    response = client.get('/web3m-admin/users/export.csv')
+
+    assert response.is_streamed
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['id', 'user_id', 'username', 'email', 'email_confirmed', 'date']
+    assert len(rows) == 121
+    assert 'secret-hash' not in response.get_data(as_text=True)
+
+    searched = client.get('/web3m-admin/users/export.csv?search=user00').get_data(as_text=True)
+    assert len(searched.strip().splitlines()) == 11
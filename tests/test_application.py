@@ -15,4 +15,9 @@ def test_home_route(client):
 
 def test_check_sql_connection():
 
-    assert check_sql_connection() is None
\ No newline at end of file
+    assert check_sql_connection() is None
+
+def test_wsgi_module_binds_the_application():
+    import wsgi
+    # mod_wsgi looks the callable up in the module dict, not through getattr
+    assert vars(wsgi)['application'] is application
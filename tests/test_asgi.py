@@ -0,0 +1,67 @@
+import asyncio
+import time
+import httpx
+import pytest
+from itsdangerous import URLSafeTimedSerializer
+
+from asgi import create_asgi_app
+from hashing import password_hasher
+
+USER = {'username': 'asyncuser', 'email': 'async@example.com', 'password': 'aSecurePassword'}
+
+
+@pytest.fixture
+def test_config() -> dict:
+    return {'ASGI_THREADS': 8}
+
+
+def send_all(app, requests: list) -> list:
+    """Send (method, path, kwargs) requests to the ASGI app at once, responses in the same order"""
+    async def send():
+        transport = httpx.ASGITransport(app=create_asgi_app(app))
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await asyncio.gather(*(client.request(method, path, **kwargs) for method, path, kwargs in requests))
+
+    return asyncio.run(send())
+
+
+def confirmed_user(app):
+    token = URLSafeTimedSerializer('test-secret').dumps(USER['email'], salt='confirm_email')
+    [register] = send_all(app, [('POST', '/api/v1/register', {'json': USER})])
+    [confirm] = send_all(app, [('GET', f'/confirm-email/{token}', {})])
+    assert (register.status_code, confirm.status_code) == (201, 200)
+
+
+def test_requests_are_answered_by_the_flask_app(app):
+    confirmed_user(app)
+    [sign_in] = send_all(app, [('POST', '/api/v1/signin', {'json': USER})])
+    assert sign_in.status_code == 200 and sign_in.json()['email'] == USER['email']
+
+    headers = {'Authorization': f"Bearer {sign_in.json()['access_token']}"}
+    protected, wrong_method, missing_token = send_all(app, [
+        ('GET', '/api/v1/protected', {'headers': headers}),
+        ('GET', '/api/v1/signin', {}),
+        ('GET', '/api/v1/protected', {}),
+    ])
+    client = app.test_client()
+
+    assert protected.status_code == 200 and protected.json()['username'] == USER['username']
+    # errors keep the flask app's handlers
+    assert (wrong_method.status_code, wrong_method.json()) == (405, client.get('/api/v1/signin').get_json())
+    assert (missing_token.status_code, missing_token.json()) == (401, client.get('/api/v1/protected').get_json())
+
+
+def test_requests_run_on_the_pool_concurrently(app, monkeypatch):
+    confirmed_user(app)
+
+    def slow_verify(stored_hash, password):
+        time.sleep(0.3)
+        return True
+
+    monkeypatch.setattr(password_hasher, 'verify', slow_verify)
+    started = time.perf_counter()
+    responses = send_all(app, [('POST', '/api/v1/signin', {'json': USER})] * 4)
+
+    assert [response.status_code for response in responses] == [200] * 4
+    # one after the other they would take 1.2s
+    assert time.perf_counter() - started < 0.9
@@ -0,0 +1,91 @@
+import pytest
+import cache
+from cache import UserCache, MemorySharedCache, get_user_cache
+from models import db, Users
+
+
+@pytest.fixture
+def app(app):
+    """App with a confirmed user."""
+    with app.app_context():
+        user = Users(username='cacheuser', email='cache@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def test_read_through_counts_hits_and_misses(app):
+    with app.app_context():
+        cache = UserCache()
+        record = cache.get_by_email('Cache@Example.com')
+        assert record.username == 'cacheuser'
+        # the email lookup also filled the user_id key
+        assert cache.get_by_user_id(record.user_id) is record
+        assert cache.get_by_email('missing@example.com') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 2
+
+
+def test_lru_eviction_is_counted(app):
+    with app.app_context():
+        cache = UserCache(maxsize=1)
+        cache.get_by_email('cache@example.com')
+        assert cache.stats()['evictions'] == 1
+
+
+def test_shared_tier_serves_other_processes(app):
+    shared = MemorySharedCache()
+    with app.app_context():
+        UserCache(shared=shared).get_by_email('cache@example.com')
+        other = UserCache(shared=shared)
+        assert other.get_by_email('cache@example.com').username == 'cacheuser'
+        assert other.stats()['shared_hits'] == 1
+
+
+def test_memory_shared_cache_counters_keep_their_expiry(monkeypatch):
+    shared = MemorySharedCache()
+    now = [100.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+
+    assert [shared.incr('counter', 10) for _ in range(3)] == [1, 2, 3]
+    now[0] += 9
+    assert shared.incr('counter', 10) == 4 and shared.get('counter') == {'count': 4}
+    now[0] += 2
+    assert shared.get('counter') is None
+    assert shared.incr('counter', 10) == 1
+
+
+def test_signin_sees_password_changed_elsewhere(client, app):
+    assert client.post('/api/v1/signin', json={'email': 'cache@example.com',
+                                                'password': 'aSecurePassword'}).status_code == 200
+    # change the password behind the cache's back, as another worker would
+    with app.app_context():
+        Users.find_by_email('cache@example.com').set_password('aNewPassword')
+        db.session.commit()
+
+    assert client.post('/api/v1/signin', json={'email': 'cache@example.com',
+                                                'password': 'aNewPassword'}).status_code == 200
+    assert client.post('/api/v1/signin', json={'email': 'cache@example.com',
+                                                'password': 'aSecurePassword'}).status_code == 401
+
+
+@pytest.mark.parametrize('test_config', [{'USER_CACHE_SHARED': 'memory'}])
+def test_password_hash_is_not_cached(client, app):
+    assert client.post('/api/v1/signin', json={'email': 'cache@example.com',
+                                                'password': 'aSecurePassword'}).status_code == 200
+    with app.app_context():
+        shared = get_user_cache().shared.get('user:email:cache@example.com')
+        record = get_user_cache().get_by_email('cache@example.com')
+
+    assert shared['username'] == 'cacheuser' and 'password' not in shared
+    assert not hasattr(record, 'password')
+
+
+def test_update_invalidates_cache(client, app):
+    tokens = client.post('/api/v1/signin', json={'email': 'cache@example.com', 'password': 'aSecurePassword'}).json
+    client.put('/api/v1/users/', json={'email': 'moved@example.com'},
+               headers={'Authorization': f"Bearer {tokens['access_token']}"})
+    with app.app_context():
+        assert get_user_cache().get_by_email('cache@example.com') is None
+        assert get_user_cache().get_by_email('moved@example.com').user_id == tokens['user_id']
@@ -0,0 +1,22 @@
+from clients import ClientRegistry
+
+
+def test_client_is_reused():
+    registry = ClientRegistry()
+    first = registry.get('ses', 'us-east-1', 'key', 'secret')
+    assert registry.get('ses', 'us-east-1', 'key', 'secret') is first
+    assert registry.get('ses', 'eu-central-1', 'key', 'secret') is not first
+
+
+def test_pool_options_are_applied():
+    registry = ClientRegistry(max_pool_connections=32)
+    client = registry.get('ses', 'us-east-1', 'key', 'secret')
+    assert client.meta.config.max_pool_connections == 32
+    assert client.meta.config.tcp_keepalive is True
+
+
+def test_forked_process_gets_new_clients():
+    registry = ClientRegistry()
+    first = registry.get('ses', 'us-east-1', 'key', 'secret')
+    registry._pid = -1  # pretend we are running in a forked child
+    assert registry.get('ses', 'us-east-1', 'key', 'secret') is not first
@@ -0,0 +1,79 @@
+import json
+import time
+import pytest
+from cryptography.fernet import Fernet
+
+from application import create_app
+from config import ConfigProvider
+
+
+class CountingProvider(ConfigProvider):
+    """Provider whose Secrets Manager secret is a local dict"""
+
+    def __init__(self, secret: dict, **kwargs):
+        self.secret = secret
+        super().__init__(**kwargs)
+
+    def _fetch(self) -> dict:
+        return dict(self.secret)
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / 'settings.json'
+    path.write_text(json.dumps({'jwt_key': 'from-file', 'secret_key': 'from-file'}))
+    return str(path)
+
+
+def test_layers_are_checked_in_order_and_loaded_lazily(config_file):
+    provider = CountingProvider({'jwt_key': 'from-secret', 'secret_key': 'from-secret', 'db': 'from-secret'},
+                                config_file=config_file, environ={'SECRET_KEY': 'from-env'})
+
+    assert provider.get('secret_key') == 'from-env'
+    assert provider.get('jwt_key') == 'from-file'
+    assert provider.fetches == 0
+    assert provider.get('db') == 'from-secret'
+    assert provider.get('missing', 'default') == 'default'
+    assert provider.fetches == 1
+
+
+def test_stale_secret_is_served_while_refreshing_in_background(config_file):
+    provider = CountingProvider({'db': 'old'}, config_file=config_file, environ={}, ttl=0.05)
+    assert provider.get('db') == 'old'
+
+    provider.secret['db'] = 'new'
+    time.sleep(0.1)
+    assert provider.get('db') == 'old'
+    for _ in range(100):
+        if provider.get('db') == 'new':
+            break
+        time.sleep(0.01)
+    assert provider.get('db') == 'new'
+    assert provider.fetches == 2
+
+
+def test_encrypted_snapshot_skips_the_fetch_on_restart(config_file, tmp_path):
+    key = Fernet.generate_key().decode()
+    snapshot = str(tmp_path / 'secrets.snapshot')
+    options = dict(config_file=config_file, environ={}, snapshot_path=snapshot, snapshot_key=key)
+
+    CountingProvider({'db': 'from-secret'}, **options).get('db')
+    assert b'from-secret' not in open(snapshot, 'rb').read()
+
+    restarted = CountingProvider({'db': 'changed'}, **options)
+    assert restarted.get('db') == 'from-secret'
+    assert restarted.fetches == 0
+
+    # a snapshot encrypted with another key is ignored
+    rotated = CountingProvider({'db': 'changed'}, **dict(options, snapshot_key=Fernet.generate_key().decode()))
+    assert rotated.get('db') == 'changed'
+    assert rotated.fetches == 1
+
+
+def test_create_app_uses_given_config():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'JWT_SECRET_KEY': 'given-jwt-secret-of-32-bytes!!!!',
+                      'TESTING': True})
+
+    assert app.config['JWT_SECRET_KEY'] == 'given-jwt-secret-of-32-bytes!!!!'
+    assert app.config['SECRET_KEY'] == 'test-secret-key'
+    assert app.test_client().get('/').status_code == 200
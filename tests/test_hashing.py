@@ -0,0 +1,77 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from hashing import PasswordHasher, HashingBusy, password_hasher
+from models import db, Users
+
+
+def add_confirmed_user(app):
+    with app.app_context():
+        user = Users(username='hashuser', email='hash@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+
+
+def test_process_pool_hashes_and_verifies():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+    try:
+        stored = hasher.hash('aSecurePassword')
+        assert hasher.verify(stored, 'aSecurePassword')
+        assert not hasher.verify(stored, 'wrongPassword')
+    finally:
+        hasher.shutdown()
+
+
+def test_full_queue_raises_busy():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1, max_pending=1)
+    hasher._slots.acquire()  # one hash already in flight
+    with pytest.raises(HashingBusy):
+        hasher.hash('aSecurePassword')
+
+
+def test_timed_out_hashes_hold_their_slot_until_the_pool_drops_them(monkeypatch):
+    hasher = PasswordHasher(workers=1, max_pending=2, timeout=0.05)
+    executor = ThreadPoolExecutor(1)
+    monkeypatch.setattr(hasher, '_get_executor', lambda: executor)
+    done = threading.Event()
+
+    # the first keeps running after the timeout, the second is queued behind it and cancelled
+    for _ in range(2):
+        with pytest.raises(HashingBusy):
+            hasher._run(done.wait, 5)
+
+    assert hasher._slots.acquire(blocking=False)
+    assert not hasher._slots.acquire(blocking=False)
+    hasher._slots.release()
+    done.set()
+    executor.shutdown(wait=True)
+    assert hasher._slots.acquire(blocking=False) and hasher._slots.acquire(blocking=False)
+
+
+def test_needs_rehash():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+    assert not hasher.needs_rehash(hasher.hash('aSecurePassword'))
+    assert hasher.needs_rehash(PasswordHasher(method='pbkdf2:sha256:2000').hash('aSecurePassword'))
+
+
+def test_signin_upgrades_old_hash(client, app):
+    add_confirmed_user(app)
+    password_hasher.configure(method='pbkdf2:sha256:2000')
+
+    response = client.post('/api/v1/signin', json={'email': 'hash@example.com', 'password': 'aSecurePassword'})
+    assert response.status_code == 200
+    with app.app_context():
+        assert Users.find_by_email('hash@example.com').password.startswith('pbkdf2:sha256:2000$')
+
+
+def test_signin_busy_returns_503(client, app, monkeypatch):
+    add_confirmed_user(app)
+
+    def busy(*args):
+        raise HashingBusy()
+    monkeypatch.setattr(password_hasher, 'verify', busy)
+
+    response = client.post('/api/v1/signin', json={'email': 'hash@example.com', 'password': 'aSecurePassword'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import event
+from models import db, engine_options
+from outbox import DeliveryError
+
+
+@pytest.fixture
+def test_config() -> dict:
+    return {'READINESS_CHECKS': 'db,mail', 'READINESS_CACHE_TTL': 60}
+
+
+def test_liveness(client):
+    response = client.get('/healthz')
+
+    assert response.status_code == 200
+    assert response.json == {'status': 'ok'}
+
+
+def test_readiness_results_are_cached(client, app):
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    responses = [client.get('/readyz') for _ in range(5)]
+
+    assert all(response.status_code == 200 for response in responses)
+    checks = responses[-1].json['checks']
+    assert checks['db']['ok'] and checks['mail']['ok']
+    assert 'latency_ms' in checks['db'] and 'checked_at' in checks['db']
+    assert statements == ['SELECT 1']
+
+
+def test_readiness_fails_with_a_broken_dependency(client, app):
+    app.extensions['outbox'].transport.fail_with = DeliveryError('SMTP is down')
+
+    response = client.get('/readyz')
+
+    assert response.status_code == 503
+    assert response.json['status'] == 'unavailable'
+    assert response.json['checks']['mail'] == {**response.json['checks']['mail'], 'ok': False, 'error': 'SMTP is down'}
+    assert response.json['checks']['db']['ok']
+
+
+def test_engine_options_for_mysql():
+    options = engine_options({'SQLALCHEMY_DATABASE_URI': 'mysql+pymysql://user:pass@db/users', 'DB_POOL_SIZE': '8',
+                              'DB_READ_TIMEOUT': 20})
+
+    assert options['pool_size'] == 8
+    assert options['pool_pre_ping'] is True
+    assert options['pool_recycle'] == 1800
+    assert options['connect_args'] == {'connect_timeout': 5, 'read_timeout': 20, 'write_timeout': 20}
+    assert engine_options({'SQLALCHEMY_DATABASE_URI': 'sqlite://'}) == {}
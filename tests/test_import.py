@@ -0,0 +1,95 @@
+import json
+import pytest
+from hashing import HashingBusy, password_hasher
+from models import db, Users
+
+ADMIN_TOKEN = 'test-admin-token'
+
+
+@pytest.fixture
+def test_config() -> dict:
+    return {'ADMIN_API_TOKEN': ADMIN_TOKEN}
+
+
+@pytest.fixture
+def app(app):
+    """App with an existing user."""
+    with app.app_context():
+        db.session.add(Users(username='existing', email='existing@example.com', password='aSecurePassword'))
+        db.session.commit()
+    return app
+
+
+def test_import_reports_bad_rows_and_keeps_going(client, app):
+    rows = [
+        {'username': 'alice', 'email': 'alice@example.com', 'password': 'aSecurePassword'},
+        {'username': 'bob', 'email': 'not-an-email', 'password': 'aSecurePassword'},
+        {'username': 'Existing', 'email': 'other@example.com', 'password': 'aSecurePassword'},
+        {'username': 'carol', 'email': 'ALICE@example.com', 'password': 'aSecurePassword'},
+        {'username': 'dave', 'email': 'dave@example.com', 'password': 'aSecurePassword', 'extra': 1},
+    ]
+    body = '\n'.join(json.dumps(row) for row in rows) + '\n{broken\n'
+
+    response = client.post('/api/v1/admin/users/import?batch_size=2', data=body,
+                           content_type='application/x-ndjson', headers={'X-Admin-Token': ADMIN_TOKEN})
+
+    assert response.status_code == 200
+    report = response.json
+    assert (report['total'], report['imported'], report['failed']) == (6, 2, 4)
+    failures = {failure['row']: failure['errors'] for failure in report['failures']}
+    assert set(failures) == {2, 3, 4, 6}
+    assert 'email' in failures[2]
+    assert failures[3] == {'username': ['Username already exists']}
+    assert failures[4] == {'email': ['Email already exists']}
+    with app.app_context():
+        alice = Users.find_by_email('alice@example.com')
+        assert alice.check_password('aSecurePassword')
+        assert not alice.email_confirmed
+        assert Users.query.count() == 3
+
+
+def test_import_csv_confirmed(client, app):
+    body = 'username,email,password\nerin,erin@example.com,aSecurePassword\n'
+
+    response = client.post('/api/v1/admin/users/import?confirmed=true', data=body, content_type='text/csv',
+                           headers={'X-Admin-Token': ADMIN_TOKEN})
+
+    assert response.status_code == 200
+    assert response.json['imported'] == 1
+    with app.app_context():
+        assert Users.find_by_email('erin@example.com').email_confirmed
+
+
+def test_import_requires_admin_token(client):
+    response = client.post('/api/v1/admin/users/import', data='{}', content_type='application/x-ndjson',
+                           headers={'X-Admin-Token': 'wrong'})
+
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize('test_config', [{'ADMIN_API_TOKEN': ADMIN_TOKEN, 'USER_IMPORT_MAX_ROWS': 2}])
+def test_import_over_the_row_limit_is_refused(client, app):
+    body = ''.join(json.dumps({'username': f'user{i}', 'email': f'user{i}@example.com',
+                               'password': 'aSecurePassword'}) + '\n' for i in range(3))
+
+    response = client.post('/api/v1/admin/users/import', data=body, content_type='application/x-ndjson',
+                           headers={'X-Admin-Token': ADMIN_TOKEN})
+
+    assert response.status_code == 413
+    assert 'flask users import' in response.json['message']
+    with app.app_context():
+        assert Users.query.count() == 1
+
+
+def test_import_goes_through_hashing_backpressure(client, app, monkeypatch):
+    def busy(*args):
+        raise HashingBusy()
+    monkeypatch.setattr(password_hasher, 'hash', busy)
+    monkeypatch.setattr(password_hasher, 'hash_many', lambda *args: pytest.fail('bypassed the backpressure'))
+    body = 'username,email,password\nerin,erin@example.com,aSecurePassword\n'
+
+    response = client.post('/api/v1/admin/users/import', data=body, content_type='text/csv',
+                           headers={'X-Admin-Token': ADMIN_TOKEN})
+
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    assert response.json['imported'] == 0
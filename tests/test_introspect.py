@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import event
+from denylist import get_denylist
+from models import db, Users
+
+
+@pytest.fixture
+def test_config() -> dict:
+    return {'INTROSPECT_MAX_TOKENS': 5, 'TOKEN_DENYLIST_SYNC_INTERVAL': 60}
+
+
+@pytest.fixture
+def app(app):
+    """App with two confirmed users."""
+    with app.app_context():
+        for name in ('first', 'second'):
+            user = Users(username=name, email=f'{name}@example.com', password='aSecurePassword')
+            user.email_confirmed = True
+            db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def sign_in(client, name):
+    return client.post('/api/v1/signin', json={'email': f'{name}@example.com', 'password': 'aSecurePassword'}).json
+
+
+def test_introspect_batch_with_one_user_query(client, app):
+    first, second = sign_in(client, 'first'), sign_in(client, 'second')
+    tokens = [first['access_token'], second['refresh_token'], 'not-a-token', first['access_token']]
+
+    statements = []
+    with app.app_context():
+        # the denylist copy is loaded once, not per request
+        get_denylist().sync()
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    response = client.post('/api/v1/introspect', json={'tokens': tokens})
+
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['active'] for result in results] == [True, True, False, True]
+    assert results[0]['claims']['username'] == 'first'
+    assert results[1]['claims']['token_type'] == 'refresh'
+    assert 'error' in results[2]
+    assert len(statements) == 1
+
+
+def test_introspect_reports_deleted_user(client):
+    tokens = sign_in(client, 'first')
+    client.delete('/api/v1/users/', headers={'Authorization': f"Bearer {tokens['access_token']}"})
+
+    result = client.post('/api/v1/introspect', json={'tokens': [tokens['access_token']]}).json['results'][0]
+    assert result == {'active': False, 'error': 'User not found'}
+
+
+def test_introspect_limits_batch_size(client):
+    response = client.post('/api/v1/introspect', json={'tokens': ['x'] * 6})
+    assert response.status_code == 400
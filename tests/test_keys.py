@@ -0,0 +1,81 @@
+import io
+import json
+import jwt
+import pytest
+from keys import generate_key
+from models import db, Users
+from verifier import TokenVerifier
+
+SIGNING_KEYS = [
+    {'kid': 'old', 'alg': 'RS256', 'private_key': generate_key('RS256')},
+    {'kid': 'new', 'alg': 'EdDSA', 'private_key': generate_key('EdDSA')},
+]
+
+
+@pytest.fixture
+def test_config() -> dict:
+    """App signing tokens with a rotated key ring."""
+    return {'JWT_SIGNING_KEYS': SIGNING_KEYS, 'JWT_ACTIVE_KID': 'new'}
+
+
+@pytest.fixture
+def app(app):
+    with app.app_context():
+        user = Users(username='keyuser', email='key@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def access_token(client):
+    return client.post('/api/v1/signin', json={'email': 'key@example.com',
+                                               'password': 'aSecurePassword'}).json['access_token']
+
+
+def test_tokens_are_signed_with_active_key(client, access_token):
+    header = jwt.get_unverified_header(access_token)
+    assert header['kid'] == 'new'
+    assert header['alg'] == 'EdDSA'
+    assert client.get('/api/v1/protected', headers={'Authorization': f'Bearer {access_token}'}).status_code == 200
+
+
+def test_retired_key_still_verifies(client, access_token):
+    # the user's claims, signed with the retired key
+    claims = jwt.decode(access_token, options={'verify_signature': False})
+    token = jwt.encode(claims, SIGNING_KEYS[0]['private_key'], algorithm='RS256', headers={'kid': 'old'})
+    response = client.get('/api/v1/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+
+
+def test_hs256_token_rejected(client):
+    token = jwt.encode({'sub': 'someone', 'type': 'access'}, 'test-jwt-secret-key-of-32-bytes!', algorithm='HS256')
+    response = client.get('/api/v1/protected', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 422
+
+
+def test_jwks_is_cacheable(client):
+    response = client.get('/.well-known/jwks.json')
+    assert response.status_code == 200
+    assert {key['kid'] for key in response.json['keys']} == {'old', 'new'}
+    assert 'max-age' in response.headers['Cache-Control']
+
+    response = client.get('/.well-known/jwks.json', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_verifier_uses_jwks(client, access_token, monkeypatch):
+    verifier = TokenVerifier('http://auth.local/.well-known/jwks.json')
+    fetches = []
+
+    def urlopen(request, **kwargs):
+        fetches.append(request.full_url)
+        return io.BytesIO(json.dumps(client.get('/.well-known/jwks.json').json).encode())
+    monkeypatch.setattr('urllib.request.urlopen', urlopen)
+
+    assert verifier.verify(access_token)['email'] == 'key@example.com'
+    verifier.verify(access_token)
+    assert len(fetches) == 1  # key set is cached
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(access_token, token_type='refresh')
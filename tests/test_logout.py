@@ -0,0 +1,96 @@
+import time
+import pytest
+from flask_jwt_extended import decode_token
+from denylist import TokenDenylist, get_denylist
+from models import db, RevokedToken, Users
+
+
+@pytest.fixture
+def app(app):
+    """App with a confirmed user."""
+    with app.app_context():
+        user = Users(username='logout', email='logout@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def sign_in(client):
+    return client.post('/api/v1/signin', json={'email': 'logout@example.com', 'password': 'aSecurePassword'}).json
+
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_logout_revokes_access_and_refresh_token(client):
+    tokens, other = sign_in(client), sign_in(client)
+
+    response = client.post('/api/v1/logout', headers=auth(tokens['access_token']),
+                           json={'refresh_token': tokens['refresh_token']})
+
+    assert response.status_code == 200
+    assert client.get('/api/v1/protected', headers=auth(tokens['access_token'])).status_code == 401
+    assert client.post('/api/v1/refresh_token', headers=auth(tokens['refresh_token'])).status_code == 401
+    # other sessions stay logged in
+    assert client.get('/api/v1/protected', headers=auth(other['access_token'])).status_code == 200
+    results = client.post('/api/v1/introspect', json={'tokens': [tokens['access_token'], other['access_token']]})
+    assert [result['active'] for result in results.json['results']] == [False, True]
+
+
+def test_logout_with_a_refresh_token_of_another_user(client, app):
+    tokens = sign_in(client)
+    with app.app_context():
+        other = Users(username='other', email='other@example.com', password='aSecurePassword')
+        other.email_confirmed = True
+        db.session.add(other)
+        db.session.commit()
+    other_tokens = client.post('/api/v1/signin', json={'email': 'other@example.com',
+                                                       'password': 'aSecurePassword'}).json
+
+    response = client.post('/api/v1/logout', headers=auth(tokens['access_token']),
+                           json={'refresh_token': other_tokens['refresh_token']})
+
+    assert response.status_code == 400
+    assert client.get('/api/v1/protected', headers=auth(tokens['access_token'])).status_code == 200
+
+
+def test_logout_all_sessions(client):
+    first, second = sign_in(client), sign_in(client)
+
+    assert client.post('/api/v1/logout/all', headers=auth(first['access_token'])).status_code == 200
+
+    for tokens in (first, second):
+        assert client.get('/api/v1/protected', headers=auth(tokens['access_token'])).status_code == 401
+        assert client.post('/api/v1/refresh_token', headers=auth(tokens['refresh_token'])).status_code == 401
+    assert client.get('/api/v1/protected', headers=auth(sign_in(client)['access_token'])).status_code == 200
+
+
+def test_other_processes_pick_up_logouts(client, app):
+    tokens = sign_in(client)
+    # another worker's copy of the denylist
+    other = TokenDenylist(sync_interval=0)
+
+    client.post('/api/v1/logout', headers=auth(tokens['access_token']))
+
+    with app.app_context():
+        payload = decode_token(tokens['access_token'])
+        assert other.contains(payload['jti'], payload['exp'])
+        assert len(get_denylist()) == len(other) == 1
+
+
+def test_expired_tokens_are_dropped(app):
+    denylist = TokenDenylist(bucket_seconds=1, sync_interval=0)
+    now = time.time()
+    with app.app_context():
+        denylist.revoke([{'jti': 'short', 'exp': now + 0.2}, {'jti': 'long', 'exp': now + 3600}])
+        # logging out twice is not an error
+        denylist.revoke([{'jti': 'long', 'exp': now + 3600}])
+        assert denylist.contains('short', now + 0.2) and denylist.contains('long', now + 3600)
+
+        time.sleep(1.3)
+        denylist.sync()
+
+        assert len(denylist) == 1
+        assert [row.jti for row in db.session.query(RevokedToken)] == ['long']
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from maintenance import UnconfirmedPurge
+from models import db, ArchivedUser, EmailOutbox, Users
+
+
+@pytest.fixture
+def test_config() -> dict:
+    return {'PURGE_UNCONFIRMED_PAUSE': 0}
+
+
+@pytest.fixture
+def app(app):
+    """App with old and new, confirmed and unconfirmed accounts."""
+    with app.app_context():
+        old = datetime.utcnow() - timedelta(days=30)
+        for i in range(5):
+            add_user(f'stale{i}', confirmed=False, date=old)
+            db.session.add(EmailOutbox(recipient=f'stale{i}@example.com', subject='Confirm', body='...'))
+        add_user('confirmed', confirmed=True, date=old)
+        add_user('recent', confirmed=False, date=datetime.utcnow())
+        db.session.commit()
+    return app
+
+
+def add_user(username, confirmed, date):
+    user = Users(username=username, email=f'{username}@example.com', password='aSecurePassword')
+    user.email_confirmed = confirmed
+    user.date = date
+    db.session.add(user)
+
+
+def usernames():
+    return sorted(user.username for user in Users.query)
+
+
+def test_purge_removes_stale_unconfirmed_accounts_in_batches(app):
+    progress = []
+    with app.app_context():
+        report = UnconfirmedPurge(timedelta(days=7), batch_size=2, pause=0, echo=progress.append).run()
+
+        assert report['purged'] == 5 and report['batches'] == 3
+        assert usernames() == ['confirmed', 'recent']
+        assert EmailOutbox.query.count() == 0
+    assert len(progress) == 3
+
+
+def test_purge_archives_without_password(app):
+    with app.app_context():
+        UnconfirmedPurge(timedelta(days=7), pause=0, archive=True, echo=lambda message: None).run()
+
+        archived = ArchivedUser.query.order_by(ArchivedUser.id).all()
+        assert [user.username for user in archived] == [f'stale{i}' for i in range(5)]
+        assert not hasattr(archived[0], 'password')
+        assert usernames() == ['confirmed', 'recent']
+
+
+def test_account_confirmed_after_the_candidate_read_is_kept(app):
+    def confirm_during_purge(conn, cursor, statement, parameters, context, executemany):
+        # the candidates were read, the locking batch has not run yet
+        if statement.startswith('SELECT') and ' IN (' in statement and not confirmed:
+            cursor.connection.execute("UPDATE users SET email_confirmed = 1 WHERE username = 'stale0'")
+            confirmed.append(True)
+
+    confirmed = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', confirm_during_purge)
+        report = UnconfirmedPurge(timedelta(days=7), pause=0, archive=True, echo=lambda message: None).run()
+        event.remove(db.engine, 'before_cursor_execute', confirm_during_purge)
+
+        assert confirmed and report['purged'] == 4
+        assert usernames() == ['confirmed', 'recent', 'stale0']
+        assert [user.username for user in ArchivedUser.query.order_by(ArchivedUser.id)] == \
+            [f'stale{i}' for i in range(1, 5)]
+
+
+def test_purge_cli_dry_run_and_run(app):
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['users', 'purge-unconfirmed', '--dry-run'])
+    assert 'Found 5 unconfirmed accounts' in result.output
+    with app.app_context():
+        assert len(usernames()) == 7
+
+    result = runner.invoke(args=['users', 'purge-unconfirmed', '--days', '0'])
+    assert 'Purged 6 unconfirmed accounts' in result.output
+    with app.app_context():
+        assert usernames() == ['confirmed']
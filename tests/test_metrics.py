@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import pytest
+from metrics import exposition
+from models import db, Users
+
+
+@pytest.fixture
+def app(app):
+    """App with a confirmed user."""
+    with app.app_context():
+        user = Users(username='metrics', email='metrics@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def sample(text: str, name: str) -> float:
+    """Value of one sample line in the exposition output"""
+    for line in text.splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+def test_requests_queries_and_hashes_are_exposed(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    client.post('/api/v1/signin', json={'email': 'metrics@example.com', 'password': 'aSecurePassword'})
+    client.get('/api/v1/protected')
+
+    response = client.get('/metrics')
+    text = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain')
+    signin = 'http_request_duration_seconds_count{endpoint="signin",method="POST",status="200"}'
+    # the 401 comes from the jwt error handler, not the resource
+    protected = 'http_request_duration_seconds_count{endpoint="protectedresource",method="GET",status="401"}'
+    for name in (signin, protected, 'db_query_duration_seconds_count{operation="SELECT"}',
+                 'password_hash_duration_seconds_count{operation="verify"}'):
+        assert sample(text, name) > sample(before, name)
+
+
+def test_metrics_are_merged_across_processes(tmp_path, monkeypatch):
+    child = "import metrics; metrics.PASSWORD_HASH_LATENCY.labels('hash').observe(0.2)"
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', child], check=True,
+                       env={'PROMETHEUS_MULTIPROC_DIR': str(tmp_path), 'PYTHONPATH': '.'})
+
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    text = exposition()[0].decode()
+
+    assert sample(text, 'password_hash_duration_seconds_count{operation="hash"}') == 2
+    assert sample(text, 'password_hash_duration_seconds_sum{operation="hash"}') == pytest.approx(0.4)
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from migrations import MigrationError
+
+OLD_USERS_TABLE = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY,
+    user_id VARCHAR(36) NOT NULL UNIQUE,
+    username VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    date DATETIME NOT NULL,
+    email_confirmed BOOLEAN
+)
+"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """SQLite database with the users table as it was before the normalized columns"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(OLD_USERS_TABLE))
+    return engine
+
+
+def insert_users(engine, rows):
+    with engine.begin() as conn:
+        for i, (username, email) in enumerate(rows):
+            conn.execute(text("INSERT INTO users (user_id, username, email, password, date) "
+                              "VALUES (:user_id, :username, :email, 'x', '2024-01-01')"),
+                         {'user_id': str(i), 'username': username, 'email': email})
+
+
+def test_upgrade_backfills_and_indexes(engine):
+    insert_users(engine, [(f'User{i}', f' User{i}@Example.com') for i in range(5)])
+
+    applied = migrations.upgrade(engine, batch_size=2, echo=lambda msg: None)
+    assert applied == ['0001_normalized_lookup_columns', '0002_users_token_version']
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT username_normalized, email_normalized FROM users ORDER BY id")).all()
+    assert rows[0] == ('user0', 'user0@example.com')
+    assert all(None not in row for row in rows)
+    indexes = {index['name']: index['unique'] for index in inspect(engine).get_indexes('users')}
+    assert indexes['uq_users_email_normalized']
+    assert indexes['uq_users_username_normalized']
+    # already applied
+    assert migrations.upgrade(engine, echo=lambda msg: None) == []
+
+
+def test_backfill_matches_the_app_lookup(engine):
+    insert_users(engine, [('\tÜnal ', ' Ünal@Example.com\n'), ('ÉLODIE', 'élodie@example.com')])
+
+    migrations.upgrade(engine, echo=lambda msg: None)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT username_normalized, email_normalized FROM users ORDER BY id")).all()
+    # the values normalize() gives for the lookup, not SQLite's ASCII-only LOWER and space-only TRIM
+    assert rows == [('ünal', 'ünal@example.com'), ('élodie', 'élodie@example.com')]
+
+
+def test_upgrade_refuses_non_ascii_case_duplicates(engine):
+    insert_users(engine, [('unal', 'Ünal@example.com'), ('other', 'ünal@example.com ')])
+
+    with pytest.raises(MigrationError):
+        migrations.upgrade(engine, echo=lambda msg: None)
+
+
+def test_upgrade_refuses_case_insensitive_duplicates(engine):
+    insert_users(engine, [('alice', 'alice@example.com'), ('ALICE', 'other@example.com')])
+
+    with pytest.raises(MigrationError):
+        migrations.upgrade(engine, echo=lambda msg: None)
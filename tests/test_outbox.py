@@ -0,0 +1,62 @@
+from datetime import datetime
+from models import db, EmailOutbox
+from outbox import OutboxDispatcher, MemoryTransport, DeliveryError, enqueue_email
+
+
+def queue_message(app):
+    with app.app_context():
+        enqueue_email('user@example.com', 'subject', '<p>body</p>')
+        db.session.commit()
+
+
+# Registration writes the confirmation email to the outbox instead of sending it
+def test_register_queues_confirmation_email(client, app):
+    response = client.post('/api/v1/register', json={
+        'username': 'newuser',
+        'email': 'newuser@example.com',
+        'password': 'aSecurePassword'
+    })
+    assert response.status_code == 201
+    with app.app_context():
+        message = EmailOutbox.query.one()
+        assert message.recipient == 'newuser@example.com'
+        assert message.status == 'pending'
+        assert '/confirm-email/' in message.body
+
+
+def test_dispatch_sends_pending_messages(app):
+    queue_message(app)
+    transport = MemoryTransport()
+    dispatcher = OutboxDispatcher(app, transport)
+
+    assert dispatcher.dispatch_once() == 1
+    assert transport.sent[0]['recipient'] == 'user@example.com'
+    with app.app_context():
+        message = EmailOutbox.query.one()
+        assert message.status == 'sent'
+        assert message.attempts == 1
+    # nothing left to deliver
+    assert dispatcher.dispatch_once() == 0
+
+
+def test_dispatch_failure_is_retried_later(app):
+    queue_message(app)
+    dispatcher = OutboxDispatcher(app, MemoryTransport(fail_with=DeliveryError('sink down')))
+
+    assert dispatcher.dispatch_once() == 1
+    with app.app_context():
+        message = EmailOutbox.query.one()
+        assert message.status == 'pending'
+        assert message.last_error == 'sink down'
+        assert message.next_attempt_at > datetime.utcnow()
+    # backoff keeps the message out of the next batch
+    assert dispatcher.dispatch_once() == 0
+
+
+def test_dispatch_dead_letters_after_max_attempts(app):
+    queue_message(app)
+    dispatcher = OutboxDispatcher(app, MemoryTransport(fail_with=DeliveryError('rejected')), max_attempts=1)
+
+    dispatcher.dispatch_once()
+    with app.app_context():
+        assert EmailOutbox.query.one().status == 'dead'
@@ -0,0 +1,64 @@
+import pytest
+from models import db, Users
+from profiling import record_span, span
+
+ADMIN_TOKEN = 'test-admin-token'
+CREDENTIALS = {'email': 'profiled@example.com', 'password': 'aSecurePassword'}
+
+
+@pytest.fixture
+def test_config() -> dict:
+    """Profiling sampled every millisecond, hashes slow enough to show up in the samples."""
+    return {'ADMIN_API_TOKEN': ADMIN_TOKEN, 'PROFILE_INTERVAL': 0.001, 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:200000'}
+
+
+@pytest.fixture
+def app(app):
+    """App with one confirmed user."""
+    with app.app_context():
+        user = Users(username='profiled', email=CREDENTIALS['email'], password=CREDENTIALS['password'])
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def test_slow_request_logs_span_breakdown(client, app, capsys):
+    app.extensions['profiling'].slow_threshold = 0.001
+
+    assert client.post('/api/v1/signin', json=CREDENTIALS).status_code == 200
+
+    line = next(line for line in capsys.readouterr().out.splitlines() if line.startswith('Slow request'))
+    assert 'POST /api/v1/signin 200' in line
+    for kind in ('db=', 'hash=', 'token=', 'email=0.0ms/0', 'other='):
+        assert kind in line
+    assert 'hash=0.0ms' not in line and 'token=0.0ms/0' not in line
+
+
+def test_signed_header_profiles_the_request(client):
+    admin = {'X-Admin-Token': ADMIN_TOKEN}
+    assert client.post('/api/v1/admin/profile').status_code == 403
+
+    token = client.post('/api/v1/admin/profile', headers=admin).json
+    response = client.post('/api/v1/signin', json=CREDENTIALS, headers={token['header']: token['token']})
+
+    assert 'hash;dur=' in response.headers['Server-Timing']
+    profile = client.get('/api/v1/admin/profile', headers=admin)
+    assert profile.headers['Content-Disposition'] == 'attachment; filename=profile.collapsed'
+    stacks = profile.get_data(as_text=True).splitlines()
+    assert stacks and all(stack.startswith('POST /api/v1/signin;') for stack in stacks)
+    assert any('hashing.py:' in stack for stack in stacks)
+    assert client.delete('/api/v1/admin/profile', headers=admin).json['samples'] > 0
+    assert client.get('/api/v1/admin/profile', headers=admin).get_data() == b''
+
+
+def test_requests_are_not_traced_by_default(client):
+
+    response = client.post('/api/v1/signin', json=CREDENTIALS, headers={'X-Profile': 'forged'})
+
+    assert response.status_code == 200 and 'Server-Timing' not in response.headers
+    assert client.get('/api/v1/admin/profile', headers={'X-Admin-Token': ADMIN_TOKEN}).get_data() == b''
+    # outside a traced request the hooks do nothing
+    record_span('db', 1.0)
+    with span('token'):
+        pass
@@ -1,28 +1,8 @@
 import pytest
-from flask import Flask
-from flask_restful import Api
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.exc import IntegrityError
-from controllers import initialize_routes
 from models import db, Users
 
-@pytest.fixture
-def app():
-    """Create and configure a new app instance for each test."""
-    app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['TESTING'] = True
-    db.init_app(app)
-    # Create a context for the app
-    with app.app_context():
-        db.create_all()
-    return app
-
-@pytest.fixture
-def client(app):
-    api = Api(app)
-    initialize_routes(api)
-    return app.test_client()
-
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
@@ -42,6 +22,18 @@ def test_register_success(client, mock_send_confirmation_email):
     assert response.status_code == 201
     assert response.json['message'] == 'User created successfully. Email confirmation sent'
 
+# Emails longer than the column are rejected, MySQL's INSERT IGNORE would truncate them
+def test_register_email_too_long(client, app, mock_send_confirmation_email):
+    response = client.post('/api/v1/register', json={
+        'username': 'newuser',
+        'email': 'a' * 244 + '@example.com',
+        'password': 'aSecurePassword'
+    })
+    assert response.status_code == 400
+    assert 'email' in response.json
+    with app.app_context():
+        assert Users.query.count() == 0
+
 # Registration with existing email/username
 def test_register_existing_user(client, app, mock_send_confirmation_email):
     with app.app_context():
@@ -56,6 +48,23 @@ def test_register_existing_user(client, app, mock_send_confirmation_email):
     })
     assert response.status_code == 400
     assert response.json['message'] == 'Email or Username already exists'
+    assert response.json['errors'] == {'email': ['Email already exists'], 'username': ['Username already exists']}
+
+# Email and username are unique regardless of case
+def test_register_existing_user_different_case(client, app, mock_send_confirmation_email):
+    with app.app_context():
+        user = Users(username='existinguser', email='existing@example.com', password='password123')
+        db.session.add(user)
+        db.session.commit()
+
+    response = client.post('/api/v1/register', json={
+        'username': 'ExistingUser',
+        'email': 'other@example.com',
+        'password': 'password123'
+    })
+    assert response.status_code == 400
+    assert response.json['message'] == 'Email or Username already exists'
+    assert response.json['errors'] == {'username': ['Username already exists']}
 
 # Invalid input data
 def test_register_invalid_data(client):
@@ -79,16 +88,37 @@ def test_register_email_send_failure(client, monkeypatch):
 
 # Testing database errors (e.g., IntegrityError)
 @pytest.fixture
-def mock_db_session_add_raise_integrity_error(monkeypatch):
-    def mock_add(*args, **kwargs):
+def mock_db_session_execute_raise_integrity_error(monkeypatch):
+    def mock_execute(*args, **kwargs):
         raise IntegrityError('', '', '')
-    monkeypatch.setattr(db.session, 'add', mock_add)
+    monkeypatch.setattr(db.session, 'execute', mock_execute)
 
-def test_register_db_error(client, mock_db_session_add_raise_integrity_error):
+def test_register_db_error(client, mock_db_session_execute_raise_integrity_error):
     response = client.post('/api/v1/register', json={
         'username': 'userDbError',
         'email': 'userdberror@example.com',
         'password': 'aSecurePassword'
     })
     assert response.status_code == 409
-    assert response.json['message'] == 'A user with this email or username already exists.'
\ No newline at end of file
+    assert response.json['message'] == 'A user with this email or username already exists.'
+
+# Parallel signups for the same email or username, exactly one wins
+def test_register_parallel_duplicates(app):
+    def register(n):
+        # odd requests reuse the email, even ones the username
+        return app.test_client().post('/api/v1/register', json={
+            'username': 'racer' if n % 2 == 0 else f'racer{n}',
+            'email': 'racer@example.com' if n % 2 else f'racer{n}@example.com',
+            'password': 'aSecurePassword'
+        })
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        responses = list(executor.map(register, range(32)))
+
+    created = [r for r in responses if r.status_code == 201]
+    rejected = [r for r in responses if r.status_code == 400]
+    assert len(created) == 2
+    assert len(rejected) == 30
+    assert all(r.json['errors'] for r in rejected)
+    with app.app_context():
+        assert Users.query.count() == 2
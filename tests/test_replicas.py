@@ -0,0 +1,166 @@
+import pytest
+from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy.exc import OperationalError
+from hashing import password_hasher
+from models import db, Users
+from replicas import ReplicaSet, replica_reads
+
+
+@pytest.fixture
+def test_config(tmp_path) -> dict:
+    """SQLite primary with two SQLite files standing in for the replicas."""
+    return {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+            'SQLALCHEMY_REPLICAS': f"sqlite:///{tmp_path / 'replica_a.db'}, sqlite:///{tmp_path / 'replica_b.db'}"}
+
+
+@pytest.fixture
+def app(app):
+    replicas = app.extensions['replicas']
+    for engine in replicas.engines:
+        db.metadata.create_all(engine)
+    yield app
+    replicas.dispose()
+
+
+def add_user(app, username, confirmed=True):
+    with app.app_context():
+        user = Users(username=username, email=f'{username}@example.com', password='aSecurePassword')
+        user.email_confirmed = confirmed
+        db.session.add(user)
+        db.session.commit()
+
+
+def replicate(app):
+    """Copy the primary's users to every replica"""
+    with app.app_context():
+        rows = [dict(row._mapping) for row in db.session.execute(select(Users.__table__))]
+    for engine in app.extensions['replicas'].engines:
+        with engine.begin() as connection:
+            connection.execute(delete(Users.__table__))
+            if rows:
+                connection.execute(insert(Users.__table__), rows)
+
+
+def database_name():
+    """Which database answered, each file holds a user named after it"""
+    return db.session.execute(select(Users.username).order_by(Users.id)).scalar()
+
+
+def mark_databases(app):
+    add_user(app, 'primary')
+    for engine, name in zip(app.extensions['replicas'].engines, ('replica_a', 'replica_b')):
+        with engine.begin() as connection:
+            connection.execute(insert(Users.__table__), [{
+                'user_id': name, 'username': name, 'email': f'{name}@example.com', 'username_normalized': name,
+                'email_normalized': f'{name}@example.com', 'password': 'x', 'email_confirmed': True,
+                'token_version': 0}])
+
+
+def test_reads_are_spread_over_the_replicas(app):
+    mark_databases(app)
+
+    @replica_reads
+    def read():
+        return [database_name() for _ in range(4)]
+
+    with app.test_request_context():
+        assert read() == ['replica_a', 'replica_b', 'replica_a', 'replica_b']
+
+
+def test_reads_without_opt_in_use_the_primary(app):
+    mark_databases(app)
+
+    with app.test_request_context():
+        assert database_name() == 'primary'
+
+
+def test_write_pins_the_request_to_the_primary(app):
+    mark_databases(app)
+
+    @replica_reads
+    def read_write_read():
+        before = database_name()
+        db.session.add(Users(username='new', email='new@example.com', password='aSecurePassword'))
+        db.session.commit()
+        return before, database_name(), db.session.query(Users).count()
+
+    with app.test_request_context():
+        assert read_write_read() == ('replica_a', 'primary', 2)
+
+
+def test_failing_replica_is_ejected(app, tmp_path):
+    mark_databases(app)
+    healthy = app.extensions['replicas'].engines[1]
+    # a replica file in a directory that does not exist cannot be opened
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    replicas = app.extensions['replicas'] = ReplicaSet([broken, healthy], eject_seconds=60)
+
+    @replica_reads
+    def read():
+        return database_name()
+
+    with app.test_request_context():
+        with pytest.raises(OperationalError):
+            read()
+    with app.test_request_context():
+        assert [read() for _ in range(3)] == ['replica_b'] * 3
+    assert replicas.status()[0]['ejected_for'] > 0
+
+    replicas.eject(healthy)
+    with app.test_request_context():
+        # every replica is out, reads fall back to the primary
+        assert read() == 'primary'
+
+
+def test_least_loaded_prefers_idle_replicas(app):
+    replicas = app.extensions['replicas']
+    least_loaded = ReplicaSet(replicas.engines, strategy='least_loaded')
+    busy, idle = replicas.engines
+
+    with busy.connect():
+        assert {least_loaded.choose() for _ in range(4)} == {idle}
+    assert {least_loaded.choose() for _ in range(4)} == {busy, idle}
+
+
+def test_signin_reads_a_fresh_confirmation_from_the_primary(app, client):
+    add_user(app, 'lagging', confirmed=False)
+    replicate(app)
+    # confirmed on the primary, the replicas have not caught up
+    with app.app_context():
+        Users.query.filter_by(username='lagging').update({'email_confirmed': True})
+        db.session.commit()
+
+    response = client.post('/api/v1/signin', json={'email': 'lagging@example.com', 'password': 'aSecurePassword'})
+
+    assert response.status_code == 200
+    assert response.json['is_email_confirmed'] is True
+
+
+def test_user_missing_from_the_replicas_is_read_from_the_primary(app, client):
+    replicate(app)
+    add_user(app, 'fresh', confirmed=False)
+
+    response = client.post('/api/v1/resend-confirmation', json={'email': 'fresh@example.com'})
+
+    assert response.status_code == 200
+
+
+def test_signin_rehashes_on_the_primary(app, client):
+    add_user(app, 'rehashed')
+    add_user(app, 'deleted')
+    replicate(app)
+    # deleted on the primary, the replicas have not caught up
+    with app.app_context():
+        Users.query.filter_by(username='deleted').delete()
+        db.session.commit()
+    password_hasher.configure(method='pbkdf2:sha256:2000')
+
+    statuses = [client.post('/api/v1/signin', json={'email': f'{name}@example.com', 'password': 'aSecurePassword'})
+                .status_code for name in ('rehashed', 'deleted')]
+
+    # the hash is read from the primary, where the deleted user is gone
+    assert statuses == [200, 401]
+
+    with app.app_context():
+        assert Users.find_by_email('rehashed@example.com').password.startswith('pbkdf2:sha256:2000$')
+        assert Users.find_by_email('deleted@example.com') is None
@@ -0,0 +1,94 @@
+import threading
+import pytest
+from models import db, EmailOutbox, Users
+from resend import get_resend_coalescer
+
+
+@pytest.fixture
+def app(app):
+    """App with one unconfirmed user."""
+    with app.app_context():
+        db.session.add(Users(username='pending', email='pending@example.com', password='aSecurePassword'))
+        db.session.commit()
+    return app
+
+
+def outbox(app):
+    with app.app_context():
+        return EmailOutbox.query.all()
+
+
+def resend(client, email='pending@example.com'):
+    return client.post('/api/v1/resend-confirmation', json={'email': email})
+
+
+def test_repeated_resends_send_one_email(client, app):
+    first = resend(client)
+    assert first.status_code == 200 and 'Retry-After' not in first.headers
+
+    for _ in range(5):
+        again = resend(client, 'Pending@Example.com ')
+        assert again.status_code == 200
+        assert 0 < int(again.headers['Retry-After']) <= 60
+
+    assert len(outbox(app)) == 1
+    with app.app_context():
+        assert get_resend_coalescer().stats() == {'sent': 1, 'suppressed': 5}
+
+
+def test_unknown_address_is_remembered(client, app, monkeypatch):
+    assert resend(client, 'nobody@example.com').status_code == 404
+
+    lookups = []
+    monkeypatch.setattr('cache.UserCache.get_by_email', lambda self, email: lookups.append(email))
+    assert resend(client, 'nobody@example.com').status_code == 404
+    assert lookups == []
+
+
+def test_resend_after_cooldown_reuses_the_token(client, app):
+    resend(client)
+    with app.app_context():
+        # the cooldown ran out, the token is still fresh
+        get_resend_coalescer().store.delete('resend:last:pending@example.com')
+
+    assert resend(client).status_code == 200
+    first, second = outbox(app)
+    assert first.body == second.body
+    with app.app_context():
+        assert get_resend_coalescer().reusable_token('pending@example.com') in first.body
+
+
+def test_resend_right_after_registration_is_suppressed(client, app):
+    response = client.post('/api/v1/register', json={
+        'username': 'newuser',
+        'email': 'newuser@example.com',
+        'password': 'aSecurePassword'
+    })
+    assert response.status_code == 201
+
+    assert resend(client, 'newuser@example.com').status_code == 200
+    assert [message.recipient for message in outbox(app)] == ['newuser@example.com']
+
+
+def test_concurrent_resends_send_one_email(app):
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(resend(client).status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 8
+    assert len(outbox(app)) == 1
+
+
+def test_non_string_email_is_rejected(client):
+    assert resend(client, 123).status_code == 400
+    assert resend(client, {'email': 'pending@example.com'}).status_code == 400
@@ -0,0 +1,88 @@
+from decimal import Decimal
+import pytest
+from flask import Flask
+from flask_restful import Api, Resource
+from marshmallow import ValidationError
+import serializers
+from serializers import init_json_representation, load_registration, registration_schema, update_schema
+
+VALID = {'username': 'newuser', 'email': 'newuser@example.com', 'password': 'aSecurePassword'}
+
+
+@pytest.mark.parametrize('payload, partial', [
+    (VALID, False),
+    ({'email': 'other@example.com'}, True),
+    ({'password': 'anotherPassword'}, True),
+])
+def test_fast_path_matches_the_schema(payload, partial, monkeypatch):
+    expected = (update_schema if partial else registration_schema).load(payload)
+    # the schema is not consulted for a valid payload
+    monkeypatch.setattr(serializers, 'registration_schema', None)
+    monkeypatch.setattr(serializers, 'update_schema', None)
+
+    assert load_registration(payload, partial) == expected
+
+
+@pytest.mark.parametrize('payload, partial', [
+    (dict(VALID, email='not-an-email'), False),
+    (dict(VALID, username='ab'), False),
+    (dict(VALID, email='a' * 244 + '@example.com'), False),
+    (dict(VALID, password=12345678), False),
+    (dict(VALID, admin=True), False),
+    ({'username': 'newuser'}, False),
+    ({'email': 'bad'}, True),
+    (None, False),
+    (['newuser'], False),
+])
+def test_invalid_payloads_get_the_schema_errors(payload, partial):
+    with pytest.raises(ValidationError) as expected:
+        (update_schema if partial else registration_schema).load(payload)
+    with pytest.raises(ValidationError) as error:
+        load_registration(payload, partial)
+
+    assert error.value.messages == expected.value.messages
+
+
+class Payload(Resource):
+    def get(self):
+        return {'message': 'ok', 'count': 3, 'nested': {1: [True, None]}}, 200, {'X-Test': 'yes'}
+
+
+class Unsupported(Resource):
+    def get(self):
+        return {'amount': Decimal('1.5')}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.mark.parametrize('name', ['orjson', 'json'])
+def test_representations_return_the_same_json(app, name):
+    api = Api(app)
+    api.add_resource(Payload, '/payload')
+    api.add_resource(Unsupported, '/unsupported')
+    init_json_representation(api, name)
+    client = app.test_client()
+
+    response = client.get('/payload')
+    assert response.json == {'message': 'ok', 'count': 3, 'nested': {'1': [True, None]}}
+    assert response.content_type == 'application/json'
+    assert response.headers['X-Test'] == 'yes'
+    assert response.get_data().endswith(b'\n')
+    assert client.get('/missing').status_code == 404
+    if name == 'orjson':
+        # types orjson cannot encode go to the stdlib encoder, which fails the same way as before
+        with pytest.raises(TypeError):
+            client.get('/unsupported')
+
+
+def test_representation_from_config(app):
+    app.config['JSON_REPRESENTATION'] = 'json'
+    assert init_json_representation(Api(app)) is serializers.stdlib_output_json
+    app.config['JSON_REPRESENTATION'] = 'yaml'
+    with pytest.raises(ValueError):
+        init_json_representation(Api(app))
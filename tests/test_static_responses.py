@@ -0,0 +1,89 @@
+import gzip
+import os
+import zlib
+import pytest
+from flask import request
+import static_responses
+import views
+from static_responses import PrecompiledResponse
+
+TEMPLATE = '<html><body>{}<p>{{{{ url_for("static", filename="img/x.png") }}}}</p></body></html>'
+
+
+@pytest.fixture
+def template_dir(tmp_path):
+    (tmp_path / 'api_documentation.html').write_text(TEMPLATE.format('first ' * 100))
+    return tmp_path
+
+
+@pytest.fixture
+def app(app, template_dir):
+    """App rendering the documentation from a temporary template folder."""
+    app.template_folder = str(template_dir)
+    return app
+
+
+def test_documentation_is_rendered_once(client, monkeypatch):
+    renders = []
+    render = views.render_template
+    monkeypatch.setattr('views.render_template', lambda template: renders.append(template) or render(template))
+
+    first = client.get('/')
+    second = client.get('/')
+
+    assert first.status_code == 200 and first.content_type == 'text/html; charset=utf-8'
+    assert 'first' in first.get_data(as_text=True) and '/static/img/x.png' in first.get_data(as_text=True)
+    assert second.get_data() == first.get_data()
+    assert len(renders) == 1
+    assert first.headers['ETag'] and 'max-age=3600' in first.headers['Cache-Control']
+
+
+def test_gzip_variant_and_conditional_requests(client):
+    plain = client.get('/')
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert len(compressed.get_data()) < len(plain.get_data())
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+
+    not_modified = client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert not_modified.status_code == 304 and not_modified.get_data() == b''
+    # the identity ETag does not match the gzip variant
+    assert client.get('/', headers={'Accept-Encoding': 'gzip',
+                                    'If-None-Match': plain.headers['ETag']}).status_code == 200
+
+
+def test_changed_template_is_rendered_again_with_auto_reload(app, client, template_dir):
+    app.config['TEMPLATES_AUTO_RELOAD'] = True
+    assert 'first' in client.get('/').get_data(as_text=True)
+
+    path = template_dir / 'api_documentation.html'
+    path.write_text(TEMPLATE.format('second'))
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    assert 'second' in client.get('/').get_data(as_text=True)
+
+
+def test_liveness_is_revalidated(client):
+    response = client.get('/healthz')
+
+    assert response.json == {'status': 'ok'}
+    assert response.headers['Cache-Control'] == 'no-cache'
+    # too small to be worth compressing
+    assert 'Content-Encoding' not in client.get('/healthz', headers={'Accept-Encoding': 'gzip'}).headers
+    assert client.get('/healthz', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_preferred_encoding_follows_client_quality(app, monkeypatch):
+    monkeypatch.setattr(static_responses, 'COMPRESSORS', {'br': zlib.compress, 'gzip': gzip.compress})
+    compiled = PrecompiledResponse('x' * 1000, 'text/plain')
+
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip, br'}):
+        assert compiled.encoding_for(request.accept_encodings) == 'br'
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip;q=1.0, br;q=0.5'}):
+        assert compiled.encoding_for(request.accept_encodings) == 'gzip'
+    with app.test_request_context(headers={'Accept-Encoding': 'identity'}):
+        assert compiled.encoding_for(request.accept_encodings) == 'identity'
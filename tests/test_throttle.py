@@ -0,0 +1,118 @@
+import pytest
+from sqlalchemy import event
+import throttle
+from hashing import password_hasher
+from models import db, Users
+from throttle import LoginThrottle, init_throttle
+
+
+class Clock:
+    """Stands in for the time module, both clocks advance together"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(throttle, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def test_config() -> dict:
+    """A tight sign in throttle."""
+    return {'LOGIN_THROTTLE_ACCOUNT_LIMIT': 3, 'LOGIN_THROTTLE_IP_LIMIT': 5, 'LOGIN_THROTTLE_LOCKOUT': 60,
+            'TRUSTED_PROXIES': 1}
+
+
+@pytest.fixture
+def app(clock, app):
+    """App with a confirmed user."""
+    with app.app_context():
+        user = Users(username='victim', email='victim@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return app
+
+
+def sign_in(client, email='victim@example.com', password='wrong', ip='10.0.0.1'):
+    return client.post('/api/v1/signin', json={'email': email, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_account_is_locked_before_lookup_and_hashing(client, app, monkeypatch):
+    assert [sign_in(client, ip=f'10.0.0.{i}').status_code for i in range(3)] == [401, 401, 401]
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    monkeypatch.setattr(password_hasher, 'verify', lambda *args: pytest.fail('hashed while locked out'))
+
+    response = sign_in(client, password='aSecurePassword', ip='10.0.0.9')
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '60'
+    assert statements == []
+
+
+def test_lockout_doubles_and_expires(client, clock):
+    for i in range(3):
+        sign_in(client, email='Victim@Example.com ', ip=f'10.0.0.{i}')
+    assert sign_in(client).headers['Retry-After'] == '60'
+
+    clock.now += 61
+    assert [sign_in(client, ip=f'10.0.1.{i}').status_code for i in range(3)] == [401, 401, 401]
+    assert sign_in(client).headers['Retry-After'] == '120'
+
+    clock.now += 121
+    assert sign_in(client, password='aSecurePassword').status_code == 200
+
+
+def test_address_is_locked_across_accounts(client):
+    statuses = [sign_in(client, email=f'user{i}@example.com').status_code for i in range(5)]
+
+    assert statuses == [401] * 5
+    assert sign_in(client, email='someone@example.com').status_code == 429
+    assert sign_in(client, password='aSecurePassword', ip='10.0.0.2').status_code == 200
+
+
+def test_addresses_are_not_throttled_without_trusted_proxies(app, client):
+    # every client would share the load balancer's address
+    app.config['TRUSTED_PROXIES'] = 0
+    init_throttle(app)
+
+    statuses = [sign_in(client, email=f'user{i}@example.com').status_code for i in range(10)]
+
+    assert statuses == [401] * 10
+    assert sign_in(client, password='aSecurePassword').status_code == 200
+
+
+def test_successful_sign_in_forgets_account_failures(client):
+    for i in range(2):
+        sign_in(client, ip=f'10.0.1.{i}')
+    assert sign_in(client, password='aSecurePassword', ip='10.0.1.8').status_code == 200
+
+    assert [sign_in(client, ip=f'10.0.2.{i}').status_code for i in range(3)] == [401, 401, 401]
+
+
+def test_previous_window_counts_by_its_overlap(clock):
+    login_throttle = LoginThrottle(window=100, ip_limit=0, account_limit=4)
+    clock.now = 1000.0
+    for _ in range(3):
+        login_throttle.failure(None, 'a@example.com')
+
+    # half of the previous window still overlaps: 3 * 0.5 + 1 stays below the limit
+    clock.now = 1150.0
+    assert login_throttle.failure(None, 'a@example.com') == 0
+    assert login_throttle.failure(None, 'a@example.com') == 0
+    # 3 * 0.5 + 3 reaches it
+    assert login_throttle.failure(None, 'a@example.com') == 60
+    assert login_throttle.retry_after(None, 'a@example.com') == (60, 'account')
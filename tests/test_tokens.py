@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import event
+from models import db, Users
+from tokens import REVOKED, TokenVersionStore
+
+
+@pytest.fixture
+def test_config() -> dict:
+    """Claims-only reads enabled."""
+    return {'JWT_CLAIMS_ONLY_READS': True}
+
+
+@pytest.fixture
+def tokens(client, app):
+    with app.app_context():
+        user = Users(username='tokenuser', email='token@example.com', password='aSecurePassword')
+        user.email_confirmed = True
+        db.session.add(user)
+        db.session.commit()
+    return client.post('/api/v1/signin', json={'email': 'token@example.com', 'password': 'aSecurePassword'}).json
+
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_protected_read_served_from_claims(client, app, tokens):
+    # first request caches the token version
+    client.get('/api/v1/protected', headers=auth(tokens['access_token']))
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    response = client.get('/api/v1/protected', headers=auth(tokens['access_token']))
+    assert response.status_code == 200
+    assert response.json == {'user_id': tokens['user_id'], 'username': 'tokenuser',
+                             'email': 'token@example.com', 'is_email_confirmed': True}
+
+    response = client.post('/api/v1/refresh_token', headers=auth(tokens['refresh_token']))
+    assert response.status_code == 200
+    assert statements == []
+
+
+def test_update_revokes_old_tokens(client, tokens):
+    response = client.put('/api/v1/users/', json={'username': 'renamed'}, headers=auth(tokens['access_token']))
+    assert response.status_code == 200
+
+    assert client.get('/api/v1/protected', headers=auth(tokens['access_token'])).status_code == 401
+    assert client.post('/api/v1/refresh_token', headers=auth(tokens['refresh_token'])).status_code == 401
+    response = client.get('/api/v1/protected', headers=auth(response.json['access_token']))
+    assert response.json['username'] == 'renamed'
+
+
+def test_delete_revokes_tokens(client, tokens):
+    assert client.delete('/api/v1/users/', headers=auth(tokens['access_token'])).status_code == 200
+    assert client.get('/api/v1/protected', headers=auth(tokens['access_token'])).status_code == 401
+
+
+@pytest.mark.parametrize('test_config', [{'USER_CACHE_SHARED': 'memory'}])
+def test_other_processes_pick_up_revocations_through_the_shared_tier(client, app, tokens):
+    user_id = tokens['user_id']
+    with app.app_context():
+        # other workers' stores, with and without the shared tier
+        shared = TokenVersionStore(shared=app.extensions['user_cache'].shared)
+        local = TokenVersionStore()
+        assert shared.get(user_id) == local.get(user_id) == 0
+
+    renamed = client.put('/api/v1/users/', json={'username': 'renamed'}, headers=auth(tokens['access_token'])).json
+    assert shared.get(user_id) == 1
+    client.delete('/api/v1/users/', headers=auth(renamed['access_token']))
+    assert shared.get(user_id) == REVOKED
+    # until its entry expires (TOKEN_VERSION_CACHE_TTL)
+    assert local.get(user_id) == 0
+
+
+def test_signin_with_non_string_fields_is_rejected(client, tokens):
+    for payload in ({'email': 123, 'password': 'aSecurePassword'}, {'email': ['token@example.com']},
+                    {'email': 'token@example.com', 'password': 12345678}):
+        assert client.post('/api/v1/signin', json=payload).status_code == 401
@@ -0,0 +1,113 @@
+import math
+import time
+from flask import current_app
+
+from cache import MemorySharedCache, SharedCache
+from metrics import LOGIN_THROTTLED
+from models import normalize
+
+
+class LoginThrottle:
+    """
+    Failed sign in counters per client address and per account over a sliding
+    window (the current fixed window plus the overlapping share of the previous one).
+    Reaching a limit locks that address or account out for `lockout` seconds,
+    doubled with every further lockout within `strikes_ttl`, up to `max_lockout`.
+    Counters live in a SharedCache, so with a shared backend every worker sees the same counts.
+    """
+
+    def __init__(self, store: SharedCache = None, window: float = 300, ip_limit: int = 50,
+                 account_limit: int = 5, lockout: float = 60, max_lockout: float = 3600,
+                 strikes_ttl: float = 24 * 3600):
+        self.store = store or MemorySharedCache()
+        self.window = window
+        self.limits = {'ip': ip_limit, 'account': account_limit}
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.strikes_ttl = strikes_ttl
+
+    def _subjects(self, ip: str, account: str) -> list:
+        subjects = []
+        if ip and self.limits['ip']:
+            subjects.append(('ip', ip))
+        if account and self.limits['account']:
+            subjects.append(('account', normalize(account)))
+        return subjects
+
+    def _buckets(self, key: str, now: float) -> tuple:
+        bucket = int(now // self.window)
+        return f'throttle:failures:{key}:{bucket}', f'throttle:failures:{key}:{bucket - 1}'
+
+    def retry_after(self, ip: str, account: str) -> tuple:
+        """
+        Check before any lookup or hashing.
+        :return: (seconds until the next attempt is allowed, locked scope), (0, None) when allowed
+        """
+        now = time.time()
+        wait, locked = 0.0, None
+        for scope, subject in self._subjects(ip, account):
+            lock = self.store.get(f'throttle:lock:{scope}:{subject}')
+            if lock is not None and lock['until'] - now > wait:
+                wait, locked = lock['until'] - now, scope
+        return math.ceil(wait), locked
+
+    def failure(self, ip: str, account: str) -> int:
+        """Record a failed attempt, :return: lockout seconds if this attempt started one, else 0"""
+        now = time.time()
+        locked_for = 0
+        for scope, subject in self._subjects(ip, account):
+            limit = self.limits[scope]
+            key = f'{scope}:{subject}'
+            current, previous = self._buckets(key, now)
+            count = self.store.incr(current, 2 * self.window)
+            # the previous window counts by the share of it still inside the sliding window
+            count += (self.store.get(previous) or {}).get('count', 0) * (1 - (now % self.window) / self.window)
+            if count >= limit:
+                strikes = self.store.incr(f'throttle:strikes:{key}', self.strikes_ttl)
+                seconds = min(self.max_lockout, self.lockout * 2 ** (strikes - 1))
+                self.store.set(f'throttle:lock:{key}', {'until': now + seconds}, seconds)
+                # the next lockout needs a full set of new failures
+                self.store.delete(current, previous)
+                locked_for = max(locked_for, seconds)
+        return math.ceil(locked_for)
+
+    def success(self, ip: str, account: str):
+        """Forget an account's failures after a successful sign in, the address keeps its count"""
+        if not account:
+            return
+        key = f'account:{normalize(account)}'
+        self.store.delete(*self._buckets(key, time.time()), f'throttle:strikes:{key}')
+
+
+def get_login_throttle():
+    """Login throttle of the current app, None when init_throttle was not called or it is disabled"""
+    return current_app.extensions.get('login_throttle')
+
+
+def throttled_response(seconds: int, scope: str):
+    LOGIN_THROTTLED.labels(scope).inc()
+    return {'message': 'Too many failed sign in attempts, please try again later.'}, 429, \
+        {'Retry-After': str(max(1, seconds))}
+
+
+def init_throttle(application, store: SharedCache = None) -> LoginThrottle:
+    """
+    Func to configure the sign in throttle from the LOGIN_THROTTLE_* config keys.
+    Addresses are only throttled with TRUSTED_PROXIES set: behind a load balancer
+    without it, every client shares the balancer's address and one lockout would lock out everyone.
+    """
+    config = application.config
+    if not config.get('LOGIN_THROTTLE_ENABLED', True):
+        application.extensions.pop('login_throttle', None)
+        return None
+    ip_limit = int(config.get('LOGIN_THROTTLE_IP_LIMIT', 50)) if int(config.get('TRUSTED_PROXIES', 0)) else 0
+    throttle = LoginThrottle(
+        store=store or MemorySharedCache(int(config.get('LOGIN_THROTTLE_STORE_SIZE', 100000))),
+        window=float(config.get('LOGIN_THROTTLE_WINDOW', 300)),
+        ip_limit=ip_limit,
+        account_limit=int(config.get('LOGIN_THROTTLE_ACCOUNT_LIMIT', 5)),
+        lockout=float(config.get('LOGIN_THROTTLE_LOCKOUT', 60)),
+        max_lockout=float(config.get('LOGIN_THROTTLE_MAX_LOCKOUT', 3600)),
+    )
+    application.extensions['login_throttle'] = throttle
+    return throttle
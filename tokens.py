@@ -0,0 +1,163 @@
+import threading
+from datetime import timedelta
+from cachetools import TTLCache
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+from cache import SharedCache, get_user_cache
+from denylist import get_denylist
+from models import Users
+from profiling import span
+from replicas import use_primary
+
+# cached version of a deleted user, no token matches it
+REVOKED = -1
+# user fields copied into every token
+CLAIM_NAMES = ("email", "username", "id", "confirmed", "ver")
+
+
+def user_claims(user: Users) -> dict:
+    """Claims carried by access and refresh tokens, enough to serve reads without the database"""
+    return {
+        "email": user.email,
+        "username": user.username,
+        "id": user.user_id,
+        "confirmed": bool(user.email_confirmed),
+        "ver": user.token_version or 0,
+    }
+
+
+def issue_access_token(claims: dict, expires_delta: timedelta = timedelta(hours=1)) -> str:
+    with span('token'):
+        return create_access_token(identity=claims['id'], expires_delta=expires_delta, additional_claims=claims)
+
+
+def issue_refresh_token(claims: dict, expires_delta: timedelta = timedelta(days=30)) -> str:
+    with span('token'):
+        return create_refresh_token(identity=claims['id'], expires_delta=expires_delta, additional_claims=claims)
+
+
+def introspect_tokens(encoded_tokens: list) -> list:
+    """
+    Verify a batch of access/refresh tokens in one pass.
+    Signatures are checked per token, then every referenced user is loaded with a
+    single IN (...) query to check that it still exists and the token version is current.
+    Logged out tokens are checked against the denylist.
+    :return: one {'active', 'claims' | 'error'} result per token, in input order
+    """
+    decoded = {}
+    for token in set(encoded_tokens):
+        try:
+            decoded[token] = decode_token(token)
+        except (PyJWTError, JWTExtendedException) as err:
+            decoded[token] = err
+
+    user_ids = {payload['sub'] for payload in decoded.values() if isinstance(payload, dict)}
+    users = {user.user_id: user for user in Users.query.filter(Users.user_id.in_(user_ids))} if user_ids else {}
+
+    denylist = get_denylist()
+    results = []
+    for token in encoded_tokens:
+        payload = decoded[token]
+        if not isinstance(payload, dict):
+            results.append({'active': False, 'error': str(payload) or type(payload).__name__})
+            continue
+        user = users.get(payload['sub'])
+        if user is None:
+            results.append({'active': False, 'error': 'User not found'})
+        elif payload.get('ver', 0) != user.token_version or denylist.contains(payload['jti'], payload['exp']):
+            results.append({'active': False, 'error': 'Token has been revoked'})
+        else:
+            results.append({'active': True, 'claims': {
+                'user_id': user.user_id,
+                'username': user.username,
+                'email': user.email,
+                'is_email_confirmed': bool(user.email_confirmed),
+                'token_type': payload['type'],
+                'jti': payload['jti'],
+                'exp': payload['exp'],
+            }})
+    return results
+
+
+def claims_only_reads() -> bool:
+    """True when protected reads are served from verified token claims"""
+    return bool(current_app.config.get('JWT_CLAIMS_ONLY_READS', False))
+
+
+class TokenVersionStore:
+    """
+    Per-user token versions. A token is valid only while its 'ver' claim equals the
+    user's current version, so bumping the version (or deleting the user) revokes
+    every issued token. With a shared tier the versions are kept there, so a bump or
+    revocation is seen by every process at once. Without one they are cached in
+    process with a TTL and other processes pick up a change once their entry expires.
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = 30, shared: SharedCache = None, shared_ttl: float = 300):
+        self._lock = threading.Lock()
+        self.configure(maxsize, ttl, shared, shared_ttl)
+
+    def configure(self, maxsize: int = 100000, ttl: float = 30, shared: SharedCache = None, shared_ttl: float = 300):
+        with self._lock:
+            self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+            self.shared = shared
+            self.shared_ttl = shared_ttl
+
+    def _cached(self, user_id: str):
+        if self.shared is not None:
+            value = self.shared.get(f'token:ver:{user_id}')
+            return None if value is None else value['version']
+        with self._lock:
+            return self._cache.get(user_id)
+
+    def get(self, user_id: str) -> int:
+        """Current version of a user, REVOKED if the user does not exist"""
+        version = self._cached(user_id)
+        if version is None:
+            # cached for the TTL, so read from the primary rather than a replica that may miss a bump
+            with use_primary():
+                record = get_user_cache().get_by_user_id(user_id)
+            version = REVOKED if record is None else record.token_version
+            self.set(user_id, version)
+        return version
+
+    def set(self, user_id: str, version: int):
+        """Cache a user's version, in the shared tier when there is one"""
+        if self.shared is not None:
+            self.shared.set(f'token:ver:{user_id}', {'version': version}, self.shared_ttl)
+            return
+        with self._lock:
+            self._cache[user_id] = version
+
+    def bump(self, user: Users):
+        """Increment the user's version in the database, the caller commits and then calls set()"""
+        user.token_version = Users.token_version + 1
+
+    def revoke(self, user_id: str):
+        """Mark a deleted user so its tokens are rejected right away, in every process with a shared tier"""
+        self.set(user_id, REVOKED)
+
+    def is_current(self, jwt_payload: dict) -> bool:
+        version = self.get(jwt_payload['sub'])
+        return version != REVOKED and jwt_payload.get('ver', 0) == version
+
+
+token_versions = TokenVersionStore()
+
+
+def init_tokens(application, jwt):
+    """Func to configure token versions and reject outdated or logged out tokens on every jwt_required endpoint"""
+    # versions go to the user cache's shared tier when it has one (USER_CACHE_SHARED)
+    user_cache = application.extensions.get('user_cache')
+    token_versions.configure(maxsize=int(application.config.get('TOKEN_VERSION_CACHE_SIZE', 100000)),
+                             ttl=float(application.config.get('TOKEN_VERSION_CACHE_TTL', 30)),
+                             shared=user_cache.shared if user_cache is not None else None,
+                             shared_ttl=user_cache.shared_ttl if user_cache is not None else 300)
+
+    @jwt.token_in_blocklist_loader
+    def check_token_version(jwt_header, jwt_payload):
+        return not token_versions.is_current(jwt_payload) or \
+            get_denylist().contains(jwt_payload['jti'], jwt_payload['exp'])
@@ -0,0 +1,38 @@
+"""
+Token verification for downstream services.
+
+Other services verify access tokens locally against this service's JWKS
+instead of calling /api/v1/protected:
+
+    verifier = TokenVerifier('https://auth.example.com/.well-known/jwks.json')
+    claims = verifier.verify(token)
+"""
+import jwt
+from jwt import PyJWKClient
+
+
+class TokenVerifier:
+    """
+    Verifies RS256/EdDSA tokens with keys fetched from a JWKS endpoint.
+    The key set is cached for `cache_ttl` seconds, a token with an unknown kid
+    (e.g. right after a key rotation) triggers a single refetch.
+    """
+
+    def __init__(self, jwks_url: str, cache_ttl: float = 300, algorithms: tuple = ('RS256', 'EdDSA'),
+                 leeway: float = 0, timeout: float = 5):
+        self.algorithms = list(algorithms)
+        self.leeway = leeway
+        self._client = PyJWKClient(jwks_url, cache_jwk_set=True, lifespan=cache_ttl, timeout=timeout)
+
+    def verify(self, token: str, token_type: str = 'access') -> dict:
+        """
+        Verify signature, expiry and token type.
+        :return: token claims
+        :raise jwt.InvalidTokenError: if the token is not valid
+        """
+        signing_key = self._client.get_signing_key_from_jwt(token)
+        claims = jwt.decode(token, signing_key.key, algorithms=self.algorithms, leeway=self.leeway,
+                            options={'require': ['exp', 'sub']})
+        if claims.get('type') != token_type:
+            raise jwt.InvalidTokenError(f"Expected a {token_type} token")
+        return claims
@@ -1,18 +1,40 @@
+import io
 import os
+from itertools import islice
 from flask import request, current_app, make_response, render_template
 from flask_restful import Resource
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadTimeSignature
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from marshmallow import ValidationError
-from werkzeug.security import check_password_hash
 from datetime import timedelta
-from flask_jwt_extended import jwt_required, create_access_token, get_jwt_identity, create_refresh_token
-
-from controls import send_email_smtp
-from serializers import UserRegistrationSchema
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+
+from cache import get_user_cache
+from denylist import get_denylist
+from hashing import HashingBusy, password_hasher
+from health import get_readiness_probe
+from importer import UserImport, read_rows
+from keys import KeyRing
+from metrics import exposition, metrics_enabled
+from outbox import enqueue_email, wake_dispatcher
+from permissions import admin_required
+from profiling import PROFILE_HEADER, get_profiling, span
+from replicas import replica_reads, use_primary
+from resend import get_resend_coalescer
+from serializers import load_registration
+from static_responses import get_static_responses
+from throttle import get_login_throttle, throttled_response
+from tokens import issue_access_token, issue_refresh_token, user_claims, claims_only_reads, token_versions, \
+    introspect_tokens, CLAIM_NAMES
 from models import Users, db
 from constants import HTML_CONFIRM, SUBJECT
 
+# served as the JWKS while no asymmetric keys are configured
+EMPTY_KEY_RING = KeyRing([])
+
 
 def generate_confirmation_token(email: str) -> str:
     """
@@ -24,20 +46,33 @@ def generate_confirmation_token(email: str) -> str:
     return s.dumps(email, salt='confirm_email')
 
 
-def send_confirmation_email(user_email: str) -> bool:
-    """Send a confirmation email to the user."""
-    # Extract the domain from the current request's URL.
-    domain = request.url_root
-    # generate token
-    token = generate_confirmation_token(user_email)
-    confirm_url = f"{domain}confirm-email/{token}"
-    # Assuming HTML_CONFIRM has a placeholder for `url`
-    html = HTML_CONFIRM.format(confirm_url)
+def hashing_busy_response():
+    """503 returned when the password hashing pool is saturated"""
+    return {'message': 'Service is busy, please try again shortly.'}, 503, {'Retry-After': '1'}
+
+
+def send_confirmation_email(user_email: str, token: str = None) -> str:
+    """
+    Queue a confirmation email to the user. The outbox row joins the current
+    db session, the caller commits it and the dispatcher sends it.
+    :param token: a still valid confirmation token to send again, a new one is generated by default
+    :return: the token sent, None if the email could not be queued
+    """
+    with span('email'):
+        # Extract the domain from the current request's URL.
+        domain = request.url_root
+        # generate token
+        token = token or generate_confirmation_token(user_email)
+        confirm_url = f"{domain}confirm-email/{token}"
+        # Assuming HTML_CONFIRM has a placeholder for `url`
+        html = HTML_CONFIRM.format(confirm_url)
 
-    if send_email_smtp(user_email, SUBJECT, html) == 200:
-        return True
-    else:
-        return False
+        try:
+            enqueue_email(user_email, SUBJECT, html)
+            return token
+        except Exception as err:
+            print(f"Failed to queue confirmation email: {err}")
+            return None
 
 
 class RegisterResource(Resource):
@@ -45,28 +80,28 @@ class RegisterResource(Resource):
 
     def post(self):
         # Data serialization
-        schema = UserRegistrationSchema()
         try:
-            data = schema.load(request.json)
+            data = load_registration(request.json)
         except ValidationError as err:
             return err.messages, 400
 
-        # Combine checks for existing email or username to reduce database hits
-        existing_user = Users.query.filter(
-            (Users.email == data['email']) | (Users.username == data['username'])
-        ).first()
-        if existing_user:
-            return {'message': 'Email or Username already exists'}, 400
-
         try:
-            # create instance users
-            user = Users(**data)
-            # write to db
-            db.session.add(user)
+            # one INSERT that skips duplicates, the unique indexes decide instead of a prior SELECT
+            user_id = Users.insert_unique(data['username'], data['email'], password_hasher.hash(data['password']))
+            if user_id is None:
+                db.session.rollback()
+                # conflict path only: find out which field is taken
+                errors = Users.taken_fields(data['username'], data['email'])
+                return {'message': 'Email or Username already exists', 'errors': errors}, 400
+
+            # the confirmation email is committed in the same transaction
+            email_queued = send_confirmation_email(data['email'])
             db.session.commit()
+            wake_dispatcher()
 
-            # send email confirmation
-            if send_confirmation_email(data['email']):
+            if email_queued:
+                # an immediate resend does not send a second email
+                get_resend_coalescer().remember_sent(data['email'], email_queued, reused=False)
                 return {'message': 'User created successfully. Email confirmation sent'}, 201
             else:
                 return {'message': 'User created successfully, but confirmation email could not be sent'}, 202
@@ -75,6 +110,10 @@ class RegisterResource(Resource):
             db.session.rollback()  # session rollback
             return {'message': 'A user with this email or username already exists.'}, 409  # 409 Conflict
 
+        except HashingBusy:
+            db.session.rollback()
+            return hashing_busy_response()
+
         except Exception as err:
             db.session.rollback()  # session rollback
             return {'message': f'An error occurred while creating new user: {err}'}, 500
@@ -83,20 +122,35 @@ class RegisterResource(Resource):
 class ResendConfirmationResource(Resource):
     """Handles resending the email confirmation."""
 
+    @replica_reads
     def post(self):
         email = request.json.get('email')
-        if not email:
+        if not email or not isinstance(email, str):
             return {'message': 'Email is required'}, 400
 
-        user = Users.query.filter_by(email=email).first()
-        if not user:
-            return {'message': 'User not found'}, 404
-
-        # send email confirmation
-        if send_confirmation_email(user.email):
-            return {'message': 'Email confirmation sent'}, 200
-        else:
-            return {'message': 'Failed to send email confirmation'}, 500
+        coalescer = get_resend_coalescer()
+        # retries for the same address wait for the first request and get its answer
+        with coalescer.single_flight(email):
+            recent = coalescer.recent(email)
+            if recent is not None:
+                return recent
+
+            user = get_user_cache().get_by_email(email)
+            if not user:
+                coalescer.remember_missing(email)
+                return {'message': 'User not found'}, 404
+
+            # send email confirmation, with the last token while it is still fresh
+            reusable = coalescer.reusable_token(user.email)
+            token = send_confirmation_email(user.email, reusable)
+            if token:
+                db.session.commit()
+                wake_dispatcher()
+                coalescer.remember_sent(user.email, token, reused=token == reusable)
+                return {'message': 'Email confirmation sent'}, 200
+            else:
+                db.session.rollback()
+                return {'message': 'Failed to send email confirmation'}, 500
 
 
 class ConfirmEmail(Resource):
@@ -115,7 +169,7 @@ class ConfirmEmail(Resource):
         except BadTimeSignature:
             return {'message': 'The confirmation link is invalid.'}, 400
 
-        user = Users.query.filter_by(email=email).first()
+        user = Users.find_by_email(email)
 
         if not user:
             return {'message': 'Invalid request.'}, 400
@@ -124,8 +178,10 @@ class ConfirmEmail(Resource):
             return {'message': 'Email already confirmed'}, 400
 
         # confirm user
+        user_id = user.user_id
         user.email_confirmed = True
         db.session.commit()
+        get_user_cache().invalidate(user_id, email)
 
         return {'message': 'Email confirmed'}, 200
 
@@ -133,6 +189,13 @@ class ConfirmEmail(Resource):
 class SignIn(Resource):
     """Handle in function """
 
+    @staticmethod
+    def password_hash(user) -> str:
+        """Current password hash of a user, read from the primary as cached records do not carry it"""
+        with use_primary():
+            return db.session.execute(select(Users.password).where(Users.id == user.id)).scalar()
+
+    @replica_reads
     def post(self, access_exp=timedelta(hours=1), refresh_exp=timedelta(days=30)):
         """
         Authenticate a user and issue JWT access and refresh tokens.
@@ -140,23 +203,58 @@ class SignIn(Resource):
         :param refresh_exp: specifies the expiration time for the refresh token.  Defaults to 30 days.
         :return:
         """
-        # get data
+        # get data, anything but strings is treated as missing
         email = request.json.get('email')
         password = request.json.get('password')
+        if not isinstance(email, str):
+            email = None
+        if not isinstance(password, str):
+            password = None
+
+        # locked out addresses and accounts are turned away before any lookup or hashing
+        throttle = get_login_throttle()
+        if throttle is not None:
+            seconds, scope = throttle.retry_after(request.remote_addr, email)
+            if seconds:
+                return throttled_response(seconds, scope)
+
+        # check user, served from the user cache
+        cache = get_user_cache()
+        user = cache.get_by_email(email) if email else None
+        if user and not user.email_confirmed:
+            # e.g. confirmed a moment ago by another process, or on the primary only
+            cache.invalidate(user.user_id, user.email)
+            with use_primary():
+                user = cache.get_by_email(email)
+        try:
+            # unconfirmed users are rejected without hashing
+            stored_hash = self.password_hash(user) if user and password and user.email_confirmed else None
+            if not stored_hash or not password_hasher.verify(stored_hash, password):
+                if throttle is not None:
+                    throttle.failure(request.remote_addr, email)
+                return {'message': 'Login unsuccessful.'}, 401
+
+            # upgrade hashes made with an older method or cost while we know the password
+            if password_hasher.needs_rehash(stored_hash):
+                # the row being written is read from the primary, a replica's copy may be gone there
+                with use_primary():
+                    row = db.session.get(Users, user.id, populate_existing=True)
+                    if row is not None:
+                        row.set_password(password)
+                        db.session.commit()
+        except HashingBusy:
+            db.session.rollback()
+            return hashing_busy_response()
 
-        # check user in database
-        user = Users.query.filter_by(email=email).first()
-        if not user or not check_password_hash(user.password, password) or not user.email_confirmed:
-            return {'message': 'Login unsuccessful.'}, 401
+        if throttle is not None:
+            throttle.success(request.remote_addr, email)
 
-        # Create a new token with the user id inside
-        access_token = create_access_token(identity=user.user_id, expires_delta=access_exp,
-                                           additional_claims={"email": user.email, "username": user.username,
-                                                              "id": user.user_id,
-                                                              })
+        # Create a new token with the user details inside
+        claims = user_claims(user)
+        access_token = issue_access_token(claims, access_exp)
 
         # Create a refresh token
-        refresh_token = create_refresh_token(identity=user.user_id, expires_delta=refresh_exp)
+        refresh_token = issue_refresh_token(claims, refresh_exp)
 
         return {
                    'user_id': user.user_id,
@@ -172,10 +270,22 @@ class SignIn(Resource):
 class ProtectedResource(Resource):
     """Protected Resource JWT"""
 
+    @replica_reads
     @jwt_required()  # Ensures that the request is authenticated
     def get(self):
+        if claims_only_reads():
+            # the token is verified and its version is current, so its claims are the user record
+            claims = get_jwt()
+            return {
+                       'user_id': claims['id'],
+                       'username': claims['username'],
+                       'email': claims['email'],
+                       'is_email_confirmed': claims.get('confirmed', True)
+
+                   }, 200
+
         user_id = get_jwt_identity()  # This should return the user_id
-        user = Users.query.filter_by(user_id=user_id).first()
+        user = get_user_cache().get_by_user_id(user_id)
 
         if not user:
             return {"message": "User not found"}, 404
@@ -193,25 +303,75 @@ class ProtectedResource(Resource):
 class TokenRefresh(Resource):
     """Handle refresh access tokens using a valid refresh token."""
 
+    @replica_reads
     @jwt_required(refresh=True)  # Ensures that the request is authenticated
     def post(self, access_exp=timedelta(hours=1)):
+        refresh_claims = get_jwt()
+        if claims_only_reads() and all(name in refresh_claims for name in CLAIM_NAMES):
+            # refresh tokens carry the same user claims, no need to load the user
+            claims = {name: refresh_claims[name] for name in CLAIM_NAMES}
+        else:
+            user = get_user_cache().get_by_user_id(get_jwt_identity())
+            if not user:
+                return {"message": "User not found"}, 404
+            claims = user_claims(user)
+
+        # Create a new token with the user details inside
+        new_token = issue_access_token(claims, access_exp)
+
+        return {'access_token': new_token}, 200
+
+
+class LogoutResource(Resource):
+    """Log out the presented access or refresh token, and the refresh token given in the body"""
+
+    @jwt_required(verify_type=False)
+    def post(self):
+        claims = get_jwt()
+        payloads = [claims]
+        refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+        if refresh_token:
+            try:
+                refresh_claims = decode_token(refresh_token)
+            except (PyJWTError, JWTExtendedException):
+                return {'message': 'Invalid refresh token'}, 400
+            if refresh_claims['sub'] != claims['sub'] or refresh_claims['type'] != 'refresh':
+                return {'message': 'Invalid refresh token'}, 400
+            payloads.append(refresh_claims)
+
+        get_denylist().revoke(payloads)
+        return {'message': 'Logged out'}, 200
+
+
+class LogoutAllResource(Resource):
+    """Log out every session of the user by bumping its token version"""
+
+    @jwt_required(verify_type=False)
+    def post(self):
         current_user_id = get_jwt_identity()
         user = Users.query.filter_by(user_id=current_user_id).first()
         if not user:
             return {"message": "User not found"}, 404
 
-        # Create a new token with the user details inside
-        new_token = create_access_token(
-            identity=user.user_id,
-            expires_delta=access_exp,
-            additional_claims={
-                "email": user.email,
-                "username": user.username,
-                "id": user.user_id,
-            }
-        )
+        token_versions.bump(user)
+        db.session.commit()
+        get_user_cache().invalidate(current_user_id, user.email)
+        token_versions.set(current_user_id, user.token_version)
+        return {'message': 'Logged out of all sessions'}, 200
 
-        return {'access_token': new_token}, 200
+
+class IntrospectResource(Resource):
+    """Verify a batch of tokens for the API gateway in a single call"""
+
+    def post(self):
+        tokens = (request.json or {}).get('tokens')
+        max_tokens = int(current_app.config.get('INTROSPECT_MAX_TOKENS', 50))
+        if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+            return {'message': 'tokens must be a list of strings'}, 400
+        if len(tokens) > max_tokens:
+            return {'message': f'At most {max_tokens} tokens can be introspected per request'}, 400
+
+        return {'results': introspect_tokens(tokens)}, 200
 
 
 class UserResource(Resource):
@@ -229,10 +389,10 @@ class UserResource(Resource):
         if not user:
             return {"message": "User not found"}, 404
 
-        schema = UserRegistrationSchema(partial=True)  # Allow partial updates
+        old_email = user.email
         try:
-            # Deserialize and validate the request data
-            data = schema.load(request.json)
+            # Deserialize and validate the request data, partial updates allowed
+            data = load_registration(request.json, partial=True)
 
             # Update user fields based on validated data
             if 'username' in data:
@@ -240,12 +400,26 @@ class UserResource(Resource):
             if 'email' in data:
                 user.email = data['email']
             if 'password' in data:
-                user.password = data['password']
+                user.set_password(data['password'])
 
+            # tokens issued before the change carry stale claims, revoke them
+            token_versions.bump(user)
             db.session.commit()
-            return {"message": "User updated successfully"}, 200
+            get_user_cache().invalidate(current_user_id, old_email, data.get('email'))
+            token_versions.set(user.user_id, user.token_version)
+
+            claims = user_claims(user)
+            return {"message": "User updated successfully",
+                    "access_token": issue_access_token(claims),
+                    "refresh_token": issue_refresh_token(claims)}, 200
         except ValidationError as err:
             return {"message": err.messages}, 400
+        except IntegrityError:
+            db.session.rollback()
+            return {"message": "A user with this email or username already exists."}, 409
+        except HashingBusy:
+            db.session.rollback()
+            return hashing_busy_response()
         except Exception as err:
             db.session.rollback()
             return {"message": f"An error occurred: {str(err)}"}, 500
@@ -261,14 +435,113 @@ class UserResource(Resource):
             return {"message": "User not found"}, 404
 
         try:
+            email = user.email
             db.session.delete(user)
             db.session.commit()
+            get_user_cache().invalidate(current_user_id, email)
+            token_versions.revoke(current_user_id)
             return {"message": "User deleted successfully"}, 200
         except Exception as e:
             db.session.rollback()
             return {"message": f"An error occurred while deleting the user: {str(e)}"}, 500
 
 
+class UserImportResource(Resource):
+    """
+    Import up to USER_IMPORT_MAX_ROWS users from a JSONL or CSV request body (admin only).
+    Hashes share the request pool and its backpressure, larger files go through `flask users import`.
+    """
+
+    @admin_required
+    def post(self):
+        fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+        if fmt not in ('jsonl', 'csv'):
+            return {'message': 'Unsupported import format, use jsonl or csv'}, 400
+        max_rows = int(current_app.config.get('USER_IMPORT_MAX_ROWS', 100))
+        # rows are counted before any is imported, so an oversized file is refused as a whole
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        rows = list(islice(read_rows(stream, fmt), max_rows + 1))
+        if len(rows) > max_rows:
+            return {'message': f'At most {max_rows} rows can be imported per request, '
+                               f'use the flask users import command for larger files'}, 413
+
+        job = UserImport(batch_size=request.args.get('batch_size', 1000, type=int),
+                         confirmed=request.args.get('confirmed', 'false').lower() == 'true', bulk=False)
+        try:
+            return job.run(rows), 200
+        except HashingBusy:
+            db.session.rollback()
+            message, status, headers = hashing_busy_response()
+            # rows of completed batches stay imported
+            return {**message, **job.report()}, status, headers
+        except Exception as err:
+            db.session.rollback()
+            # rows of completed batches stay imported
+            return {'message': f'Import stopped: {err}', **job.report()}, 500
+
+
+class JwksResource(Resource):
+    """Public JWT verification keys for other services"""
+
+    def get(self):
+        ring = current_app.extensions.get('jwt_keys') or EMPTY_KEY_RING
+        # encoded once per key ring
+        return get_static_responses().respond(
+            'jwks', lambda: current_app.json.dumps(ring.jwks()) + '\n', version=ring,
+            content_type='application/json', max_age=int(current_app.config.get('JWKS_MAX_AGE', 300)))
+
+
+class MetricsResource(Resource):
+    """Prometheus metrics of every worker"""
+
+    def get(self):
+        if not metrics_enabled(current_app):
+            return {'message': 'Metrics are disabled'}, 404
+        body, content_type = exposition()
+        return make_response(body, 200, {'Content-Type': content_type})
+
+
+class ProfileResource(Resource):
+    """Sampling profiler of this worker, admin only"""
+
+    @admin_required
+    def get(self):
+        """Samples so far as collapsed stacks, for flamegraph.pl or speedscope"""
+        return make_response(get_profiling().profiler.collapsed(), 200, {
+            'Content-Type': 'text/plain; charset=utf-8',
+            'Content-Disposition': 'attachment; filename=profile.collapsed'})
+
+    @admin_required
+    def post(self):
+        """Token for the X-Profile header, which profiles any request that carries it"""
+        profiling = get_profiling()
+        return {'header': PROFILE_HEADER, 'token': profiling.header_token(),
+                'expires_in': profiling.header_max_age}, 200
+
+    @admin_required
+    def delete(self):
+        return {'message': 'Profile samples cleared', 'samples': get_profiling().profiler.reset()}, 200
+
+
+class HealthResource(Resource):
+    """Liveness probe, answers as long as the process serves requests"""
+
+    def get(self):
+        return get_static_responses().respond('healthz', lambda: current_app.json.dumps({'status': 'ok'}) + '\n',
+                                              content_type='application/json', max_age=0)
+
+
+class ReadinessResource(Resource):
+    """Readiness probe with cached dependency checks"""
+
+    def get(self):
+        ready, checks = get_readiness_probe(current_app).status()
+        return {'status': 'ready' if ready else 'unavailable', 'checks': checks}, 200 if ready else 503
+
+
 class ApiDocumentationResource(Resource):
     def get(self):
-        return make_response(render_template('api_documentation.html'), 200, {'Content-Type': 'text/html'})
+        # jinja hands out a new template object once the file changed and templates auto reload
+        template = current_app.jinja_env.get_template('api_documentation.html')
+        return get_static_responses().respond('api_documentation', lambda: render_template(template),
+                                              version=template)
@@ -0,0 +1,8 @@
+"""
+WSGI entry point for Apache mod_wsgi on Elastic Beanstalk (WSGIPath: wsgi.py).
+mod_wsgi looks the callable up in the module dict, so the app is built at import
+and bound to `application` here; tests and the CLI use create_app instead.
+"""
+from application import get_application
+
+application = get_application()